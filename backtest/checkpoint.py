@@ -0,0 +1,125 @@
+"""
+参数优化断点续跑
+
+各策略文件 main() 里的网格循环按固定顺序遍历参数组合。SweepCheckpoint 记录已完成的组合、
+全部结果和当前的最佳年化 / 最佳夏普，每完成 every 个组合写一次磁盘（先写临时文件再替换，
+中途被杀不会留下半个文件）。重跑时已完成的组合直接跳过，最佳结果的比较顺序与不中断时相同，
+因此最终报告完全一致。
+
+断点和数据集绑定：dataset（交易对、周期、回看天数、数据截止时间）与断点里记录的不同时从头开始，
+不会把旧数据上的结果当成新结果。全部组合完成后 finish() 删除断点文件，下次运行重新开始。
+
+    dataset = sweep_dataset('output/turtle_checkpoint.json', symbol='BTCUSDT', intervals=intervals, lookback_days=300)
+    ckpt = SweepCheckpoint('output/turtle_checkpoint.json', every=10, dataset=dataset)
+    for interval, entry_p, ... in grid:
+        key = (interval, entry_p, ...)
+        if ckpt.done(key):
+            continue
+        ckpt.add(key, run_backtest_and_plot(...))
+    ckpt.finish()
+    best_result, best_sharpe_result = ckpt.best_result, ckpt.best_sharpe_result
+"""
+import datetime
+import json
+import os
+from pathlib import Path
+
+
+def sweep_dataset(path, end=None, **dataset):
+    """
+    断点的数据集标识：dataset 加上数据截止时间 end（'%Y-%m-%d %H:%M'）。
+    end 未指定时，path 里有除截止时间外都相同的未完成断点就沿用它的截止时间（同一份数据上续跑），
+    否则取当前时间。
+    """
+    if end is None:
+        state = SweepCheckpoint.load_state(path) or {}
+        previous = dict(state.get('dataset') or {})
+        end = previous.pop('end', None)
+        if previous != dataset or end is None:
+            end = datetime.datetime.now().strftime('%Y-%m-%d %H:%M')
+    return dict(dataset, end=end)
+
+
+class SweepCheckpoint(object):
+    def __init__(self, path, every=10, on_save=None, dataset=None):
+        self.path = Path(path)
+        self.every = every
+        self.on_save = on_save   # 每次写断点时一并调用，例如保存前 K 名的净值曲线
+        self.dataset = dataset   # 可 JSON 序列化的数据集标识
+        self.completed = {}   # 参数组合 -> 结果（回测失败时为 None），按完成顺序
+        self.best_annual = -float('inf')
+        self.best_result = None
+        self.best_sharpe = -float('inf')
+        self.best_sharpe_result = None
+        self._unsaved = 0
+
+        state = self.load_state(self.path)
+        if state is not None and state.get('dataset') != dataset:
+            print(f"⚠️ 断点对应的数据集 {state.get('dataset')} 与本次 {dataset} 不同，从头开始 ({self.path})")
+        elif state is not None:
+            self.completed = {key: result for key, result in state['completed']}
+            self.best_annual = state['best_annual']
+            self.best_result = state['best_result']
+            self.best_sharpe = state['best_sharpe']
+            self.best_sharpe_result = state['best_sharpe_result']
+            print(f"📂 从断点继续: 已完成 {len(self.completed)} 个参数组合 ({self.path})")
+
+    @staticmethod
+    def load_state(path):
+        """读取断点文件，不存在时返回 None（用于在建立断点前取出上次的数据集标识）"""
+        path = Path(path)
+        if not path.exists():
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    @staticmethod
+    def _key(params):
+        return json.dumps(list(params))
+
+    def done(self, params):
+        return self._key(params) in self.completed
+
+    @property
+    def all_results(self):
+        return [r for r in self.completed.values() if r]
+
+    def add(self, params, result):
+        """记录一个组合的结果，并按主循环原来的规则更新最佳年化 / 最佳夏普"""
+        self.completed[self._key(params)] = result
+        if result:
+            if result['annual'] is not None and result['annual'] > self.best_annual:
+                self.best_annual = result['annual']
+                self.best_result = result
+            if result['sharpe'] is not None and result['sharpe'] > self.best_sharpe:
+                self.best_sharpe = result['sharpe']
+                self.best_sharpe_result = result
+
+        self._unsaved += 1
+        if self._unsaved >= self.every:
+            self.save()
+
+    def save(self):
+        state = {
+            'dataset': self.dataset,
+            'completed': list(self.completed.items()),
+            'best_annual': self.best_annual,
+            'best_result': self.best_result,
+            'best_sharpe': self.best_sharpe,
+            'best_sharpe_result': self.best_sharpe_result,
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+        self._unsaved = 0
+        if self.on_save is not None:
+            self.on_save()
+
+    def finish(self):
+        """全部组合已完成：删除断点文件，之后的运行（例如换了更新的数据）从头开始"""
+        if self.on_save is not None:
+            self.on_save()
+        self.path.unlink(missing_ok=True)
+        self._unsaved = 0
@@ -0,0 +1,138 @@
+"""
+多机参数优化的任务队列
+
+队列是放在共享存储上的一个 SQLite 文件：优化入口把参数组合发布进去，
+各台机器上的 worker 领取任务、回测、把结果写回同一个文件。
+
+领取任务时写入租约到期时间，worker 在回测期间定时续约；
+worker 崩溃或断网后租约过期，任务会被重新放回待运行状态，由其他 worker 接手。
+
+SQLite 依赖文件锁，NFS 等网络文件系统需要开启锁支持（或使用 SMB / 本地共享盘）。
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    key TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    cost INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'pending',   -- pending / leased / done
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, cost);
+"""
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueue(object):
+    def __init__(self, path, timeout=60.0):
+        self.path = str(path)
+        # isolation_level=None：事务由下面的 BEGIN IMMEDIATE 显式控制
+        self.conn = sqlite3.connect(self.path, timeout=timeout, isolation_level=None)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _write(self, sql, args=()):
+        with self.conn:
+            return self.conn.execute(sql, args)
+
+    def publish(self, jobs, key):
+        """发布任务，key(job) 相同的任务只保留一份，返回新增的任务数"""
+        before = self.conn.total_changes
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO jobs (key, payload, cost) VALUES (?, ?, ?)',
+                [(key(job), json.dumps(job), job.get('cost', 0)) for job in jobs])
+            self.conn.execute('COMMIT')
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+        return self.conn.total_changes - before
+
+    def claim(self, worker, lease=600.0, max_attempts=3):
+        """
+        领取一个任务（耗时最长的优先），返回 (key, job)，没有可领取的任务时返回 None。
+        顺带把租约已过期的任务放回待运行状态；失败超过 max_attempts 次的任务不再分配。
+        """
+        now = time.time()
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            self.conn.execute("UPDATE jobs SET status = 'pending', worker = NULL "
+                              "WHERE status = 'leased' AND lease_until < ?", (now,))
+            row = self.conn.execute("SELECT key, payload FROM jobs WHERE status = 'pending' AND attempts < ? "
+                                    "ORDER BY cost DESC LIMIT 1", (max_attempts,)).fetchone()
+            if row is not None:
+                self.conn.execute("UPDATE jobs SET status = 'leased', worker = ?, lease_until = ?, "
+                                  "attempts = attempts + 1 WHERE key = ?", (worker, now + lease, row[0]))
+            self.conn.execute('COMMIT')
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+        return None if row is None else (row[0], json.loads(row[1]))
+
+    def renew(self, key, worker, lease=600.0):
+        """续约，任务已被其他 worker 接手时返回 False"""
+        cur = self._write("UPDATE jobs SET lease_until = ? WHERE key = ? AND status = 'leased' AND worker = ?",
+                          (time.time() + lease, key, worker))
+        return cur.rowcount == 1
+
+    def complete(self, key, result):
+        """写回结果。租约过期后任务可能已被重跑，先完成的结果为准"""
+        cur = self._write("UPDATE jobs SET status = 'done', result = ?, lease_until = NULL "
+                          "WHERE key = ? AND status != 'done'", (json.dumps(result), key))
+        return cur.rowcount == 1
+
+    def release(self, key, worker):
+        """worker 主动放弃任务（例如回测出错），放回待运行状态"""
+        self._write("UPDATE jobs SET status = 'pending', worker = NULL, lease_until = NULL "
+                    "WHERE key = ? AND status = 'leased' AND worker = ?", (key, worker))
+
+    def counts(self):
+        """各状态的任务数，例如 {'pending': 10, 'leased': 4, 'done': 86}"""
+        out = {'pending': 0, 'leased': 0, 'done': 0}
+        out.update(dict(self.conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status')))
+        return out
+
+    def results(self):
+        """所有已完成任务的结果"""
+        return [json.loads(r[0]) for r in self.conn.execute("SELECT result FROM jobs WHERE status = 'done'")]
+
+
+class LeaseKeeper(object):
+    """回测期间在后台线程里定时续约，with 块结束时停止"""
+
+    def __init__(self, queue_path, key, worker, lease=600.0):
+        self.queue_path, self.key, self.worker, self.lease = queue_path, key, worker, lease
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        # sqlite 连接不能跨线程共享，续约线程单独开一个
+        queue = JobQueue(self.queue_path)
+        try:
+            while not self._stop.wait(self.lease / 3):
+                queue.renew(self.key, self.worker, self.lease)
+        finally:
+            queue.close()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
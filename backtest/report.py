@@ -0,0 +1,180 @@
+"""
+参数优化的结果输出：结构化记录 + 单行进度 + 结束时的排名表
+
+几千组回测时逐组 print 一长串格式化文本，多进程下各行交错、没法解析，格式化和终端输出本身也有开销。
+这里换成：
+- RecordWriter：结果按 JSON Lines 缓冲写入（攒够 buffer 条或距上次落盘超过 flush_interval 秒才写），
+  进程池的结果都回到主进程由它一个写入，下游工具直接读文件，不需要从控制台输出里抠；
+- Progress：在一行里刷新完成数、速度、预计剩余时间和当前最佳（输出到 stderr，
+  不是终端时改为每 log_interval 秒打一行，日志文件里不会出现成千上万行）；
+- ranking_table()：结束时从记录生成排名表。
+
+    with RecordWriter('output/sweep_results.jsonl') as writer:
+        progress = Progress(total=len(jobs))
+        for record in results:
+            writer.write(record)
+            progress.update(record)
+        progress.close()
+    print(ranking_table(records, metric='sharpe', top=20))
+"""
+import json
+import sys
+import time
+import unicodedata
+from pathlib import Path
+
+from backtest.run_store import METRICS
+
+
+class RecordWriter(object):
+    def __init__(self, path, mode='w', buffer=200, flush_interval=2.0):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.buffer = buffer
+        self.flush_interval = flush_interval
+        self.count = 0
+        self._file = open(self.path, mode)
+        self._lines = []
+        self._flushed = time.monotonic()
+
+    def write(self, record):
+        self._lines.append(json.dumps(record))
+        self.count += 1
+        if len(self._lines) >= self.buffer or time.monotonic() - self._flushed >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._lines:
+            self._file.write('\n'.join(self._lines) + '\n')
+            self._lines = []
+        self._file.flush()
+        self._flushed = time.monotonic()
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+def _display_width(text):
+    """终端里的显示宽度：中文等全角字符占两格"""
+    return sum(2 if unicodedata.east_asian_width(ch) in ('W', 'F') else 1 for ch in text)
+
+
+class Progress(object):
+    """total 未知时（边下载边分发）只显示完成数和速度"""
+
+    def __init__(self, total=None, metric='sharpe', stream=None, refresh=0.2, log_interval=10.0):
+        self.total = total
+        self.metric = metric
+        self.stream = stream or sys.stderr
+        self.tty = self.stream.isatty()
+        self.refresh = refresh if self.tty else log_interval
+        self.done = 0
+        self.best = None
+        self.started = time.monotonic()
+        self._shown = 0.0
+        self._shown_done = 0
+        self._width = 0
+
+    def update(self, record=None, n=1):
+        self.done += n
+        value = record.get(self.metric) if record else None
+        if value is not None and (self.best is None or value > self.best):
+            self.best = value
+        now = time.monotonic()
+        if now - self._shown >= self.refresh or self.done == self.total:
+            self._show(now)
+
+    def line(self, now=None):
+        elapsed = (now or time.monotonic()) - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        parts = [f"⏳ {self.done}/{self.total}" if self.total else f"⏳ {self.done}"]
+        if self.total:
+            parts[0] += f" ({self.done / self.total:.1%})"
+        parts.append(f"{rate:.1f} 个/s")
+        parts.append(f"已用 {format_duration(elapsed)}")
+        if self.total and rate > 0 and self.done < self.total:
+            parts.append(f"剩余约 {format_duration((self.total - self.done) / rate)}")
+        if self.best is not None:
+            parts.append(f"最佳 {self.metric} {self.best:.3f}")
+        return ' | '.join(parts)
+
+    def _show(self, now):
+        self._shown, self._shown_done = now, self.done
+        text = self.line(now)
+        if self.tty:
+            # 新的一行比上一行短时用空格盖掉残留的字符
+            self.stream.write('\r' + text + ' ' * (self._width - _display_width(text)))
+            self._width = _display_width(text)
+        else:
+            self.stream.write(text + '\n')
+        self.stream.flush()
+
+    def close(self):
+        if self.done != self._shown_done:
+            self._show(time.monotonic())
+        if self.tty and self._width:
+            self.stream.write('\n')
+            self.stream.flush()
+
+
+def _params(record):
+    """strategy.py 的记录参数在 params 字段里；各策略文件的结果字典参数和指标平铺在一起"""
+    if isinstance(record.get('params'), dict):
+        return record['params']
+    return {k: v for k, v in record.items() if k not in METRICS and k not in ('name', 'interval', 'key', 'resample')}
+
+
+def _pct(value):
+    return f"{value * 100:.2f}" if value is not None else "N/A"
+
+
+def _num(value, digits=2):
+    return f"{value:.{digits}f}" if value is not None else "N/A"
+
+
+def _pad(text, width, left):
+    fill = ' ' * (width - _display_width(text))
+    return text + fill if left else fill + text
+
+
+def ranking_table(records, metric='sharpe', top=20):
+    """按 metric 从高到低排出前 top 条（指标为空的排在最后），返回表格文本"""
+    ranked = sorted(records, key=lambda r: (r.get(metric) is not None, r.get(metric) or 0), reverse=True)[:top]
+    if not ranked:
+        return ''
+    rows = []
+    for i, record in enumerate(ranked, 1):
+        interval = '+'.join([record.get('interval', '')] + record.get('resample', []))
+        params = ', '.join(f'{k}={v}' for k, v in _params(record).items())
+        rows.append((str(i), record.get('name', ''), interval, params, _num(record.get('sharpe')),
+                     _pct(record.get('annual')), _pct(record.get('return')), _num(record.get('maxdd')),
+                     str(record.get('trades', ''))))
+    header = ('#', '策略', '周期', '参数', '夏普', '年化%', '总收益%', '最大回撤%', '交易')
+    left = {1, 2, 3}
+    table = [header] + rows
+    if not any(row[1] for row in rows):
+        # 单个策略文件的结果没有策略名，去掉这一列
+        table = [row[:1] + row[2:] for row in table]
+        left = {1, 2}
+    widths = [max(_display_width(row[i]) for row in table) for i in range(len(table[0]))]
+    lines = [f"🏁 按 {metric} 排名前 {len(ranked)}（共 {len(records)} 组）:"]
+    for row in table:
+        lines.append('  '.join(_pad(cell, w, i in left) for i, (cell, w) in enumerate(zip(row, widths))))
+    return '\n'.join(lines)
@@ -0,0 +1,182 @@
+"""
+回测过程数据的紧凑存储：净值曲线和成交记录
+
+RunRecorder 分析器在回测时逐根记录收盘价和账户净值（float32）以及每笔成交（时间为 int64 毫秒），
+TopKRunStore 只保留按年化 / 夏普排名前 K 的回测，压缩写入一个 npz 文件。
+参数优化结束后画最佳参数的图、热力图和报告都从结果和这个文件生成，不需要再跑一遍回测。
+
+    runs = TopKRunStore('output/turtle_runs.npz', k=5)
+    result = run_backtest_and_plot(..., runs=runs)   # 内部: runs.offer(result, recorder 的数组)
+    runs.save()
+    plot_run(best_result, runs.find(best_result, ('interval', 'entry', 'exit', 'atr')), 'output/turtle_best.png')
+"""
+import datetime
+import json
+from pathlib import Path
+
+import backtrader as bt
+import numpy as np
+
+EPOCH_NUM = bt.date2num(datetime.datetime(1970, 1, 1))
+
+
+# 结果字典里的指标字段，其余为参数
+METRICS = ('sharpe', 'return', 'maxdd', 'annual', 'average', 'trades', 'win_rate', 'final_value',
+           'wall_time', 'cpu_time', 'bars', 'bars_per_sec', 'peak_rss_delta_mb',
+           'pass_wall_time', 'pass_cpu_time', 'pass_peak_rss_delta_mb', 'pass_size')
+
+
+def num2ms(values):
+    """backtrader 的浮点日期转为毫秒时间戳"""
+    return np.rint((np.asarray(values, dtype=float) - EPOCH_NUM) * 86_400_000).astype(np.int64)
+
+
+class RunRecorder(bt.Analyzer):
+    """逐根记录收盘价、账户净值，以及每笔成交的时间、方向、价格、数量和手续费"""
+
+    def start(self):
+        self._time, self._close, self._value = [], [], []
+        self._orders = []
+
+    def prenext(self):
+        self.next()
+
+    def next(self):
+        self._time.append(self.data.datetime[0])
+        self._close.append(self.data.close[0])
+        self._value.append(self.strategy.broker.getvalue())
+
+    def notify_order(self, order):
+        if order.status == order.Completed:
+            ex = order.executed
+            self._orders.append((ex.dt, 1 if order.isbuy() else -1, ex.price, ex.size, ex.comm))
+
+    def get_analysis(self):
+        orders = np.array(self._orders, dtype=float).reshape(-1, 5)
+        return {
+            'time': num2ms(self._time),
+            'close': np.array(self._close, dtype=np.float32),
+            'value': np.array(self._value, dtype=np.float32),
+            'order_time': num2ms(orders[:, 0]),
+            'order_side': orders[:, 1].astype(np.int8),
+            'order_price': orders[:, 2].astype(np.float32),
+            'order_size': orders[:, 3].astype(np.float32),
+            'order_comm': orders[:, 4].astype(np.float32),
+        }
+
+
+def _score(record, metric):
+    value = record.get(metric)
+    return -float('inf') if value is None else value
+
+
+class TopKRunStore(object):
+    """保留每个指标排名前 k 的回测的过程数据（各指标的前 k 取并集）"""
+
+    def __init__(self, path, k=5, metrics=('annual', 'sharpe')):
+        self.path = Path(path)
+        self.k = k
+        self.metrics = metrics
+        self.runs = []   # [(结果字典, 数组字典)]
+
+    def offer(self, record, arrays):
+        self.runs.append((record, arrays))
+        keep = set()
+        for metric in self.metrics:
+            ranked = sorted(range(len(self.runs)), key=lambda i: _score(self.runs[i][0], metric), reverse=True)
+            keep.update(ranked[:self.k])
+        self.runs = [run for i, run in enumerate(self.runs) if i in keep]
+
+    def find(self, record, keys):
+        """按 keys 指定的参数字段找回某次回测的数组，不在前 k 中时返回 None"""
+        for stored, arrays in self.runs:
+            if all(stored.get(key) == record[key] for key in keys):
+                return arrays
+        return None
+
+    def save(self):
+        columns = {}
+        for i, (_, arrays) in enumerate(self.runs):
+            for name, values in arrays.items():
+                columns[f'{i}_{name}'] = values
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(self.path, meta=json.dumps([record for record, _ in self.runs]), **columns)
+
+    @classmethod
+    def load(cls, path, k=5, metrics=('annual', 'sharpe')):
+        store = cls(path, k, metrics)
+        with np.load(path) as f:
+            records = json.loads(str(f['meta']))
+            for i, record in enumerate(records):
+                prefix = f'{i}_'
+                arrays = {name[len(prefix):]: f[name] for name in f.files if name.startswith(prefix)}
+                store.runs.append((record, arrays))
+        return store
+
+
+def plot_run(record, arrays, path, title=None, keys=None):
+    """价格与买卖点、账户净值、回撤三联图，直接用存储的数组绘制；keys 为标题里显示的参数字段"""
+    import matplotlib.pyplot as plt
+
+    time = arrays['time'].astype('datetime64[ms]')
+    value = arrays['value'].astype(float)
+    drawdown = 100.0 * (1 - value / np.maximum.accumulate(value))
+    order_time = arrays['order_time'].astype('datetime64[ms]')
+    buy = arrays['order_side'] > 0
+
+    fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(18, 9), dpi=120, sharex=True,
+                                        gridspec_kw={'height_ratios': [3, 2, 1]})
+    ax1.plot(time, arrays['close'], color='gray', linewidth=0.8, label='close')
+    ax1.scatter(order_time[buy], arrays['order_price'][buy], marker='^', color='green', s=30, label='buy')
+    ax1.scatter(order_time[~buy], arrays['order_price'][~buy], marker='v', color='red', s=30, label='sell')
+    ax1.legend(loc='upper left')
+    ax1.grid(True)
+    ax2.plot(time, value, color='tab:blue', label='value')
+    ax2.legend(loc='upper left')
+    ax2.grid(True)
+    ax3.fill_between(time, -drawdown, 0, color='tab:red', alpha=0.4)
+    ax3.set_ylabel('drawdown %')
+    ax3.grid(True)
+    keys = keys or [k for k in record if k not in METRICS]
+    fig.suptitle(title or ', '.join(f'{k}={record[k]}' for k in keys))
+    fig.tight_layout()
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    fig.savefig(path)
+    plt.close(fig)
+    return path
+
+
+def plot_stored(runs, record, keys, path, rerun=None):
+    """
+    从 runs 中取出 record 对应的过程数据画图。不在 runs 中（例如断点续跑之前完成的组合）时
+    调用 rerun() 补跑一次，rerun 需要把结果 offer 到 runs。
+    """
+    arrays = runs.find(record, keys)
+    if arrays is None and rerun is not None:
+        rerun()
+        arrays = runs.find(record, keys)
+    print(f"🖼️ 图表已保存到 {path}")
+    return plot_run(record, arrays, path, keys=keys)
+
+
+def plot_heatmap(results, index, columns, value, path, title=None):
+    """参数网格热力图，results 为各组参数的结果字典列表，不需要过程数据"""
+    import matplotlib.pyplot as plt
+    import pandas as pd
+    import seaborn as sns
+
+    df = pd.DataFrame([r for r in results if r.get(value) is not None])
+    if df.empty:
+        return None
+    print(f"🖼️ 热力图已保存到 {path}")
+    table = df.pivot_table(index=index, columns=columns, values=value, aggfunc='max')
+    fig, ax = plt.subplots(figsize=(12, 8), dpi=120)
+    sns.heatmap(table, annot=True, fmt='.2f', cmap='RdYlGn', ax=ax)
+    ax.set_title(title or f'{value} ({index} x {columns})')
+    fig.tight_layout()
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    fig.savefig(path)
+    plt.close(fig)
+    return path
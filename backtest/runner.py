@@ -0,0 +1,224 @@
+"""
+通用回测执行：给定策略类、K线 DataFrame 和一组参数跑一次 Cerebro，
+返回与各策略 run_backtest_and_plot 同口径的结果字典，供统一的参数优化入口调用。
+run_many() 把多个策略挂在同一份数据、同一次K线循环上，每个策略用独立的 broker 和分析器。
+"""
+import importlib
+import resource
+import sys
+import time
+
+import backtrader as bt
+import pandas as pd
+
+from data.feeds import bar_timeframe, resample_timeframe
+from data.kline_store import INTERVAL_MS
+
+
+# backtrader 数据接口（与各策略文件中的 PandasData 相同）
+class PandasData(bt.feeds.PandasData):
+    params = (
+        ('datetime', None),
+        ('open', 'open'),
+        ('high', 'high'),
+        ('low', 'low'),
+        ('close', 'close'),
+        ('volume', 'volume'),
+        ('openinterest', -1),
+    )
+
+
+class PruneHistory(bt.Analyzer):
+    """
+    exactbars 模式下定期丢掉已结束的订单和已平仓的交易。
+    backtrader 默认会保留全部订单历史，保证金不足被拒的订单很多时，
+    内存会随K线数增长；清理后内存只和当前挂单、持仓有关。
+    """
+    params = (('every', 1000),)
+
+    def start(self):
+        self._count = 0
+
+    def next(self):
+        self._count += 1
+        if self._count % self.p.every:
+            return
+        strat = self.strategy
+        strat._orders = [o for o in strat._orders if o.alive()]
+        strat.broker.orders = [o for o in strat.broker.orders if o.alive()]
+        for trades in strat._trades.values():
+            for tradeid, history in trades.items():
+                trades[tradeid] = [t for t in history if not t.isclosed]
+
+
+def peak_rss_mb():
+    """进程的峰值常驻内存（MB），Linux 上 ru_maxrss 单位为 KB，macOS 上为字节"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == 'darwin' else rss / 1024
+
+
+def load_strategy(path):
+    """按 'strategies.TurtleStrategy.TurtleATRStrategy' 这样的路径加载策略类"""
+    module_name, _, class_name = path.rpartition('.')
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+class IsolatedBrokers(bt.broker.BrokerBase):
+    """
+    一次回测里挂多个策略时作为 Cerebro 的 broker：每个策略各有一个 BackBroker
+    （现金、持仓、挂单、手续费互不影响），这里只负责逐个推进并转发订单通知。
+    """
+
+    def start(self):
+        super(IsolatedBrokers, self).start()
+        self.brokers = []
+
+    def stop(self):
+        for broker in self.brokers:
+            broker.stop()
+
+    def child(self, cash, commission):
+        """为一个策略创建独立的 broker；Cerebro 先启动 broker 再实例化策略，这里直接 start()"""
+        broker = bt.brokers.BackBroker()
+        broker.cerebro = self.cerebro
+        broker.setcash(cash)
+        broker.setcommission(commission=commission)
+        broker.start()
+        self.brokers.append(broker)
+        return broker
+
+    def next(self):
+        for broker in self.brokers:
+            broker.next()
+
+    def get_notification(self):
+        for broker in self.brokers:
+            order = broker.get_notification()
+            if order is not None:
+                return order
+        return None
+
+    def getcash(self):
+        return sum(broker.getcash() for broker in self.brokers)
+
+    def getvalue(self, datas=None):
+        return sum(broker.getvalue(datas) for broker in self.brokers)
+
+
+def isolated(strategy_cls, cash, commission):
+    """
+    生成策略子类：在原 __init__ 之前换上自己的 broker。
+    buy / sell、getposition、sizer 和分析器（都通过 self.strategy.broker）随之只看到这个策略的账户。
+    """
+
+    class Isolated(strategy_cls):
+        def __init__(self):
+            self.broker = self.env.broker.child(cash, commission)
+            super(Isolated, self).__init__()
+
+    Isolated.__name__ = strategy_cls.__name__
+    return Isolated
+
+
+def _feed(data, interval, resample):
+    if isinstance(data, bt.AbstractDataBase):
+        return data
+    kwargs = bar_timeframe(interval) if interval in INTERVAL_MS else {}
+    if resample:
+        # 按收盘时间标记，合成K线才会在最后一根基础K线收盘时结束
+        data = data.set_axis(data.index + pd.Timedelta(milliseconds=INTERVAL_MS[interval]))
+    return PandasData(dataname=data, **kwargs)
+
+
+def _add_analyzers(cerebro, exactbars):
+    cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name='sharpe')
+    cerebro.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
+    # 收益率固定按天统计和年化；不指定时跟随数据周期，分钟数据的 rnorm 不会年化
+    cerebro.addanalyzer(bt.analyzers.Returns, _name='returns', timeframe=bt.TimeFrame.Days, compression=1)
+    cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name='trade')
+    if exactbars:
+        cerebro.addanalyzer(PruneHistory)
+
+
+def _record(strat, params, wall, cpu, rss):
+    bars = len(strat.data)
+    returns = strat.analyzers.returns.get_analysis()
+    # 策略自己统计了交易次数就用策略的口径，否则取已平仓交易数
+    trades = getattr(strat, 'trade_count', None)
+    if trades is None:
+        trades = strat.analyzers.trade.get_analysis().get('total', {}).get('closed', 0)
+
+    record = dict(params)
+    record.update({
+        'sharpe': strat.analyzers.sharpe.get_analysis().get('sharperatio', None),
+        'return': returns.get('rtot', None),
+        'maxdd': strat.analyzers.drawdown.get_analysis().get('max', {}).get('drawdown', None),
+        'annual': returns.get('rnorm', None),
+        'average': returns.get('ravg', None),
+        'trades': trades,
+        'wall_time': wall,
+        'cpu_time': cpu,
+        'bars': bars,
+        'bars_per_sec': bars / wall if wall else None,
+        'peak_rss_delta_mb': rss,
+    })
+    return record
+
+
+def run_backtest(strategy_cls, data, params, cash=10000.0, commission=0.0008, exactbars=False,
+                 interval=None, resample=()):
+    """
+    data 可以是 DataFrame，也可以是已经构建好的 backtrader 数据源（如 KlineStoreData）。
+    exactbars 与 cerebro.run 的同名参数一致，为 1 时各条线只保留指标所需的最少K线。
+    resample 为由 interval 周期在引擎内合成的更大周期（如 ['4h']），策略里依次是 self.datas[1:]。
+    传入数据源且需要合成时，数据源要按收盘时间标记（KlineStoreData(..., stamp='close')）。
+    """
+    data = _feed(data, interval, resample)
+    cerebro = bt.Cerebro(stdstats=False, exactbars=exactbars)
+    cerebro.broker.setcash(cash)
+    cerebro.broker.setcommission(commission=commission)
+    cerebro.adddata(data)
+    for target in resample:
+        cerebro.resampledata(data, **resample_timeframe(target, interval))
+    cerebro.addstrategy(strategy_cls, **params)
+    _add_analyzers(cerebro, exactbars)
+
+    # 资源开销：墙钟时间、CPU 时间、峰值内存增量（同一进程里峰值只增不减，之前更高时增量为 0）
+    wall, cpu, rss = time.perf_counter(), time.process_time(), peak_rss_mb()
+    strat = cerebro.run()[0]
+    wall, cpu, rss = time.perf_counter() - wall, time.process_time() - cpu, peak_rss_mb() - rss
+    return _record(strat, params, wall, cpu, rss)
+
+
+def run_many(entries, data, exactbars=False, interval=None, resample=()):
+    """
+    多个策略（不同的类、不同的参数）共用一份数据源、一次K线循环：
+    数据只解析和推进一次，每个策略有自己的 broker 和分析器，结果与逐个 run_backtest 相同。
+
+    entries 为 [(strategy_cls, params, cash, commission), ...]，资金和手续费设置在各自的 broker 上，
+    按顺序返回结果字典。
+    一趟里的策略共用同一个K线循环，单个策略的开销测不出来：wall_time、cpu_time、bars_per_sec、
+    peak_rss_delta_mb 为 None，整趟的开销记在 pass_wall_time、pass_cpu_time、pass_peak_rss_delta_mb，
+    pass_size 为这一趟挂的策略数（同一趟的结果里这几项相同）。
+    同一趟里的策略看到同样的 datas，需要合成不同周期（resample）的策略要分开跑。
+    """
+    data = _feed(data, interval, resample)
+    cerebro = bt.Cerebro(stdstats=False, exactbars=exactbars)
+    cerebro.broker = IsolatedBrokers()
+    cerebro.adddata(data)
+    for target in resample:
+        cerebro.resampledata(data, **resample_timeframe(target, interval))
+    for strategy_cls, params, cash, commission in entries:
+        cerebro.addstrategy(isolated(strategy_cls, cash, commission), **params)
+    _add_analyzers(cerebro, exactbars)
+
+    wall, cpu, rss = time.perf_counter(), time.process_time(), peak_rss_mb()
+    strats = cerebro.run()
+    wall, cpu, rss = time.perf_counter() - wall, time.process_time() - cpu, peak_rss_mb() - rss
+    records = []
+    for strat, (_, params, _, _) in zip(strats, entries):
+        record = _record(strat, params, None, None, None)
+        record.update({'pass_wall_time': wall, 'pass_cpu_time': cpu,
+                       'pass_peak_rss_delta_mb': rss, 'pass_size': len(strats)})
+        records.append(record)
+    return records
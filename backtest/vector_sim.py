@@ -0,0 +1,739 @@
+"""
+参数轴向量化回测
+
+海龟（分批加仓、2ATR止损）和马丁格尔（倍数加仓、均价入场）都是路径依赖的策略，
+没法用"先算信号数组再整体相乘"的办法向量化。这里换一个方向：时间上只循环一次，
+持仓、现金、加仓层级等状态都是 NumPy 数组，每个参数组合占一个槽位，
+整个参数网格逐根K线一起推进。
+
+撮合和手续费与 backtrader 默认 BackBroker 的语义逐步对应：
+- next() 中下的市价单在下一根K线的开盘价成交
+- 提交时先用下单时的收盘价预执行检查资金（check_submitted），
+  成交时再用开盘价检查一次，资金不足都按 Margin 拒单
+- 手续费 = |size| * commission * price
+- 分析器口径与 SharpeRatio / DrawDown / Returns 默认参数一致
+
+所有状态（持仓、现金、挂单、策略字段、指标续算所需的尾部K线和递推值、分析器累计量）
+都在模拟器对象上，可以 save() 成快照，之后 load() 回来用 feed() 只推进新追加的K线，
+结果与从头完整重跑逐位一致：
+
+    sim = TurtleGridSimulator([params])
+    sim.feed(df)                 # 第一次：完整历史
+    sim.save('output/turtle.snap')
+    ...
+    sim = GridSimulator.load('output/turtle.snap')
+    sim.feed(new_bars)           # 之后每天只处理新K线
+    sim.results()
+
+多年的 1m 数据不必整段读进内存：feed_chunks() 逐块推进仓库里的K线，峰值内存只取决于块大小：
+
+    sim.feed_chunks(store.iter_chunks('BTCUSDT', '1m', chunksize=200_000))
+
+用法（在项目根目录）：
+    python -m backtest.vector_sim data/BTCUSDT_1h_300d_2025-06-14-19:33.csv
+会用 Cerebro 逐组回测做差分校验，并校验快照续跑、分块推进与完整回测一致。
+同样的校验在合成数据上由 tests/test_vector_sim.py 自动运行（python -m pytest）。
+"""
+import itertools
+import math
+import os
+import pickle
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from backtrader.mathsupport import average, standarddev
+
+
+# 展开参数网格，顺序与 main() 里嵌套 for 循环一致
+def param_grid(**ranges):
+    keys = list(ranges)
+    return [dict(zip(keys, values)) for values in itertools.product(*ranges.values())]
+
+
+# 与 bt.ind.Highest / Lowest 一致：前 period-1 根为 NaN
+def rolling_max(values, period):
+    out = np.full(len(values), np.nan)
+    if len(values) >= period:
+        out[period - 1:] = np.lib.stride_tricks.sliding_window_view(values, period).max(axis=1)
+    return out
+
+
+def rolling_min(values, period):
+    out = np.full(len(values), np.nan)
+    if len(values) >= period:
+        out[period - 1:] = np.lib.stride_tricks.sliding_window_view(values, period).min(axis=1)
+    return out
+
+
+# 与 bt.ind.SMA 一致：窗口内 math.fsum / period
+def sma(values, period):
+    out = np.full(len(values), np.nan)
+    for i in range(period - 1, len(values)):
+        out[i] = math.fsum(values[i - period + 1:i + 1]) / period
+    return out
+
+
+# 与 bt.ind.ATR 一致：TR 从第2根开始，SMA 做种子，之后按 1/period 平滑
+# 续跑时前 start 根是上次处理过的尾部K线，seed 为其中最后一根的 ATR，从它继续递推
+def atr(high, low, close, period, start=0, seed=np.nan):
+    n = len(close)
+    tr = np.full(n, np.nan)
+    tr[1:] = np.maximum(high[1:], close[:-1]) - np.minimum(low[1:], close[:-1])
+    out = np.full(n, np.nan)
+    alpha = 1.0 / period
+    alpha1 = 1.0 - alpha
+    if start and not np.isnan(seed):
+        prev = out[start - 1] = seed
+        first = start
+    else:
+        # 还没算出过 ATR 时尾部K线就是全部历史，从头计算
+        if n <= period:
+            return out
+        prev = out[period] = math.fsum(tr[1:period + 1]) / period
+        first = period + 1
+    for i in range(first, n):
+        out[i] = prev = prev * alpha1 + tr[i] * alpha
+    return out
+
+
+class GridSimulator(object):
+    """
+    参数网格模拟器基类：负责挂单撮合、资金持仓和分析器累计，
+    子类只需要实现参数和策略状态初始化 _setup()、指标计算 _prepare() 和逐根决策 _next()
+    """
+    # 每根K线每个参数组合最多同时存在的挂单数（海龟同一根K线可能先加仓再平仓）
+    max_orders = 2
+    # 每次 feed() 按整段K线重算的指标数组，不写入快照
+    transient = ()
+
+    def __init__(self, params_list, cash=10000.0, commission=0.0008):
+        self.params_list = list(params_list)
+        self.startcash = cash
+        self.commission = commission
+        self.reset()
+
+    # ---- 子类接口 ----
+    def _setup(self):
+        """参数列、策略状态数组、minperiod，以及指标续算需要保留的尾部K线数 lookback"""
+        raise NotImplementedError
+
+    def _prepare(self, o, h, l, c, start):
+        """在 尾部K线 + 新K线 上计算指标，前 start 根是上次已处理过的K线"""
+        raise NotImplementedError
+
+    def _carry(self):
+        """feed() 结束时保存指标递推需要的最后状态（如 ATR 的上一个值）"""
+        pass
+
+    def _next(self, i, active, close, value):
+        raise NotImplementedError
+
+    def _notify_fill(self, rows, isbuy, price):
+        pass
+
+    def _record(self, k):
+        return {}
+
+    # ---- 下单 ----
+    def _submit(self, mask, size, close):
+        # 按下单顺序放入空闲槽位，size > 0 买入，size < 0 卖出
+        for j in range(self.max_orders):
+            free = mask & ~self.ord_on[:, j]
+            self.ord_on[free, j] = True
+            self.ord_size[free, j] = size[free]
+            self.ord_price[free, j] = close
+            mask = mask & ~free
+            if not mask.any():
+                return
+        raise RuntimeError('同一根K线下单次数超过 max_orders')
+
+    # ---- 撮合 ----
+    def _broker_next(self, popen):
+        if not self.ord_on.any():
+            return
+        comm = self.commission
+
+        # 提交检查：用下单时收盘价预执行，现金在同一根K线的多个订单间累计
+        pcash = self.cash.copy()
+        ppos = self.pos.copy()
+        accepted = np.zeros_like(self.ord_on)
+        for j in range(self.max_orders):
+            on = self.ord_on[:, j]
+            if not on.any():
+                continue
+            size = self.ord_size[:, j]
+            cp = self.ord_price[:, j]
+            buy = on & (size > 0)
+            sell = on & (size < 0)
+            if buy.any():
+                s = size[buy]
+                ppos[buy] += s
+                pcash[buy] = pcash[buy] - s * cp[buy]
+                pcash[buy] = pcash[buy] - s * comm * cp[buy]
+            if sell.any():
+                s = -size[sell]
+                ppos[sell] -= s
+                pcash[sell] = pcash[sell] + s * cp[sell]
+                pcash[sell] = pcash[sell] - s * comm * cp[sell]
+            accepted[:, j] = on & (pcash >= 0.0)
+
+        # 开盘价成交，资金不足则拒单
+        for j in range(self.max_orders):
+            on = accepted[:, j]
+            if not on.any():
+                continue
+            size = self.ord_size[:, j]
+            buy = on & (size > 0)
+            sell = on & (size < 0)
+            if buy.any():
+                s = size[buy]
+                c = self.cash[buy] - s * popen
+                c = c - s * comm * popen
+                ok = c >= 0.0
+                rows = np.flatnonzero(buy)[ok]
+                s = s[ok]
+                self.cash[rows] = c[ok]
+                oldpos = self.pos[rows]
+                newpos = oldpos + s
+                self.pos_price[rows] = np.where(
+                    oldpos == 0, popen, (self.pos_price[rows] * oldpos + s * popen) / newpos)
+                self.pos[rows] = newpos
+                if len(rows):
+                    self._notify_fill(rows, True, popen)
+            if sell.any():
+                rows = np.flatnonzero(sell)
+                s = -size[rows]
+                price = self.pos_price[rows]
+                pnl = s * (popen - price) * 1.0
+                c = self.cash[rows] + (s * price + pnl)
+                self.cash[rows] = c - s * comm * popen
+                newpos = self.pos[rows] - s
+                self.pos[rows] = newpos
+                self.pos_price[rows] = np.where(newpos == 0, 0.0, price)
+                self._notify_fill(rows, False, popen)
+
+        self.ord_on[:] = False
+
+    # 与 BackBroker._get_value 的浮点运算顺序一致
+    def _value(self, close):
+        dvalue = self.pos * close
+        unrealized = self.pos * (close - self.pos_price)
+        lever = np.where(dvalue > 0, (0.0 + (dvalue - unrealized) / 1.0) + unrealized, 0.0 + dvalue)
+        return self.cash + lever
+
+    def reset(self):
+        K = len(self.params_list)
+        self.cash = np.full(K, float(self.startcash))
+        self.pos = np.zeros(K)
+        self.pos_price = np.zeros(K)
+        self.ord_on = np.zeros((K, self.max_orders), dtype=bool)
+        self.ord_size = np.zeros((K, self.max_orders))
+        self.ord_price = np.zeros((K, self.max_orders))
+        self.trade_count = np.zeros(K, dtype=int)
+        self.minperiod = np.ones(K, dtype=int)
+        self.lookback = 1
+        self._setup()
+
+        # 已处理的K线数、最后一根的时间，以及续算指标用的尾部K线
+        self.nbars = 0
+        self.last_time = None
+        self.tail = {k: np.empty(0) for k in 'ohlc'}
+        # 分析器累计量：DrawDown 的峰值和最大回撤，SharpeRatio 用的各年末净值，
+        # Returns 用的自然日数
+        self.peak = np.full(K, -np.inf)
+        self.maxdd = np.zeros(K)
+        self.year_values = []
+        self.year = None
+        self.days = 0
+        self.last_day = None
+        self.value = self.cash.copy()
+
+    def feed(self, df):
+        """按时间顺序推进新的K线，不晚于已处理最后一根的行会被丢弃，返回实际处理的根数"""
+        open_time = pd.DatetimeIndex(df.index).values.astype('datetime64[ms]').astype(np.int64)
+        return self.feed_arrays(open_time, df['open'].to_numpy(dtype=float), df['high'].to_numpy(dtype=float),
+                                df['low'].to_numpy(dtype=float), df['close'].to_numpy(dtype=float))
+
+    def feed_chunks(self, chunks):
+        """
+        逐块推进 KlineStore.iter_chunks 返回的K线块，返回处理的总根数。
+        指标续算的尾部K线、递推值和持仓状态都在对象上跨块延续，结果与整段一次 feed() 逐位一致；
+        内存只与块大小有关，与历史长度无关。
+        """
+        return sum(self.feed_arrays(chunk['open_time'], chunk['open'], chunk['high'], chunk['low'], chunk['close'])
+                   for chunk in chunks)
+
+    def feed_arrays(self, open_time, o, h, l, c):
+        """feed() 的数组版本，open_time 为毫秒时间戳"""
+        open_time = np.asarray(open_time, dtype=np.int64)
+        if self.last_time is not None:
+            keep = open_time > self.last_time.value // 1_000_000
+            open_time, o, h, l, c = open_time[keep], o[keep], h[keep], l[keep], c[keep]
+        if not len(open_time):
+            return 0
+
+        start = len(self.tail['c'])
+        o = np.concatenate([self.tail['o'], np.asarray(o, dtype=float)])
+        h = np.concatenate([self.tail['h'], np.asarray(h, dtype=float)])
+        l = np.concatenate([self.tail['l'], np.asarray(l, dtype=float)])
+        c = np.concatenate([self.tail['c'], np.asarray(c, dtype=float)])
+        self._prepare(o, h, l, c, start)
+
+        times = open_time.astype('datetime64[ms]')
+        years = times.astype('datetime64[Y]').astype(np.int64) + 1970
+        new_year = years != np.r_[self.year if self.year is not None else years[0], years[:-1]]
+        days = times.astype('datetime64[D]')
+        self.days += int((days != np.r_[self.last_day if self.last_day is not None else days[0] - 1,
+                                        days[:-1]]).sum())
+
+        for i in range(start, len(c)):
+            self._broker_next(o[i])
+            value = self._value(c[i])
+            self.peak = np.maximum(self.peak, value)
+            self.maxdd = np.maximum(self.maxdd, 100.0 * (self.peak - value) / self.peak)
+            if new_year[i - start]:
+                self.year_values.append(self.value)
+            self.value = value
+            active = self.nbars + i - start >= self.minperiod - 1
+            if active.any():
+                self._next(i, active, c[i], value)
+
+        self._carry()
+        self.nbars += len(open_time)
+        self.last_time = pd.Timestamp(int(open_time[-1]), unit='ms')
+        self.year = years[-1]
+        self.last_day = days[-1]
+        self.tail = {k: v[-self.lookback:].copy() for k, v in zip('ohlc', (o, h, l, c))}
+        return len(open_time)
+
+    def results(self):
+        """按当前已处理的K线计算与各策略 run_backtest_and_plot 同口径的结果列表"""
+        # Returns 分析器按数据的时间框架（PandasData 默认 Days）统计子周期数
+        tcount = self.days
+        rate = pow(1.0 + 0.01, 1.0 / 1) - 1.0
+        year_values = np.array(self.year_values + [self.value])
+        value = self.value
+
+        results = []
+        for k, params in enumerate(self.params_list):
+            end_value = float(value[k])
+            nlrtot = end_value / self.startcash
+            rtot = math.log(nlrtot) if nlrtot >= 0.0 else -float('inf')
+            ravg = rtot / tcount
+            annual = math.expm1(ravg * 252.0) if ravg > -float('inf') else ravg
+
+            prev = float(self.startcash)
+            ret_free = []
+            for v in year_values[:, k]:
+                ret_free.append((float(v) / prev - 1.0) - rate)
+                prev = float(v)
+            try:
+                sharpe = average(ret_free) / standarddev(ret_free, avgx=average(ret_free))
+            except ZeroDivisionError:
+                sharpe = None
+
+            record = dict(params)
+            record.update({
+                'sharpe': sharpe,
+                'return': rtot,
+                'maxdd': float(self.maxdd[k]),
+                'annual': annual,
+                'average': ravg,
+                'trades': int(self.trade_count[k]),
+                'final_value': end_value,
+            })
+            record.update(self._record(k))
+            results.append(record)
+        return results
+
+    def run(self, df):
+        """在一份K线数据上从头推进整个参数网格，返回结果列表"""
+        self.reset()
+        self.feed(df)
+        return self.results()
+
+    # ---- 快照 ----
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in self.transient:
+            state.pop(name, None)
+        return state
+
+    def save(self, path):
+        """保存完整状态（不含按整段重算的指标数组），先写临时文件再替换"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + '.tmp')
+        with open(tmp, 'wb') as f:
+            pickle.dump(self, f)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+
+class TurtleGridSimulator(GridSimulator):
+    """TurtleATRStrategy 的参数网格版本，参数名与策略 params 相同"""
+    defaults = dict(entry_period=20, exit_period=10, atr_period=14, risk_per_trade=0.01, max_units=4)
+    transient = ('entry_high', 'exit_low', 'atr')
+
+    def _column(self, name):
+        return np.array([p.get(name, self.defaults[name]) for p in self.params_list])
+
+    def _setup(self):
+        self.entry_p = self._column('entry_period')
+        self.exit_p = self._column('exit_period')
+        self.atr_p = self._column('atr_period')
+        self.risk = self._column('risk_per_trade').astype(float)
+        self.max_units = self._column('max_units')
+
+        # 指标只按不同的周期各算一次，每根K线再按参数组合取列
+        self.entry_u, self.entry_idx = np.unique(self.entry_p, return_inverse=True)
+        self.exit_u, self.exit_idx = np.unique(self.exit_p, return_inverse=True)
+        self.atr_u, self.atr_idx = np.unique(self.atr_p, return_inverse=True)
+        self.atr_last = np.full(len(self.atr_u), np.nan)
+
+        K = len(self.params_list)
+        self.minperiod = np.maximum(np.maximum(self.entry_p, self.exit_p), self.atr_p + 1)
+        self.lookback = int(self.minperiod.max())
+        self.unit_size = np.zeros(K)
+        self.last_entry_price = np.full(K, np.nan)
+        self.units = np.zeros(K, dtype=int)
+
+    def _prepare(self, o, h, l, c, start):
+        self.entry_high = np.column_stack([rolling_max(h, p) for p in self.entry_u])
+        self.exit_low = np.column_stack([rolling_min(l, p) for p in self.exit_u])
+        self.atr = np.column_stack([atr(h, l, c, p, start, seed)
+                                    for p, seed in zip(self.atr_u, self.atr_last)])
+
+    def _carry(self):
+        self.atr_last = self.atr[-1].copy()
+
+    def _notify_fill(self, rows, isbuy, price):
+        # notify_trade：仓位归零即一笔交易结束
+        if not isbuy:
+            self.trade_count[rows[self.pos[rows] == 0]] += 1
+
+    def _next(self, i, active, close, value):
+        atr_now = self.atr[i][self.atr_idx]
+        if i > 0:
+            entry_high = self.entry_high[i - 1][self.entry_idx]
+            exit_low = self.exit_low[i - 1][self.exit_idx]
+        else:
+            entry_high = exit_low = np.full(len(active), np.nan)
+        flat = self.pos == 0
+
+        # 入场：收盘价突破前一根的入场通道
+        enter = active & flat & (close > entry_high)
+        if enter.any():
+            self.unit_size[enter] = self.cash[enter] * self.risk[enter] / atr_now[enter]
+            self.last_entry_price[enter] = close
+            self.units[enter] = 1
+            self._submit(enter, self.unit_size, close)
+
+        held = active & ~flat
+        if not held.any():
+            return
+
+        # 加仓：每上涨 0.5ATR 加一个单位
+        add = held & (self.units < self.max_units) & (close >= self.last_entry_price + 0.5 * atr_now)
+        if add.any():
+            self._submit(add, self.unit_size, close)
+            self.last_entry_price[add] = close
+            self.units[add] += 1
+
+        # 平仓：跌破出场通道或跌破最后入场价 - 2ATR
+        stop_price = self.last_entry_price - 2 * atr_now
+        leave = held & ((close < exit_low) | (close < stop_price))
+        if leave.any():
+            self._submit(leave, -self.pos, close)
+            self.units[leave] = 0
+
+
+class MartingaleGridSimulator(GridSimulator):
+    """MartingaleStrategy 的参数网格版本，参数名与策略 params 相同"""
+    max_orders = 1
+    defaults = dict(initial_stake=100, multiplier=2, take_profit_pct=0.05,
+                    max_levels=5, risk_pct=0.02, ma_period=20)
+
+    transient = ('ma',)
+
+    def _column(self, name):
+        return np.array([p.get(name, self.defaults[name]) for p in self.params_list], dtype=float)
+
+    def _setup(self):
+        self.initial_stake = self._column('initial_stake')
+        self.take_profit = self._column('take_profit_pct')
+        self.max_levels = self._column('max_levels').astype(int)
+        self.risk_pct = self._column('risk_pct')
+        ma_p = self._column('ma_period').astype(int)
+        self.ma_u, self.ma_idx = np.unique(ma_p, return_inverse=True)
+
+        # initial_stake * multiplier ** level 用 Python 算好查表，避免 np.power 的末位误差
+        self.stake_table = np.array([
+            [p.get('initial_stake', self.defaults['initial_stake'])
+             * (p.get('multiplier', self.defaults['multiplier']) ** level)
+             for level in range(self.max_levels.max() + 1)]
+            for p in self.params_list], dtype=float)
+
+        K = len(self.params_list)
+        self.minperiod = ma_p
+        self.lookback = int(ma_p.max())
+        self.entry_price = np.full(K, np.nan)
+        self.level = np.zeros(K, dtype=int)
+        self.current_stake = self.initial_stake.copy()
+        self.win_count = np.zeros(K, dtype=int)
+
+    def _prepare(self, o, h, l, c, start):
+        self.ma = np.column_stack([sma(c, p) for p in self.ma_u])
+
+    def _notify_fill(self, rows, isbuy, price):
+        if isbuy:
+            self.entry_price[rows] = price
+            return
+        profit_pct = (price / self.entry_price[rows] - 1) * 100
+        self.trade_count[rows] += 1
+        self.win_count[rows[profit_pct > 0]] += 1
+        self.level[rows] = 0
+        self.current_stake[rows] = self.initial_stake[rows]
+
+    def _next(self, i, active, close, value):
+        ma_now = self.ma[i][self.ma_idx]
+        risk_amount = value * self.risk_pct
+        flat = self.pos == 0
+
+        # 空仓且价格在均线上方时入场
+        enter = active & flat & (close > ma_now)
+        if enter.any():
+            self._submit(enter, self.current_stake / close, close)
+            self.level[enter] = 1
+
+        entry = self.entry_price
+        held = active & ~flat & ~np.isnan(entry) & (entry != 0)
+        if not held.any():
+            return
+
+        take_profit = held & (close >= entry * (1 + self.take_profit))
+        rest = held & ~take_profit
+        add = rest & (close < entry) & (self.level < self.max_levels)
+        # 极端行情保护：下跌超过30%止损
+        stop = rest & ~add & (close <= entry * 0.7)
+        if take_profit.any() or stop.any():
+            self._submit(take_profit | stop, -self.pos, close)
+
+        if add.any():
+            rows = np.flatnonzero(add)
+            self.current_stake[rows] = self.stake_table[rows, self.level[rows]]
+            rows = rows[self.current_stake[rows] <= risk_amount[rows]]
+            if len(rows):
+                size = np.zeros(len(entry))
+                size[rows] = self.current_stake[rows] / close
+                mask = np.zeros(len(entry), dtype=bool)
+                mask[rows] = True
+                self._submit(mask, size, close)
+                self.level[rows] += 1
+                pos = self.pos[rows]
+                self.entry_price[rows] = (entry[rows] * pos + close * size[rows]) / (pos + size[rows])
+
+    def _record(self, k):
+        trades = self.trade_count[k]
+        return {'win_rate': float(self.win_count[k] / trades) if trades > 0 else 0}
+
+
+class MovingAverageCrossGridSimulator(GridSimulator):
+    """MovingAverageCrossStrategy 的参数网格版本：金叉买入 1 个单位，死叉卖出"""
+    max_orders = 1
+    defaults = dict(short_period=10, long_period=30)
+    transient = ('sma_short', 'sma_long', 'nzd')
+
+    def _column(self, name):
+        return np.array([p.get(name, self.defaults[name]) for p in self.params_list])
+
+    def _setup(self):
+        short_p = self._column('short_period')
+        long_p = self._column('long_period')
+        self.short_u, self.short_idx = np.unique(short_p, return_inverse=True)
+        self.long_u, self.long_idx = np.unique(long_p, return_inverse=True)
+        # CrossOver 需要前一根的 NonZeroDifference，所以比长均线多一根
+        self.minperiod = np.maximum(short_p, long_p) + 1
+        self.lookback = int(self.minperiod.max())
+        self.nzd_last = np.full(len(self.params_list), np.nan)
+
+    def _prepare(self, o, h, l, c, start):
+        self.sma_short = np.column_stack([sma(c, p) for p in self.short_u])
+        self.sma_long = np.column_stack([sma(c, p) for p in self.long_u])
+
+        # 与 bt.ind.NonZeroDifference 一致：差值为 0 时沿用上一个非 0 差值，第一根直接取差值
+        diff = self.sma_short[:, self.short_idx] - self.sma_long[:, self.long_idx]
+        self.nzd = np.full(diff.shape, np.nan)
+        prev = self.nzd_last
+        if start:
+            self.nzd[start - 1] = prev
+        for i in range(start, len(c)):
+            d = diff[i]
+            prev = self.nzd[i] = np.where((d != 0) | np.isnan(prev), d, prev)
+
+    def _carry(self):
+        self.nzd_last = self.nzd[-1].copy()
+
+    def _notify_fill(self, rows, isbuy, price):
+        if not isbuy:
+            self.trade_count[rows[self.pos[rows] == 0]] += 1
+
+    def _next(self, i, active, close, value):
+        short = self.sma_short[i][self.short_idx]
+        long = self.sma_long[i][self.long_idx]
+        before = self.nzd[i - 1]
+        flat = self.pos == 0
+
+        enter = active & flat & (before < 0.0) & (short > long)
+        if enter.any():
+            self._submit(enter, np.ones(len(active)), close)
+        leave = active & ~flat & (before > 0.0) & (short < long)
+        if leave.any():
+            self._submit(leave, -self.pos, close)
+
+
+# 策略类路径 -> 对应的参数网格模拟器（strategy.py update 使用）
+SIMULATORS = {
+    'strategies.TurtleStrategy.TurtleATRStrategy': TurtleGridSimulator,
+    'strategies.MatingaleStrategy.MartingaleStrategy': MartingaleGridSimulator,
+    'strategies.MovingAverageCrossStrategy.MovingAverageCrossStrategy': MovingAverageCrossGridSimulator,
+}
+
+
+# ---- 与 Cerebro 的差分校验 ----
+def run_cerebro(strategy_cls, datafeed_cls, df, params, cash=10000.0, commission=0.0008):
+    import backtrader as bt
+
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.broker.setcash(cash)
+    cerebro.broker.setcommission(commission=commission)
+    cerebro.adddata(datafeed_cls(dataname=df))
+    cerebro.addstrategy(strategy_cls, **params)
+    cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name='sharpe')
+    cerebro.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
+    cerebro.addanalyzer(bt.analyzers.Returns, _name='returns')
+    cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name='trade')
+    strat = cerebro.run()[0]
+
+    returns = strat.analyzers.returns.get_analysis()
+    trades = getattr(strat, 'trade_count', None)
+    if trades is None:
+        trades = strat.analyzers.trade.get_analysis().get('total', {}).get('closed', 0)
+    return {
+        'sharpe': strat.analyzers.sharpe.get_analysis().get('sharperatio', None),
+        'return': returns.get('rtot', None),
+        'maxdd': strat.analyzers.drawdown.get_analysis().get('max', {}).get('drawdown', None),
+        'annual': returns.get('rnorm', None),
+        'average': returns.get('ravg', None),
+        'trades': trades,
+        'final_value': cerebro.broker.getvalue(),
+    }
+
+
+def compare_with_cerebro(simulator, strategy_cls, datafeed_cls, df, rtol=1e-9):
+    """逐个参数组合跑 Cerebro，返回与模拟器结果不一致的 (参数, 模拟器, Cerebro) 列表"""
+    mismatches = []
+    for record in simulator.run(df):
+        params = {k: record[k] for k in simulator.params_list[0]}
+        expected = run_cerebro(strategy_cls, datafeed_cls, df, params,
+                               cash=simulator.startcash, commission=simulator.commission)
+        for key, want in expected.items():
+            got = record[key]
+            if want is None or got is None:
+                same = want is got
+            else:
+                same = math.isclose(got, want, rel_tol=rtol, abs_tol=rtol)
+            if not same:
+                mismatches.append((params, record, expected))
+                break
+    return mismatches
+
+
+def compare_continuation(simulator, df, split=0.8, snapshot_dir='output'):
+    """前 split 的K线跑完后存快照，恢复后只推进剩余K线，返回与完整回测不一致的结果"""
+    full = simulator.run(df)
+    n = int(len(df) * split)
+    simulator.reset()
+    simulator.feed(df.iloc[:n])
+    path = Path(snapshot_dir) / f'.{type(simulator).__name__}.snap'
+    simulator.save(path)
+    resumed = GridSimulator.load(path)
+    os.remove(path)
+    resumed.feed(df.iloc[n:])
+    return [(a, b) for a, b in zip(full, resumed.results()) if a != b]
+
+
+def compare_chunks(simulator, df, chunksize=1000):
+    """按 chunksize 根一块逐块推进，返回与整段一次推进不一致的结果"""
+    full = simulator.run(df)
+    simulator.reset()
+    open_time = pd.DatetimeIndex(df.index).values.astype('datetime64[ms]').astype(np.int64)
+    columns = {c: df[c].to_numpy(dtype=float) for c in ('open', 'high', 'low', 'close')}
+    simulator.feed_chunks(dict({c: v[i:i + chunksize] for c, v in columns.items()}, open_time=open_time[i:i + chunksize])
+                          for i in range(0, len(df), chunksize))
+    return [(a, b) for a, b in zip(full, simulator.results()) if a != b]
+
+
+def differential_checks():
+    """差分校验用的 (模拟器, 策略类, 数据源类)：main() 和 tests/test_vector_sim.py 共用同一组参数网格"""
+    from strategies.TurtleStrategy import TurtleATRStrategy, PandasData as TurtleData
+    from strategies.MatingaleStrategy import MartingaleStrategy, PandasData as MartingaleData
+    from strategies.MovingAverageCrossStrategy import MovingAverageCrossStrategy, PandasData as MAData
+
+    return [
+        (TurtleGridSimulator(param_grid(entry_period=range(5, 11, 5),
+                                        exit_period=range(20, 41, 5),
+                                        atr_period=range(10, 20, 5))),
+         TurtleATRStrategy, TurtleData),
+        (MartingaleGridSimulator(param_grid(initial_stake=[100, 300],
+                                            multiplier=[1.5, 2.5],
+                                            take_profit_pct=[0.03, 0.07],
+                                            max_levels=[3, 5],
+                                            risk_pct=[0.02, 0.05],
+                                            ma_period=[10, 50])),
+         MartingaleStrategy, MartingaleData),
+        (MovingAverageCrossGridSimulator([p for p in param_grid(short_period=range(5, 30, 5),
+                                                                long_period=range(20, 80, 10))
+                                          if p['short_period'] < p['long_period']], cash=100000.0),
+         MovingAverageCrossStrategy, MAData),
+    ]
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else 'data/BTCUSDT_1h_300d_2025-06-14-19:33.csv'
+    df = pd.read_csv(path, index_col='datetime', parse_dates=True)
+    print(f"📂 差分校验数据: {path}（{len(df)} 根K线）")
+
+    failed = False
+    for simulator, strategy_cls, datafeed_cls in differential_checks():
+        mismatches = compare_with_cerebro(simulator, strategy_cls, datafeed_cls, df)
+        total = len(simulator.params_list)
+        print(f"{strategy_cls.__name__}: {total - len(mismatches)}/{total} 组参数与 Cerebro 一致")
+        for params, got, want in mismatches:
+            failed = True
+            print(f"  ❌ {params}\n     模拟器: {got}\n     Cerebro: {want}")
+
+        mismatches = compare_continuation(simulator, df)
+        print(f"{strategy_cls.__name__}: {total - len(mismatches)}/{total} 组参数快照续跑与完整回测一致")
+        for full, resumed in mismatches:
+            failed = True
+            print(f"  ❌ 完整: {full}\n     续跑: {resumed}")
+
+        # 块比指标回看窗口还短时尾部K线跨越多块，也要一致
+        for chunksize in (7, 1000):
+            mismatches = compare_chunks(simulator, df, chunksize)
+            print(f"{strategy_cls.__name__}: {total - len(mismatches)}/{total} 组参数按 {chunksize} 根分块推进与完整回测一致")
+            for full, chunked in mismatches:
+                failed = True
+                print(f"  ❌ 完整: {full}\n     分块: {chunked}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,16 @@
-from binance.client import Client
 import datetime
+
+import backtrader as bt
 import pandas as pd
 
-# 初始化币安客户端
-client = Client()
+from data.rest_client import binance_client
 
 # 获取历史k线数据
 def get_binance_btc_data(symbol='BTCUSDT', interval='1d', lookback_days=600):
     end_time = datetime.datetime.now()
     start_time = end_time - datetime.timedelta(days=lookback_days)
 
-    klines = client.get_historical_klines(
+    klines = binance_client().get_historical_klines(
         symbol,
         interval,
         start_str=start_time.strftime("%d %b %Y %H:%M:%S"),
@@ -29,8 +29,6 @@ def get_binance_btc_data(symbol='BTCUSDT', interval='1d', lookback_days=600):
 
     return df
 
-df = get_binance_btc_data()
-
 # backtrader 数据接口
 class PandasData(bt.feeds.PandasData):
     params = (
@@ -0,0 +1,116 @@
+"""
+backtrader 流式数据源：从K线块的迭代器中逐根取数，不需要先拼成完整的 DataFrame。
+
+多周期策略只加载一份基础周期的数据，其余周期用 cerebro.resampledata 在引擎内合成：
+
+    base = KlineStoreData(store=store, interval='15m', stamp='close')
+    cerebro.adddata(base)
+    cerebro.resampledata(base, **resample_timeframe('4h', '15m'))   # 策略里是 self.datas[1]
+
+backtrader 按收盘时间判断合成K线是否结束，所以基础数据要用 stamp='close' 按收盘时间标记，
+否则 04:00 开盘的那根会被算进 00:00-04:00 的 4h K线（用到了未来数据）。
+"""
+import datetime
+
+import backtrader as bt
+
+from data.kline_store import INTERVAL_MS
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def bar_timeframe(interval):
+    """K线周期对应的 backtrader timeframe / compression，例如 '15m' -> Minutes, 15"""
+    ms = INTERVAL_MS[interval]
+    if ms < 60_000:
+        return {'timeframe': bt.TimeFrame.Seconds, 'compression': ms // 1000}
+    if ms < 86_400_000:
+        return {'timeframe': bt.TimeFrame.Minutes, 'compression': ms // 60_000}
+    if interval.endswith('w'):
+        return {'timeframe': bt.TimeFrame.Weeks, 'compression': ms // 604_800_000}
+    return {'timeframe': bt.TimeFrame.Days, 'compression': ms // 86_400_000}
+
+
+def resample_timeframe(interval, base):
+    """
+    由 base 周期合成 interval 周期时 resampledata 的参数。
+    1d 也按 1440 分钟合成：backtrader 的 Days 边界会把收盘时间为次日 00:00 的最后一根K线算进第二天。
+    超过 1 天的周期在分钟刻度上无法按自然日对齐，不支持。
+    """
+    ms, base_ms = INTERVAL_MS[interval], INTERVAL_MS[base]
+    if ms <= base_ms or ms % base_ms:
+        raise ValueError(f"{interval} 不能由 {base} 合成：必须是 {base} 的整数倍")
+    if ms > 86_400_000 or 86_400_000 % ms:
+        raise ValueError(f"不支持合成 {interval}：只支持能整除 1 天的周期")
+    if ms < 60_000:
+        return {'timeframe': bt.TimeFrame.Seconds, 'compression': ms // 1000, 'name': interval}
+    return {'timeframe': bt.TimeFrame.Minutes, 'compression': ms // 60_000, 'name': interval}
+
+
+class BarStreamData(bt.feed.DataBase):
+    """
+    bars 为K线块的迭代器，每块是 {open_time/open/high/low/close/volume: 数组}，
+    例如 trade_bars.aggregate_bars() 的输出。只有在 backtrader 需要下一根时才会拉取下一块。
+    offset 为加到 open_time 上的毫秒数，按收盘时间标记K线时为一个周期。
+    """
+    params = (
+        ('bars', None),
+        ('offset', 0),
+    )
+
+    def start(self):
+        super(BarStreamData, self).start()
+        self._chunks = iter(self.p.bars)
+        self._chunk = None
+        self._i = 0
+
+    def _load(self):
+        while self._chunk is None or self._i >= len(self._chunk['open_time']):
+            self._chunk = next(self._chunks, None)
+            self._i = 0
+            if self._chunk is None:
+                return False
+
+        i, chunk = self._i, self._chunk
+        dt = EPOCH + datetime.timedelta(milliseconds=int(chunk['open_time'][i]) + self.p.offset)
+        self.lines.datetime[0] = bt.date2num(dt)
+        self.lines.open[0] = chunk['open'][i]
+        self.lines.high[0] = chunk['high'][i]
+        self.lines.low[0] = chunk['low'][i]
+        self.lines.close[0] = chunk['close'][i]
+        self.lines.volume[0] = chunk['volume'][i]
+        self.lines.openinterest[0] = 0.0
+        self._i += 1
+        return True
+
+
+class KlineStoreData(BarStreamData):
+    """
+    直接从K线仓库分块读取的数据源，整个区间不会一次性载入内存。
+    配合 cerebro.run(exactbars=1) 使用时，指标也只保留计算所需的最少K线，
+    多年的 1m 数据回测内存占用基本恒定。
+    timeframe / compression 由 interval 决定；stamp='close' 时按收盘时间标记，供 resampledata 使用。
+    """
+    params = (
+        ('store', None),
+        ('symbol', 'BTCUSDT'),
+        ('interval', '1h'),
+        ('start', None),     # 毫秒时间戳，含
+        ('end', None),       # 毫秒时间戳，不含
+        ('chunksize', 100_000),
+        ('on_gap', 'ignore'),  # ignore / raise / fill，见 KlineStore.iter_chunks
+        ('stamp', 'open'),     # open / close
+    )
+
+    def __init__(self):
+        if self.p.interval in INTERVAL_MS:
+            for name, value in bar_timeframe(self.p.interval).items():
+                setattr(self.p, name, value)
+            if self.p.stamp == 'close':
+                self.p.offset = INTERVAL_MS[self.p.interval]
+
+    def start(self):
+        self.p.bars = self.p.store.iter_chunks(self.p.symbol, self.p.interval,
+                                               start=self.p.start, end=self.p.end,
+                                               chunksize=self.p.chunksize, on_gap=self.p.on_gap)
+        super(KlineStoreData, self).start()
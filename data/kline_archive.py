@@ -0,0 +1,196 @@
+"""
+币安公开数据K线归档的批量导入
+
+多年的历史K线用 get_historical_klines 一页 1000 根地拉，又慢又占 REST 权重。
+币安在 data.binance.vision 上按月 / 按日发布同样的K线 zip 归档（附 .CHECKSUM）：
+
+    BTCUSDT-1m-2024-01.zip               月度归档
+    BTCUSDT-1m-2024-02-15.zip            日度归档
+    BTCUSDT-1m-2024-01.zip.CHECKSUM      sha256 校验文件
+
+ingest() 接收已经下载好的归档文件或本地镜像目录（递归查找），不需要网络：
+多进程并行校验 sha256、流式解压并用 pandas 的 C 解析器分块解析 CSV，
+主进程按时间顺序把每个文件的列数组直接追加进K线仓库（同一序列只有一个写入者）。
+
+    archives = find_archives(['mirror/data/spot/monthly/klines/BTCUSDT/1m'])
+    for archive, written, parsed, error in ingest(KlineStore(), archives, jobs=8):
+        ...
+
+2025 年起现货归档的时间戳是微秒，解析时统一转成毫秒。
+同一序列里月度和日度归档重叠时按开始日期排序、月度在前，重复的K线只写入一次。
+
+仓库里已经有较新的数据（例如先用 REST 下载过最近 300 天）时，晚于最后一根的K线直接追加，
+更早的K线和中间缺失的K线先在内存里按序收集，这个序列的归档都处理完后用 KlineStore.merge()
+一次并入（整个序列只重写一次）。
+"""
+import collections
+import contextlib
+import hashlib
+import multiprocessing
+import re
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from data.kline_store import COLUMNS
+
+# 币安K线归档的列（期货归档带表头，现货不带），只用前 6 列
+KLINE_COLUMNS = ['open_time', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_volume',
+                 'count', 'taker_buy_volume', 'taker_buy_quote_volume', 'ignore']
+
+ARCHIVE_NAME = re.compile(r'^(?P<symbol>[A-Z0-9]+)-(?P<interval>\d+(?:s|m|h|d|w|mo))-'
+                          r'(?P<date>\d{4}-\d{2}(?:-\d{2})?)\.(?:zip|csv)$')
+
+Archive = collections.namedtuple('Archive', 'path symbol interval date')
+
+
+def find_archives(paths, symbols=None, intervals=None):
+    """
+    paths 里的归档文件和目录（目录递归查找），按 (交易对, 周期, 开始日期) 排序；
+    同一个月里月度归档排在日度归档前面。文件名不符合币安命名的跳过。
+    """
+    files = []
+    for path in map(Path, paths):
+        files.extend(sorted(path.rglob('*')) if path.is_dir() else [path])
+    archives = []
+    for path in files:
+        match = ARCHIVE_NAME.match(path.name)
+        if match is None:
+            continue
+        if symbols and match['symbol'] not in symbols or intervals and match['interval'] not in intervals:
+            continue
+        archives.append(Archive(path, match['symbol'], match['interval'], match['date']))
+    return sorted(archives, key=lambda a: (a.symbol, a.interval, a.date[:7], len(a.date), a.date))
+
+
+def verify_checksum(path):
+    """与同目录的 <文件名>.CHECKSUM 比对 sha256：一致返回 True，不一致 False，没有校验文件返回 None"""
+    path = Path(path)
+    checksum = path.with_name(path.name + '.CHECKSUM')
+    if not checksum.exists():
+        return None
+    expected = checksum.read_text().split()[0].lower()
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest() == expected
+
+
+@contextlib.contextmanager
+def _open(path):
+    """zip 里的 CSV（边解压边读，不整个解压到内存）或解压后的 CSV，二进制流"""
+    if str(path).endswith('.zip'):
+        with zipfile.ZipFile(path) as zf:
+            with zf.open(zf.namelist()[0]) as f:
+                yield f
+    else:
+        with open(path, 'rb') as f:
+            yield f
+
+
+def read_klines(path, chunksize=1_000_000):
+    """解析一个K线归档，返回 {open_time, open, high, low, close, volume} 数组（open_time 为毫秒）"""
+    with _open(path) as f:
+        header = not f.readline()[:1].isdigit()
+    parts = collections.defaultdict(list)
+    with _open(path) as f:
+        reader = pd.read_csv(f, header=None, skiprows=1 if header else 0, usecols=range(6),
+                             dtype={0: np.int64, 1: np.float64, 2: np.float64, 3: np.float64,
+                                    4: np.float64, 5: np.float64},
+                             engine='c', chunksize=chunksize)
+        for df in reader:
+            for i, name in enumerate(KLINE_COLUMNS[:6]):
+                parts[name].append(df[i].to_numpy())
+    columns = {name: np.concatenate(parts[name]) if parts[name] else
+               np.empty(0, dtype=np.int64 if name == 'open_time' else np.float64)
+               for name in KLINE_COLUMNS[:6]}
+    t = columns['open_time']
+    # 2025 年起现货归档的时间戳是微秒
+    if len(t) and t[0] > 10 ** 14:
+        columns['open_time'] = t // 1000
+    return columns
+
+
+def _load(task):
+    """工作进程：校验 + 解析一个归档，返回 (archive, 列数组, 错误信息)"""
+    archive, strict = task
+    try:
+        ok = verify_checksum(archive.path)
+        if ok is False:
+            return archive, None, 'sha256 与 .CHECKSUM 不一致'
+        if ok is None and strict:
+            return archive, None, '缺少 .CHECKSUM 校验文件'
+        return archive, read_klines(archive.path), None
+    except (OSError, ValueError, zipfile.BadZipFile, pd.errors.ParserError) as e:
+        return archive, None, f"解析失败: {e}"
+
+
+class _Backfill(object):
+    """一个序列里不能直接追加的K线（早于仓库最后一根、仓库里还没有），按时间顺序收集后一次 merge"""
+
+    def __init__(self, series):
+        self.series = series
+        self.parts = collections.defaultdict(list)
+        self.last = None
+        self.rows = 0
+
+    def add(self, columns, mask):
+        t = columns['open_time'][mask]
+        # 月度和日度归档重叠的部分只收一次
+        keep = slice(None) if self.last is None else t > self.last
+        t = t[keep]
+        if len(t):
+            self.parts['open_time'].append(t)
+            for c in COLUMNS:
+                self.parts[c].append(columns[c][mask][keep])
+            self.last = t[-1]
+            self.rows += len(t)
+        return len(t)
+
+    def flush(self, store):
+        if not self.rows:
+            return 0
+        columns = {name: np.concatenate(parts) for name, parts in self.parts.items()}
+        return store.merge(*self.series, columns['open_time'], columns)
+
+
+def ingest(store, archives, jobs=None, strict=False):
+    """
+    并行校验、解析 archives（find_archives 的结果，已按时间排好），按顺序写入仓库，
+    逐个返回 (archive, 新增行数, 解析行数, 错误信息)。
+    晚于仓库最后一根的K线直接追加；更早的和仓库里缺失的K线在这个序列结束时一次 merge 进去，
+    仓库里已有的K线不重复写入（新增行数小于解析行数）。
+    某个序列的文件出错后，这个序列后面的文件不再写入，避免在仓库里留下缺口。
+    """
+    tasks = [(archive, strict) for archive in archives]
+    pool = multiprocessing.Pool(jobs) if jobs != 1 else None
+    results = pool.imap(_load, tasks, chunksize=1) if pool is not None else map(_load, tasks)
+    broken = set()
+    backfill = None
+    try:
+        for archive, columns, error in results:
+            series = (archive.symbol, archive.interval)
+            if backfill is not None and backfill.series != series:
+                backfill.flush(store)
+                backfill = None
+            if error is not None or series in broken:
+                broken.add(series)
+                yield archive, 0, 0, error or '同一序列前面的文件出错，跳过'
+                continue
+            if backfill is None:
+                backfill = _Backfill(series)
+            t = columns['open_time']
+            last = store.last_time(*series)
+            later = np.ones(len(t), dtype=bool) if last is None else t > last
+            earlier = ~later & store.missing(*series, t)
+            written = backfill.add(columns, earlier) if earlier.any() else 0
+            written += store.append(*series, t[later], {c: columns[c][later] for c in COLUMNS})
+            yield archive, written, len(t), None
+        if backfill is not None:
+            backfill.flush(store)
+    finally:
+        if pool is not None:
+            pool.terminate()
@@ -0,0 +1,313 @@
+"""
+本地K线仓库
+
+每个 (symbol, interval) 一个目录，每列一个定长二进制文件：
+open_time 为 int64 毫秒时间戳，open/high/low/close/volume 为 float64。
+平时只追加写入，读取时按列直接映射成 NumPy 数组，多个进程可以共享同一份缓存；
+早于已有数据的K线（回填历史、补缺口）用 merge() 并入，整个序列重写一次。
+open_time 列本身有序，按时间取区间时二分查找行号，只读出区间内的字节。
+gaps.i8 记录缺失K线的位置（缺口前最后一根、缺口后第一根的开盘时间），追加时增量更新。
+
+    data/store/BTCUSDT/1h/open_time.i8
+    data/store/BTCUSDT/1h/close.f8
+    data/store/BTCUSDT/1h/gaps.i8
+    ...
+"""
+import datetime
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+
+# 币安K线周期对应的毫秒数
+INTERVAL_MS = {
+    '1s': 1000, '1m': 60_000, '3m': 180_000, '5m': 300_000, '15m': 900_000, '30m': 1_800_000,
+    '1h': 3_600_000, '2h': 7_200_000, '4h': 14_400_000, '6h': 21_600_000,
+    '8h': 28_800_000, '12h': 43_200_000, '1d': 86_400_000, '3d': 259_200_000,
+    '1w': 604_800_000,
+}
+
+
+def fill_gaps(columns, step, prev_close=None, prev_time=None):
+    """
+    把缺失的K线补成平盘K线：开高低收都等于前一根的收盘价，成交量为 0。
+    prev_time / prev_close 为上一块最后一根K线，分块处理时用来补块与块之间的缺口。
+    """
+    t = columns['open_time']
+    if not len(t):
+        return columns
+    first = t[0] if prev_time is None else prev_time + step
+    grid = np.arange(first, t[-1] + 1, step, dtype=np.int64)
+    if len(grid) == len(t):
+        return columns
+
+    pos = np.searchsorted(t, grid, side='right') - 1
+    real = np.zeros(len(grid), dtype=bool)
+    real[np.searchsorted(grid, t)] = True
+    # 每个位置取最近一根真实K线的收盘价，块开头的缺口用上一块的收盘价
+    close = np.where(pos >= 0, columns['close'][np.maximum(pos, 0)], np.nan if prev_close is None else prev_close)
+    out = {'open_time': grid}
+    for column in COLUMNS:
+        out[column] = np.where(real, 0.0, 0.0 if column == 'volume' else close)
+        out[column][real] = columns[column]
+    return out
+
+
+def _kline_columns(klines, end_ms, closed_before=False):
+    """REST 返回的K线转成 (open_time, {列名: 数组})，只保留开盘（closed_before 时为收盘）早于 end_ms 的"""
+    raw = np.array([k[:7] for k in klines], dtype=float).reshape(-1, 7)
+    keep = raw[:, 6 if closed_before else 0] < end_ms
+    raw = raw[keep]
+    return raw[:, 0].astype(np.int64), {c: raw[:, i + 1] for i, c in enumerate(COLUMNS)}
+
+
+class KlineStore(object):
+    def __init__(self, root='data/store'):
+        self.root = Path(root)
+
+    def _dir(self, symbol, interval):
+        return self.root / symbol / interval
+
+    def _file(self, symbol, interval, column):
+        suffix = 'i8' if column == 'open_time' else 'f8'
+        return self._dir(symbol, interval) / f"{column}.{suffix}"
+
+    def _gaps_file(self, symbol, interval):
+        return self._dir(symbol, interval) / 'gaps.i8'
+
+    def rows(self, symbol, interval):
+        """已缓存的K线根数（以 open_time 列为准）"""
+        path = self._file(symbol, interval, 'open_time')
+        return path.stat().st_size // 8 if path.exists() else 0
+
+    def last_time(self, symbol, interval):
+        """最后一根K线的开盘时间（毫秒），没有数据时返回 None"""
+        n = self.rows(symbol, interval)
+        if not n:
+            return None
+        with open(self._file(symbol, interval, 'open_time'), 'rb') as f:
+            f.seek((n - 1) * 8)
+            return int(np.frombuffer(f.read(8), dtype='<i8')[0])
+
+    def append(self, symbol, interval, open_time, columns):
+        """
+        追加按时间排序的K线，早于已有最后一根的行会被丢弃（要并入更早的K线用 merge()），返回实际写入的行数。
+        先写数值列、最后写 open_time，中途中断时多出来的字节会在下次追加前截掉。
+        """
+        open_time = np.asarray(open_time, dtype='<i8')
+        last = self.last_time(symbol, interval)
+        keep = slice(None) if last is None else open_time > last
+        open_time = open_time[keep]
+        if not len(open_time):
+            return 0
+
+        self._dir(symbol, interval).mkdir(parents=True, exist_ok=True)
+        n = self.rows(symbol, interval)
+        step = INTERVAL_MS.get(interval)
+        if step is not None:
+            # 缺口表先于 open_time 写入；指向未提交K线的记录在读取和下次追加时丢弃
+            gaps = self.gaps(symbol, interval)
+            t = open_time if last is None else np.r_[last, open_time]
+            at = np.flatnonzero(np.diff(t) != step)
+            gaps = np.concatenate([gaps, np.column_stack([t[at], t[at + 1]])]).astype('<i8')
+            gaps.tofile(self._gaps_file(symbol, interval))
+        for column in COLUMNS:
+            values = np.asarray(columns[column], dtype='<f8')[keep]
+            with open(self._file(symbol, interval, column), 'ab') as f:
+                f.truncate(n * 8)
+                f.write(values.tobytes())
+        with open(self._file(symbol, interval, 'open_time'), 'ab') as f:
+            f.write(open_time.tobytes())
+        return len(open_time)
+
+    def first_time(self, symbol, interval):
+        """第一根K线的开盘时间（毫秒），没有数据时返回 None"""
+        if not self.rows(symbol, interval):
+            return None
+        with open(self._file(symbol, interval, 'open_time'), 'rb') as f:
+            return int(np.frombuffer(f.read(8), dtype='<i8')[0])
+
+    def missing(self, symbol, interval, open_time):
+        """open_time 里仓库中还没有的K线，返回布尔数组"""
+        existing = self.arrays(symbol, interval)['open_time']
+        open_time = np.asarray(open_time, dtype=np.int64)
+        if not len(existing):
+            return np.ones(len(open_time), dtype=bool)
+        pos = np.minimum(np.searchsorted(existing, open_time), len(existing) - 1)
+        return existing[pos] != open_time
+
+    def merge(self, symbol, interval, open_time, columns):
+        """
+        把任意时间位置的K线并入仓库（回填更早的历史、补中间的缺口），同一时间已有的K线保留原值，
+        返回新增的行数。整个序列在临时目录里重写后整体替换，合并期间不要有其他进程写同一序列。
+        """
+        directory = self._dir(symbol, interval)
+        backup = directory.with_name(directory.name + '.old')
+        if backup.exists() and not directory.exists():
+            backup.rename(directory)   # 上次合并在两次改名之间中断
+        open_time = np.asarray(open_time, dtype='<i8')
+        new = self.missing(symbol, interval, open_time)
+        if not new.any():
+            return 0
+        if not self.rows(symbol, interval):
+            return self.append(symbol, interval, open_time, columns)
+        added = open_time[new]
+        if len(np.unique(added)) != len(added):
+            raise ValueError(f"{symbol} {interval} 要合并的K线里有重复的开盘时间")
+
+        existing = self.read(symbol, interval, 0, self.rows(symbol, interval))
+        merged_time = np.concatenate([existing['open_time'], added])
+        order = np.argsort(merged_time, kind='stable')
+        staging = directory.with_name(directory.name + '.merge')
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir(parents=True)
+        for column in COLUMNS:
+            values = np.concatenate([existing[column], np.asarray(columns[column], dtype='<f8')[new]])
+            values[order].astype('<f8').tofile(staging / self._file(symbol, interval, column).name)
+        merged_time = merged_time[order]
+        merged_time.tofile(staging / self._file(symbol, interval, 'open_time').name)
+        step = INTERVAL_MS.get(interval)
+        if step is not None:
+            at = np.flatnonzero(np.diff(merged_time) != step)
+            np.column_stack([merged_time[at], merged_time[at + 1]]).astype('<i8').tofile(
+                staging / self._gaps_file(symbol, interval).name)
+
+        directory.rename(backup)
+        staging.rename(directory)
+        shutil.rmtree(backup)
+        return len(added)
+
+    def append_frame(self, symbol, interval, df):
+        """追加 get_data() 格式的 DataFrame（datetime 索引 + OHLCV 列）"""
+        open_time = pd.DatetimeIndex(df.index).values.astype('datetime64[ms]').astype(np.int64)
+        return self.append(symbol, interval, open_time, {c: df[c].to_numpy() for c in COLUMNS})
+
+    def append_chunks(self, symbol, interval, chunks):
+        """逐块追加K线流（例如逐笔成交聚合出的K线），返回写入的总行数"""
+        return sum(self.append(symbol, interval, chunk['open_time'], chunk) for chunk in chunks)
+
+    def arrays(self, symbol, interval):
+        """按列只读映射，返回 {列名: 数组}"""
+        n = self.rows(symbol, interval)
+        out = {}
+        for column in ('open_time',) + COLUMNS:
+            dtype = '<i8' if column == 'open_time' else '<f8'
+            if n:
+                out[column] = np.memmap(self._file(symbol, interval, column), dtype=dtype, mode='r', shape=(n,))
+            else:
+                out[column] = np.empty(0, dtype=dtype)
+        return out
+
+    def locate(self, symbol, interval, start=None, end=None):
+        """二分查找 [start, end) 毫秒区间对应的行号范围 [lo, hi)，只会读到 open_time 的 O(log n) 页"""
+        open_time = self.arrays(symbol, interval)['open_time']
+        lo = 0 if start is None else int(np.searchsorted(open_time, start, side='left'))
+        hi = len(open_time) if end is None else int(np.searchsorted(open_time, end, side='left'))
+        return lo, max(lo, hi)
+
+    def read(self, symbol, interval, lo, hi):
+        """读取第 [lo, hi) 行，返回 {列名: 数组}"""
+        out = {}
+        for column in ('open_time',) + COLUMNS:
+            dtype = '<i8' if column == 'open_time' else '<f8'
+            out[column] = np.fromfile(self._file(symbol, interval, column), dtype=dtype,
+                                      count=hi - lo, offset=lo * 8)
+        return out
+
+    def gaps(self, symbol, interval, start=None, end=None):
+        """
+        返回 [start, end) 区间内的缺口，形状 (k, 2)：缺口前最后一根、缺口后第一根的开盘时间。
+        旧仓库没有缺口表时会扫描一遍 open_time 生成。
+        """
+        step = INTERVAL_MS.get(interval)
+        last = self.last_time(symbol, interval)
+        if step is None or last is None:
+            return np.empty((0, 2), dtype=np.int64)
+
+        path = self._gaps_file(symbol, interval)
+        if path.exists():
+            gaps = np.fromfile(path, dtype='<i8').reshape(-1, 2)
+            gaps = gaps[gaps[:, 1] <= last]
+        else:
+            t = self.arrays(symbol, interval)['open_time']
+            at = np.flatnonzero(np.diff(t) != step)
+            gaps = np.column_stack([t[at], t[at + 1]]).astype('<i8')
+            gaps.tofile(path)
+
+        if start is not None:
+            gaps = gaps[gaps[:, 1] > start]
+        if end is not None:
+            gaps = gaps[gaps[:, 0] < end]
+        return gaps
+
+    def _check_gaps(self, symbol, interval, start, end, on_gap):
+        if on_gap not in ('ignore', 'raise', 'fill'):
+            raise ValueError(f"on_gap 只能是 ignore / raise / fill: {on_gap}")
+        if on_gap == 'raise':
+            gaps = self.gaps(symbol, interval, start, end)
+            if len(gaps):
+                a, b = (pd.Timestamp(int(x), unit='ms') for x in gaps[0])
+                raise ValueError(f"{symbol} {interval} 有 {len(gaps)} 处缺失K线，第一处在 {a} 与 {b} 之间")
+
+    def iter_chunks(self, symbol, interval, start=None, end=None, chunksize=100_000, on_gap='ignore'):
+        """
+        按固定行数分块读取 [start, end) 毫秒区间的K线，每次只从磁盘读出一块，
+        返回 {open_time/open/high/low/close/volume: 数组} 的迭代器。
+        on_gap 为 'raise' 时区间内有缺口直接报错，'fill' 时补成平盘K线。
+        """
+        self._check_gaps(symbol, interval, start, end, on_gap)
+        lo, hi = self.locate(symbol, interval, start, end)
+        prev = None
+        for offset in range(lo, hi, chunksize):
+            chunk = self.read(symbol, interval, offset, min(offset + chunksize, hi))
+            if on_gap == 'fill' and interval in INTERVAL_MS:
+                chunk = fill_gaps(chunk, INTERVAL_MS[interval], *(prev or (None, None)))
+                prev = chunk['close'][-1], chunk['open_time'][-1]
+            yield chunk
+
+    def load_frame(self, symbol, interval, start=None, end=None, on_gap='ignore'):
+        """读取 [start, end) 毫秒区间的K线，返回与 get_data() 相同格式的 DataFrame"""
+        self._check_gaps(symbol, interval, start, end, on_gap)
+        arrays = self.read(symbol, interval, *self.locate(symbol, interval, start, end))
+        if on_gap == 'fill' and interval in INTERVAL_MS:
+            arrays = fill_gaps(arrays, INTERVAL_MS[interval])
+        index = pd.to_datetime(arrays['open_time'], unit='ms')
+        df = pd.DataFrame({c: arrays[c] for c in COLUMNS}, index=index)
+        df.index.name = 'datetime'
+        return df
+
+    def download(self, symbol, interval, lookback_days, client=None):
+        """
+        从币安补齐最近 lookback_days 天缺失的K线，返回新写入的行数；client 默认为进程内共享的 REST 客户端。
+        仓库里最早的K线晚于回看起点时（例如之前只下载过更短的回看），先把更早的部分回填进来。
+        """
+        if client is None:
+            from data.rest_client import binance_client
+            client = binance_client()
+
+        end_ms = int(datetime.datetime.now().timestamp() * 1000)
+        start_ms = end_ms - lookback_days * 86_400_000
+        step = INTERVAL_MS[interval]
+        first, last = self.first_time(symbol, interval), self.last_time(symbol, interval)
+        written = 0
+        if first is not None and first - step >= start_ms:
+            print(f"🌐 从币安回填更早的数据: {symbol} {interval}")
+            klines = client.get_historical_klines(symbol, interval, start_str=start_ms, end_str=first - 1)
+            open_time, columns = _kline_columns(klines, first)
+            written += self.merge(symbol, interval, open_time, columns)
+        if last is not None:
+            start_ms = last + step
+
+        print(f"🌐 从币安获取数据: {symbol} {interval}")
+        klines = client.get_historical_klines(symbol, interval, start_str=start_ms, end_str=end_ms)
+        # 最后一根通常还没收盘，不写入仓库
+        open_time, columns = _kline_columns(klines, end_ms, closed_before=True)
+        return written + self.append(symbol, interval, open_time, columns)
+
+    def import_csv(self, path, symbol, interval):
+        """导入旧的 data/*.csv 缓存文件"""
+        df = pd.read_csv(path, index_col='datetime', parse_dates=True)
+        return self.append_frame(symbol, interval, df)
@@ -0,0 +1,47 @@
+"""
+后台预取：数据加载与回测计算重叠
+
+参数优化按周期（或交易对）逐个处理数据集，原来每个数据集都要先等下载 / 解析完才开始回测。
+prefetch() 在后台线程里按顺序加载后面的数据集：当前数据集回测时，下一个已经在下载和解析。
+加载线程最多领先 depth 个数据集，内存里同时最多有 depth + 1 份数据。
+
+    for interval, df in prefetch(['1h', '15m', '30m'], lambda i: get_data(interval=i)):
+        for params in grid:
+            run_backtest_and_plot(interval, *params, df=df)
+
+加载出错时异常在轮到该数据集时抛出，与顺序加载的行为一致；提前退出循环时加载线程随之停止。
+"""
+import queue
+import threading
+
+
+def prefetch(keys, load, depth=1):
+    """按 keys 的顺序逐个返回 (key, load(key))，后面的 load 在后台线程里提前执行"""
+    keys = list(keys)
+    loaded = queue.Queue()
+    slots = threading.Semaphore(depth + 1)   # 正在使用的一份 + 提前加载的 depth 份
+    stop = threading.Event()
+
+    def loader():
+        for key in keys:
+            slots.acquire()
+            if stop.is_set():
+                return
+            try:
+                loaded.put((key, load(key), None))
+            except Exception as e:
+                loaded.put((key, None, e))
+                return
+
+    threading.Thread(target=loader, name='prefetch', daemon=True).start()
+    try:
+        for _ in keys:
+            key, value, error = loaded.get()
+            if error is not None:
+                raise error
+            yield key, value
+            value = None
+            slots.release()   # 上一份用完，允许再往前加载一份
+    finally:
+        stop.set()
+        slots.release()
@@ -0,0 +1,191 @@
+"""
+共享的 REST 客户端：连接池、币安权重计数、自适应限速、带抖动的退避重试
+
+同一进程里的所有数据下载（策略文件、K线仓库、逐笔成交、DailyIncrease）都通过
+binance_client() 拿到同一个实例，共用 keep-alive 连接池和权重计数：
+
+    client = binance_client()
+    rows = client.get_historical_klines('BTCUSDT', '1h', start_ms, end_ms)
+    ticker = client.get('/api/v3/ticker/24hr', {'symbol': 'BTCUSDT'}, weight=2)
+
+权重以响应头 X-MBX-USED-WEIGHT-1M 为准（反映整个 IP 在当前分钟已用的权重，多进程、多机器共用
+出口 IP 时也准确），两次响应之间按接口权重本地累加估算。已用权重接近上限时先等到下一分钟再发请求；
+收到 429 / 418 时按 Retry-After 等待，网络错误和 5xx 按指数退避加随机抖动重试。
+
+环境变量 BINANCE_API_BASE 可以把所有请求指向本地模拟服务。
+"""
+import os
+import random
+import threading
+import time
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+BINANCE_API_BASE = os.environ.get('BINANCE_API_BASE', 'https://api.binance.com')
+
+# 币安K线周期对应的毫秒数（与 kline_store.INTERVAL_MS 相同，这里不反向依赖）
+_INTERVAL_MS = {'s': 1000, 'm': 60_000, 'h': 3_600_000, 'd': 86_400_000, 'w': 604_800_000}
+
+
+class RestClient(object):
+    """
+    weight_limit 为每分钟权重上限（币安现货 6000），safety 为开始限速的比例；
+    weight_header 为 None 时不做权重计数（例如 CoinGecko）。
+    """
+
+    def __init__(self, base_url, weight_limit=6000, safety=0.8, weight_header='X-MBX-USED-WEIGHT-1M',
+                 max_retries=5, backoff=0.5, max_backoff=30.0, timeout=10, pool_size=16):
+        self.base_url = base_url.rstrip('/')
+        self.weight_limit = weight_limit
+        self.safety = safety
+        self.weight_header = weight_header
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._lock = threading.Lock()
+        self.used_weight = 0        # 当前分钟已用权重（响应头 + 本地估算）
+        self._minute = None         # used_weight 对应的分钟
+        self.banned_until = 0.0     # 429 / 418 之后的等待截止时间
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0.0        # 因限速累计等待的秒数
+
+    # ---- 权重计数与限速 ----
+    def _acquire(self, weight):
+        """发请求前预占权重，额度不够时等到下一分钟（或封禁结束）"""
+        if self.weight_header is None:
+            return
+        while True:
+            with self._lock:
+                now = time.time()
+                minute = int(now // 60)
+                if minute != self._minute:
+                    self._minute, self.used_weight = minute, 0
+                if now >= self.banned_until and self.used_weight + weight <= self.weight_limit * self.safety:
+                    self.used_weight += weight
+                    return
+                if now < self.banned_until:
+                    wait = self.banned_until - now
+                    message = f"⏳ 币安返回限频，{wait:.1f}s 后重试"
+                else:
+                    wait = (minute + 1) * 60 - now + random.uniform(0, 0.5)
+                    message = f"⏳ 币安权重 {self.used_weight}/{self.weight_limit}，等待 {wait:.1f}s"
+                self.throttled += wait
+            print(message)
+            time.sleep(wait)
+
+    def _update_weight(self, resp):
+        if self.weight_header is None:
+            return
+        used = resp.headers.get(self.weight_header) or resp.headers.get('X-MBX-USED-WEIGHT')
+        if used is None:
+            return
+        with self._lock:
+            minute = int(time.time() // 60)
+            if minute != self._minute:
+                self._minute, self.used_weight = minute, 0
+            # 响应头是服务端的权威值，只会比本地估算大（其他进程也在用同一个 IP）
+            self.used_weight = max(self.used_weight, int(used))
+
+    def _sleep_backoff(self, attempt):
+        # full jitter：在 [0, min(上限, base * 2^attempt)] 里随机，避免多个进程同时重试
+        time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+
+    # ---- 请求 ----
+    def get(self, path, params=None, weight=1):
+        """GET 并返回解析后的 JSON，失败重试 max_retries 次后抛出最后一次的异常"""
+        url = self.base_url + path
+        for attempt in range(self.max_retries + 1):
+            self._acquire(weight)
+            self.requests += 1
+            try:
+                resp = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                self._sleep_backoff(attempt)
+                continue
+
+            self._update_weight(resp)
+            if resp.status_code in (418, 429):
+                # 429 超限；418 为继续请求后被封 IP，两者都带 Retry-After（秒）
+                retry_after = float(resp.headers.get('Retry-After', 60))
+                with self._lock:
+                    self.banned_until = max(self.banned_until, time.time() + retry_after)
+                if attempt == self.max_retries:
+                    resp.raise_for_status()
+                self.retries += 1
+                continue
+            if resp.status_code >= 500 and attempt < self.max_retries:
+                self.retries += 1
+                self._sleep_backoff(attempt)
+                continue
+            resp.raise_for_status()
+            return resp.json()
+
+    # ---- 币安接口 ----
+    def get_klines(self, symbol, interval, start_ms=None, end_ms=None, limit=1000):
+        params = {'symbol': symbol, 'interval': interval, 'limit': limit}
+        if start_ms is not None:
+            params['startTime'] = int(start_ms)
+        if end_ms is not None:
+            params['endTime'] = int(end_ms)
+        return self.get('/api/v3/klines', params, weight=2)
+
+    def get_historical_klines(self, symbol, interval, start_str, end_str=None, limit=1000):
+        """
+        与 python-binance 的 Client.get_historical_klines 返回格式相同的分页下载。
+        start_str / end_str 可以是毫秒时间戳，也可以是 '1 Jan 2024 00:00:00' 这样的 UTC 时间字符串。
+        """
+        start = _to_ms(start_str)
+        end = _to_ms(end_str) if end_str is not None else None
+        step = int(interval[:-1]) * _INTERVAL_MS[interval[-1]] if interval[-1] in _INTERVAL_MS else 1
+        out = []
+        while True:
+            rows = self.get_klines(symbol, interval, start, end, limit)
+            out.extend(rows)
+            if len(rows) < limit:
+                return out
+            start = rows[-1][0] + step
+            if end is not None and start > end:
+                return out
+
+
+def _to_ms(value):
+    if isinstance(value, (int, float)):
+        return int(value)
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize('UTC')
+    return int(ts.timestamp() * 1000)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def binance_client(base_url=None):
+    """进程内共享的币安客户端（按 base_url 各一个）"""
+    base_url = base_url or BINANCE_API_BASE
+    with _clients_lock:
+        if base_url not in _clients:
+            _clients[base_url] = RestClient(base_url)
+        return _clients[base_url]
+
+
+def shared_client(base_url):
+    """进程内共享的普通 REST 客户端（不做币安权重计数），例如 CoinGecko"""
+    with _clients_lock:
+        if base_url not in _clients:
+            _clients[base_url] = RestClient(base_url, weight_header=None)
+        return _clients[base_url]
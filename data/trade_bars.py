@@ -0,0 +1,165 @@
+"""
+逐笔成交（aggTrades）流式接入与在线聚合成K线
+
+数据源、聚合器和输出都是生成器，成交按块（默认每块 100 万笔）流过整条管道，
+内存占用只和块大小有关，与文件里的成交总笔数无关：
+
+    chunks = read_agg_trades('BTCUSDT-aggTrades-2024-01.zip')
+    bars = aggregate_bars(chunks, 'time', 1000)        # 1 秒K线
+    store.append_chunks('BTCUSDT', '1s', bars)          # 写入K线仓库
+    cerebro.adddata(BarStreamData(bars=bars))           # 或直接喂给 backtrader
+
+每个块是 {列名: NumPy 数组} 的字典：成交块包含 time/price/qty，
+K线块包含 open_time/open/high/low/close/volume，与K线仓库的列一致。
+"""
+import io
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+# 币安公开数据 aggTrades 文件的列（部分月份的文件带表头）
+AGG_TRADE_COLUMNS = ['agg_trade_id', 'price', 'quantity', 'first_trade_id',
+                     'last_trade_id', 'transact_time', 'is_buyer_maker', 'is_best_match']
+
+# 时间K线周期的单位
+UNIT_MS = {'s': 1000, 'm': 60_000, 'h': 3_600_000, 'd': 86_400_000}
+
+
+def parse_interval(label):
+    """'1s' / '15m' / '4h' 这样的周期转成毫秒"""
+    return int(label[:-1]) * UNIT_MS[label[-1]]
+
+
+def _first_line(path):
+    if str(path).endswith('.zip'):
+        with zipfile.ZipFile(path) as zf:
+            with zf.open(zf.namelist()[0]) as f:
+                return io.TextIOWrapper(f).readline()
+    with open(path) as f:
+        return f.readline()
+
+
+def _to_ms(ts):
+    # 2025 年起现货公开数据的时间戳是微秒
+    return ts // 1000 if len(ts) and ts[0] > 10 ** 14 else ts
+
+
+def read_agg_trades(path, chunksize=1_000_000):
+    """逐块读取本地 aggTrades CSV 或 zip 文件"""
+    header = 0 if not _first_line(path)[:1].isdigit() else None
+    reader = pd.read_csv(path, header=header, names=AGG_TRADE_COLUMNS,
+                         usecols=['price', 'quantity', 'transact_time'],
+                         chunksize=chunksize, compression='infer')
+    for df in reader:
+        yield {
+            'time': _to_ms(df['transact_time'].to_numpy(dtype=np.int64)),
+            'price': df['price'].to_numpy(dtype=float),
+            'qty': df['quantity'].to_numpy(dtype=float),
+        }
+
+
+def fetch_agg_trades(symbol, start_ms, end_ms, base_url=None, limit=1000, client=None):
+    """
+    从 REST 接口 /api/v3/aggTrades 分页拉取 [start_ms, end_ms) 的成交，每页作为一个块。
+    base_url 可以指向本地的模拟服务，默认使用进程内共享的币安客户端。
+    """
+    if client is None:
+        from data.rest_client import binance_client
+        client = binance_client(base_url)
+
+    params = {'symbol': symbol, 'startTime': start_ms, 'limit': limit}
+    while True:
+        page = client.get('/api/v3/aggTrades', params, weight=4)
+        rows = [r for r in page if r['T'] < end_ms]
+        if rows:
+            yield {
+                'time': np.array([r['T'] for r in rows], dtype=np.int64),
+                'price': np.array([r['p'] for r in rows], dtype=float),
+                'qty': np.array([r['q'] for r in rows], dtype=float),
+            }
+        if len(page) < limit or len(rows) < len(page):
+            return
+        params = {'symbol': symbol, 'fromId': page[-1]['a'] + 1, 'limit': limit}
+
+
+def _bar_keys(chunks, kind, size):
+    """
+    给每笔成交分配所属K线的编号（单调不减）。
+    time：按时间桶；volume / dollar：按累计成交量（额）达到 size 的整数倍切分，
+    跨过阈值的那一笔计入它填满的那根K线，超出部分顺延到下一根。
+    """
+    total = 0.0
+    for chunk in chunks:
+        if kind == 'time':
+            keys = chunk['time'] // size
+        else:
+            amount = chunk['qty'] if kind == 'volume' else chunk['qty'] * chunk['price']
+            cum = total + np.cumsum(amount)
+            before = np.concatenate(([total], cum[:-1]))
+            keys = np.floor(before / size).astype(np.int64)
+            total = cum[-1] if len(cum) else total
+        yield chunk, keys
+
+
+def _strictly_increasing(open_time, prev):
+    """open_time[i] 不大于前一根时顺延到前一根 + 1 毫秒；prev 为上一块最后一根的 open_time"""
+    offset = np.arange(len(open_time))
+    shifted = open_time - offset
+    if prev is not None:
+        shifted[0] = max(shifted[0], prev + 1)
+    return np.maximum.accumulate(shifted) + offset
+
+
+def aggregate_bars(chunks, kind='time', size=60_000):
+    """
+    把成交块流聚合成K线块流。kind 为 'time'（size 为毫秒）、'volume'（基础币数量）
+    或 'dollar'（计价币成交额）。每个块末尾还没结束的那根K线留到下一块合并。
+    成交量 / 成交额K线的 open_time 是第一笔成交的时间，同一毫秒里切出多根K线时
+    后面的依次顺延 1 毫秒，保证 open_time 严格递增（K线仓库按 open_time 只追加更晚的K线）。
+    """
+    if kind == 'time':
+        yield from _aggregate_bars(chunks, kind, size)
+        return
+    prev = None
+    for bars in _aggregate_bars(chunks, kind, size):
+        bars['open_time'] = _strictly_increasing(bars['open_time'], prev)
+        prev = bars['open_time'][-1]
+        yield bars
+
+
+def _aggregate_bars(chunks, kind, size):
+    pending = None
+    for chunk, keys in _bar_keys(chunks, kind, size):
+        if not len(keys):
+            continue
+        price, qty, t = chunk['price'], chunk['qty'], chunk['time']
+        starts = np.r_[0, np.flatnonzero(np.diff(keys)) + 1]
+        ends = np.r_[starts[1:], len(keys)]
+        bars = {
+            'key': keys[starts],
+            'open_time': keys[starts] * size if kind == 'time' else t[starts],
+            'open': price[starts],
+            'high': np.maximum.reduceat(price, starts),
+            'low': np.minimum.reduceat(price, starts),
+            'close': price[ends - 1],
+            'volume': np.add.reduceat(qty, starts),
+        }
+
+        # 与上一块遗留的未完成K线合并
+        if pending is not None:
+            if pending['key'][0] == bars['key'][0]:
+                bars['open_time'][0] = pending['open_time'][0]
+                bars['open'][0] = pending['open'][0]
+                bars['high'][0] = max(bars['high'][0], pending['high'][0])
+                bars['low'][0] = min(bars['low'][0], pending['low'][0])
+                bars['volume'][0] += pending['volume'][0]
+            else:
+                yield {k: v for k, v in pending.items() if k != 'key'}
+
+        pending = {k: v[-1:] for k, v in bars.items()}
+        if len(starts) > 1:
+            yield {k: v[:-1] for k, v in bars.items() if k != 'key'}
+
+    if pending is not None:
+        yield {k: v for k, v in pending.items() if k != 'key'}
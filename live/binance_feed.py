@@ -0,0 +1,118 @@
+"""
+币安K线 websocket 实时数据源
+
+启动时先用 REST 拉最近 history 根已收盘K线给指标预热，之后订阅 <symbol>@kline_<interval>，
+只把已收盘（k.x 为 true）的K线交给回测引擎。websocket 在后台线程里运行，断线自动重连；
+每根实时K线的收到、解析、取出都会在 tracer 上打点。
+
+环境变量 BINANCE_WS_BASE 可以指向本地的模拟服务。
+"""
+import collections
+import datetime
+import json
+import os
+import queue
+import threading
+import time
+
+import backtrader as bt
+
+from data.feeds import EPOCH, bar_timeframe
+from data.rest_client import binance_client
+
+BINANCE_WS_BASE = os.environ.get('BINANCE_WS_BASE', 'wss://stream.binance.com:9443/ws')
+
+
+class BinanceKlineData(bt.feed.DataBase):
+    params = (
+        ('symbol', 'BTCUSDT'),
+        ('interval', '1m'),
+        ('history', 500),       # 预热用的历史K线根数，0 为不预热
+        ('ws_base', None),      # 默认 BINANCE_WS_BASE
+        ('tracer', None),       # LatencyTracer
+        ('qcheck', 0.5),        # 没有新K线时每隔多久让引擎检查一次（秒）
+    )
+
+    def __init__(self):
+        for name, value in bar_timeframe(self.p.interval).items():
+            setattr(self.p, name, value)
+        self._history = collections.deque()
+        self._queue = queue.Queue()
+        self._last_time = None  # 已交给引擎的最后一根K线的开盘时间
+        self._ws = None
+
+    def islive(self):
+        return True
+
+    def haslivedata(self):
+        return bool(self._history) or not self._queue.empty()
+
+    def start(self):
+        super(BinanceKlineData, self).start()
+        if self.p.history:
+            rows = binance_client().get_klines(self.p.symbol, self.p.interval, limit=self.p.history + 1)
+            now_ms = time.time() * 1000
+            # 最后一根通常还没收盘
+            self._history.extend(tuple(float(x) for x in r[:6]) for r in rows if r[6] < now_ms)
+
+        import websocket
+        url = f"{self.p.ws_base or BINANCE_WS_BASE}/{self.p.symbol.lower()}@kline_{self.p.interval}"
+        self._ws = websocket.WebSocketApp(url, on_message=self._on_message)
+        threading.Thread(target=self._ws.run_forever, kwargs={'reconnect': 5}, daemon=True).start()
+
+    def stop(self):
+        if self._ws is not None:
+            self._ws.close(timeout=1)
+        super(BinanceKlineData, self).stop()
+
+    def _on_message(self, ws, message):
+        received = time.perf_counter_ns()
+        msg = json.loads(message)
+        k = msg.get('k')
+        if not k or not k['x']:
+            return
+        key = k['t']
+        if self.p.tracer is not None:
+            self.p.tracer.begin(key, event_ms=msg['E'], start_ns=received)
+        bar = (key, float(k['o']), float(k['h']), float(k['l']), float(k['c']), float(k['v']))
+        # 放进队列之前打点：放进去之后引擎线程随时可能取走并打 dispatch
+        if self.p.tracer is not None:
+            self.p.tracer.mark('finalize', key)
+        self._queue.put(bar)
+
+    def _load(self):
+        tracer = self.p.tracer
+        while True:
+            if self._history:
+                bar = self._history.popleft()
+                if tracer is not None:
+                    tracer.activate(None)
+            else:
+                try:
+                    bar = self._queue.get(timeout=self._qcheck)
+                except queue.Empty:
+                    return None
+                if bar is None:
+                    self._queue.put(None)   # 引擎之后还会再来取，保持结束状态
+                    return False
+                if tracer is not None:
+                    tracer.activate(bar[0])
+                    tracer.mark('dispatch')
+            # 重连后可能重复推送已经处理过的K线
+            if self._last_time is not None and bar[0] <= self._last_time:
+                continue
+            self._last_time = bar[0]
+            break
+
+        self.lines.datetime[0] = bt.date2num(EPOCH + datetime.timedelta(milliseconds=int(bar[0])))
+        self.lines.open[0] = bar[1]
+        self.lines.high[0] = bar[2]
+        self.lines.low[0] = bar[3]
+        self.lines.close[0] = bar[4]
+        self.lines.volume[0] = bar[5]
+        self.lines.openinterest[0] = 0.0
+        return True
+
+    def finish(self):
+        """让引擎在处理完已收到的K线后结束运行"""
+        self._queue.put(None)
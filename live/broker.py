@@ -0,0 +1,246 @@
+"""
+接交易所的 backtrader broker：订单交给 OrderExecutor 异步发出，成交来自用户数据流
+
+策略里照常调用 self.buy / self.sell / self.cancel，调用立即返回；订单状态按交易所的回报推进：
+Submitted（交给执行器）-> Accepted（交易所确认）-> Partial / Completed（executionReport 成交），
+或 Rejected / Canceled / Expired。配合 Cerebro(quicknotify=True) 使用，回报在引擎下一次轮询
+（最长 qcheck 秒）时就通过 notify_order / notify_trade 交给策略，不必等下一根K线。
+
+只支持市价单和限价单；资金按初始 cash 与成交回报记账（手续费按计价币种扣除），不读取账户余额。
+"""
+import collections
+import threading
+import time
+
+import backtrader as bt
+
+
+class LiveBroker(bt.broker.BrokerBase):
+    params = (
+        ('executor', None),   # OrderExecutor
+        ('cash', 10000.0),
+        ('tracer', None),     # LatencyTracer
+    )
+
+    def __init__(self):
+        super(LiveBroker, self).__init__()
+        self.startingcash = self.cash = self.p.cash
+        self.positions = collections.defaultdict(bt.Position)
+        self.orders = {}          # clientOrderId -> Order
+        self.notifs = collections.deque()
+        self._inflight = collections.Counter()   # 追踪 key -> 尚未确认的订单数
+        self._tracing = {}                        # clientOrderId -> 追踪 key（确认或拒绝后移除）
+        self._lock = threading.Lock()
+
+    def start(self):
+        super(LiveBroker, self).start()
+        self.startingcash = self.cash = self.p.cash
+
+    # ---- 账户 ----
+    def getcash(self):
+        return self.cash
+
+    def setcash(self, cash):
+        self.startingcash = self.cash = self.p.cash = cash
+
+    def getvalue(self, datas=None):
+        value = self.cash
+        for data, pos in self.positions.items():
+            if pos.size and (datas is None or data in datas) and len(data):
+                value += pos.size * data.close[0]
+        return value
+
+    def getposition(self, data, clone=True):
+        pos = self.positions[data]
+        return pos.clone() if clone else pos
+
+    def get_notification(self):
+        return self.notifs.popleft() if self.notifs else None
+
+    def notify(self, order):
+        self.notifs.append(order.clone())
+
+    # ---- 下单 ----
+    # 数量先按交易所精度取整，订单的 size 与实际发出的数量一致，全部成交后才会是 Completed
+    def buy(self, owner, data, size, price=None, plimit=None, exectype=None, valid=None, tradeid=0,
+            oco=None, trailamount=None, trailpercent=None, parent=None, transmit=True, **kwargs):
+        size = self.p.executor.round_quantity(_symbol(data), abs(size))
+        order = bt.BuyOrder(owner=owner, data=data, size=size, price=price, pricelimit=plimit,
+                            exectype=exectype, valid=valid, tradeid=tradeid)
+        return self.submit(order)
+
+    def sell(self, owner, data, size, price=None, plimit=None, exectype=None, valid=None, tradeid=0,
+             oco=None, trailamount=None, trailpercent=None, parent=None, transmit=True, **kwargs):
+        size = self.p.executor.round_quantity(_symbol(data), abs(size))
+        order = bt.SellOrder(owner=owner, data=data, size=size, price=price, pricelimit=plimit,
+                             exectype=exectype, valid=valid, tradeid=tradeid)
+        return self.submit(order)
+
+    def submit(self, order):
+        tracer = self.p.tracer
+        key = tracer.current if tracer is not None else None
+        if tracer is not None:
+            tracer.mark('order_build')
+
+        if order.exectype not in (None, bt.Order.Market, bt.Order.Limit) or not order.size:
+            order.reject(self)
+            self.notify(order)
+            return order
+
+        order.addcomminfo(self.getcommissioninfo(order.data))
+        client_id = self.p.executor.client_order_id(order.ref)
+        order.client_id = client_id
+        self.orders[client_id] = order
+        order.submit(self)
+        self.notify(order)
+
+        on_sent = on_ack = None
+        if tracer is not None and key is not None:
+            # 同一根K线的多笔订单并发发出：submit / ack 按订单各记一个样本，最后一笔确认或拒绝时结束追踪
+            sent = [time.perf_counter_ns()]
+            with self._lock:
+                self._inflight[key] += 1
+                self._tracing[client_id] = key
+
+            def on_sent():
+                now = time.perf_counter_ns()
+                tracer.record('submit', (now - sent[0]) / 1e6)
+                sent[0] = now
+
+            def on_ack():
+                tracer.record('ack', (time.perf_counter_ns() - sent[0]) / 1e6)
+                self._settle(client_id)
+
+        price = order.price if order.exectype == bt.Order.Limit else None
+        future = self.p.executor.place(client_id, _symbol(order.data), 'BUY' if order.isbuy() else 'SELL',
+                                       abs(order.size), price, on_sent=on_sent, on_ack=on_ack)
+        future.add_done_callback(lambda f: self._placed(client_id, f))
+        return order
+
+    def _placed(self, client_id, future):
+        """
+        下单协程结束时在事件循环线程里调用。正常结束时 ack / reject 事件已经发出；
+        协程意外抛出异常（或被取消）时订单在交易所的状态未知，交给 next() 查询后处理，
+        否则订单会一直停在 Submitted。
+        """
+        error = 'cancelled' if future.cancelled() else future.exception()
+        if error is not None:
+            self.p.executor.events.put(('unknown', client_id, error))
+
+    def _settle(self, client_id):
+        """订单确认或拒绝：这根K线的订单都有了结果时结束追踪"""
+        with self._lock:
+            key = self._tracing.pop(client_id, None)
+            if key is None:
+                return
+            self._inflight[key] -= 1
+            done = self._inflight[key] <= 0
+            if done:
+                del self._inflight[key]
+        if done:
+            self.p.tracer.close(key)
+
+    def cancel(self, order):
+        if order.alive():
+            self.p.executor.cancel(order.client_id, _symbol(order.data))
+        return order
+
+    # ---- 回报 ----
+    def next(self):
+        events = self.p.executor.events
+        while not events.empty():
+            kind, client_id, payload = events.get_nowait()
+            if kind == 'reconnected':
+                self._reconcile()
+                continue
+            order = self.orders.get(client_id)
+            if order is None or not order.alive():
+                continue
+            if kind == 'ack':
+                if order.status == order.Submitted:
+                    order.accept(self)
+                    self.notify(order)
+            elif kind == 'reject':
+                print(f"❌ 订单 {client_id} 被拒绝: {payload}")
+                self._settle(client_id)
+                order.reject(self)
+                self.notify(order)
+            elif kind == 'unknown':
+                print(f"⚠️ 订单 {client_id} 下单异常，查询交易所确认状态: {payload!r}")
+                self._settle(client_id)
+                self._resolve(client_id, order)
+            elif kind == 'report':
+                self._on_report(order, payload)
+
+    def _on_report(self, order, report):
+        if order.status == order.Submitted:
+            # 用户数据流的推送可能先于下单请求的响应到达
+            order.accept(self)
+            self.notify(order)
+        if report['x'] == 'TRADE':
+            size = float(report['l']) * (1 if order.isbuy() else -1)
+            # 手续费以计价币种收取时直接扣现金；以 BNB 等其他币种收取时只记录不扣
+            quote = report.get('N') and report['s'].endswith(report['N'])
+            self._fill(order, size, float(report['L']), float(report['n']) if quote else 0.0)
+        elif report['X'] in ('CANCELED', 'EXPIRED', 'REJECTED', 'EXPIRED_IN_MATCH') and order.alive():
+            {'CANCELED': order.cancel, 'REJECTED': order.reject}.get(report['X'], order.expire)()
+            self.notify(order)
+
+    def _fill(self, order, size, price, comm):
+        data, comminfo = order.data, order.comminfo
+        pos = self.positions[data]
+        pprice_orig = pos.price
+        psize, pprice, opened, closed = pos.update(size, price)
+        self.cash -= size * price + comm
+
+        # 手续费按开仓 / 平仓数量分摊，TradeAnalyzer 等分析器据此计算盈亏
+        closedcomm = comm * abs(closed) / abs(size) if size else 0.0
+        order.execute(data.datetime[0], size, price,
+                      closed, comminfo.getoperationcost(closed, pprice_orig), closedcomm,
+                      opened, comminfo.getoperationcost(opened, price), comm - closedcomm,
+                      0.0, comminfo.profitandloss(-closed, pprice_orig, price) if closed else 0.0,
+                      psize, pprice)
+        # 成交数量是交易所的十进制字符串累加，容忍浮点误差
+        if abs(order.executed.remsize) > 1e-9 * abs(order.size):
+            order.partial()
+        else:
+            order.completed()
+        self.notify(order)
+
+    def _reconcile(self):
+        """用户数据流重连后，查询未完成订单，把断线期间漏掉的成交补上（按均价）"""
+        for client_id, order in list(self.orders.items()):
+            if not order.alive():
+                continue
+            status = self.p.executor.query(client_id, _symbol(order.data))
+            if status is not None:
+                self._apply_status(order, status)
+
+    def _resolve(self, client_id, order):
+        """下单结果未知的订单：交易所查不到（或查询失败）按拒绝处理，查到就按查询结果推进"""
+        try:
+            status = self.p.executor.query(client_id, _symbol(order.data))
+        except Exception as e:
+            print(f"❌ 订单 {client_id} 状态查询失败，按拒绝处理: {e}")
+            status = None
+        if status is None:
+            order.reject(self)
+            self.notify(order)
+            return
+        if order.status == order.Submitted:
+            order.accept(self)
+            self.notify(order)
+        self._apply_status(order, status)
+
+    def _apply_status(self, order, status):
+        missed = float(status['executedQty']) - abs(order.executed.size)
+        if missed > 0:
+            price = float(status['cummulativeQuoteQty']) / float(status['executedQty'])
+            self._fill(order, missed if order.isbuy() else -missed, price, 0.0)
+        if status['status'] in ('CANCELED', 'EXPIRED', 'REJECTED') and order.alive():
+            order.cancel()
+            self.notify(order)
+
+
+def _symbol(data):
+    return getattr(data.p, 'symbol', None) or data._name
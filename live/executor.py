@@ -0,0 +1,268 @@
+"""
+异步下单执行器
+
+backtrader 的 buy / sell 是同步调用。多个币种在同一根K线收盘后一起下单时，
+如果每笔都阻塞在一次 REST 请求上，后面的订单要排队等前面的往返。
+OrderExecutor 在后台线程里跑一个 asyncio 事件循环，共用一个 aiohttp 连接池。
+place() 把订单交给事件循环后立即返回，同一根K线上的订单并发发出，并发数受 concurrency 限制。
+成交通过用户数据流（listenKey websocket）的 executionReport 推送。
+
+    executor = OrderExecutor(api_key, api_secret).start()
+    executor.place('cq1a2b-17', 'BTCUSDT', 'BUY', 0.01)
+    kind, client_id, payload = executor.events.get()   # ('ack' | 'reject' | 'report' | 'reconnected', ...)
+
+幂等：每个订单带固定的 newClientOrderId，重试时不变。
+网络错误、超时或 5xx 时请求可能已经到达交易所（币安 5xx 表示执行状态未知），
+这时先按 clientOrderId 查询订单：查到就当作已受理，查不到才用同一个 id 重发；
+交易所返回重复订单时也按查询结果处理，所以同一个订单不会被下两次。
+响应不是 JSON（例如网关返回的 HTML 502）时同样当作状态未知处理。
+
+环境变量 BINANCE_API_BASE / BINANCE_WS_BASE 可以指向本地模拟交易所（live/mock_exchange.py）。
+"""
+import asyncio
+import decimal
+import hashlib
+import hmac
+import json
+import os
+import queue
+import random
+import threading
+import time
+from urllib.parse import urlencode
+
+import aiohttp
+
+BINANCE_API_BASE = os.environ.get('BINANCE_API_BASE', 'https://api.binance.com')
+BINANCE_WS_BASE = os.environ.get('BINANCE_WS_BASE', 'wss://stream.binance.com:9443/ws')
+
+
+class OrderError(Exception):
+    """交易所返回的错误：status 为 HTTP 状态码，code / msg 为币安的错误码和说明"""
+
+    def __init__(self, status, code=None, msg='', retry_after=None):
+        super(OrderError, self).__init__(f"HTTP {status} {code}: {msg}")
+        self.status, self.code, self.msg, self.retry_after = status, code, msg, retry_after
+
+
+def round_step(value, step):
+    """按交易所的 stepSize / tickSize 向下取整，返回不带多余 0 的字符串"""
+    step = decimal.Decimal(step)
+    if not step:
+        return format(decimal.Decimal(str(value)).normalize(), 'f')
+    rounded = (decimal.Decimal(str(value)) // step) * step
+    return format(rounded.normalize(), 'f')
+
+
+class OrderExecutor(object):
+    def __init__(self, api_key, api_secret, base_url=None, ws_base=None, concurrency=20,
+                 max_retries=3, recv_window=5000, keepalive=1800, prefix='cq'):
+        self.api_key = api_key
+        self.api_secret = api_secret.encode()
+        self.base_url = (base_url or BINANCE_API_BASE).rstrip('/')
+        self.ws_base = (ws_base or BINANCE_WS_BASE).rstrip('/')
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.recv_window = recv_window
+        self.keepalive = keepalive
+        # 进程每次启动的前缀不同，重启后不会与上次运行的订单 id 冲突
+        self.prefix = f"{prefix}{int(time.time()) % 10 ** 8:x}"
+
+        self.events = queue.Queue()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._filters = {}
+        self._tasks = []
+
+    # ---- 生命周期（在调用方线程里调用） ----
+    def start(self):
+        self._thread.start()
+        self._run(self._start())
+        return self
+
+    def stop(self):
+        self._run(self._stop())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def _start(self):
+        connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60)
+        self._session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=10),
+                                              headers={'X-MBX-APIKEY': self.api_key})
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._listen_key = (await self._request('POST', '/api/v3/userDataStream'))['listenKey']
+        self._stream_ready = asyncio.Event()
+        self._tasks = [asyncio.ensure_future(self._user_stream()), asyncio.ensure_future(self._keepalive())]
+        await asyncio.wait_for(self._stream_ready.wait(), 10)
+
+    async def _stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self._session.close()
+
+    # ---- 对外接口（线程安全，立即返回 concurrent.futures.Future） ----
+    def client_order_id(self, ref):
+        return f"{self.prefix}-{ref}"
+
+    def prepare(self, symbols):
+        """并发读取各交易对的下单精度并缓存，之后 round_quantity 不需要网络请求"""
+        async def load():
+            await asyncio.gather(*(self._symbol_filters(s) for s in symbols))
+        self._run(load())
+
+    def round_quantity(self, symbol, quantity):
+        """按交易对的 stepSize 向下取整，返回浮点数（第一次遇到的交易对会阻塞读取一次精度）"""
+        if symbol not in self._filters:
+            self.prepare([symbol])
+        return float(round_step(quantity, self._filters[symbol][0]))
+
+    def place(self, client_id, symbol, side, quantity, price=None, on_sent=None, on_ack=None):
+        """
+        下单：price 为 None 时为市价单，否则为 GTC 限价单。
+        on_sent / on_ack 在事件循环线程里调用，分别在请求发出前、交易所确认后。
+        """
+        params = {'symbol': symbol, 'side': side, 'newClientOrderId': client_id, 'newOrderRespType': 'ACK'}
+        if price is None:
+            params['type'] = 'MARKET'
+        else:
+            params.update({'type': 'LIMIT', 'timeInForce': 'GTC', 'price': price})
+        return asyncio.run_coroutine_threadsafe(self._place(params, quantity, on_sent, on_ack), self._loop)
+
+    def cancel(self, client_id, symbol):
+        return asyncio.run_coroutine_threadsafe(self._cancel(client_id, symbol), self._loop)
+
+    def query(self, client_id, symbol):
+        """按 clientOrderId 查询订单，不存在时返回 None（阻塞到结果返回）"""
+        return self._run(self._query(client_id, symbol))
+
+    # ---- 请求 ----
+    async def _request(self, method, path, params=None, signed=False):
+        params = dict(params or {})
+        if signed:
+            params.update({'timestamp': int(time.time() * 1000), 'recvWindow': self.recv_window})
+            query = urlencode(params)
+            params['signature'] = hmac.new(self.api_secret, query.encode(), hashlib.sha256).hexdigest()
+        async with self._session.request(method, self.base_url + path, params=params) as resp:
+            text = await resp.text()
+            try:
+                body = json.loads(text)
+            except ValueError:
+                # 网关 / 负载均衡返回的 HTML 错误页等：没有错误码，状态按 HTTP 状态码判断
+                body = None
+            if resp.status >= 400 or body is None:
+                error = body if isinstance(body, dict) else {}
+                raise OrderError(resp.status, error.get('code'), error.get('msg', text[:200]),
+                                 float(resp.headers.get('Retry-After', 0)) or None)
+            return body
+
+    async def _symbol_filters(self, symbol):
+        if symbol not in self._filters:
+            info = await self._request('GET', '/api/v3/exchangeInfo', {'symbol': symbol})
+            filters = {f['filterType']: f for f in info['symbols'][0]['filters']}
+            self._filters[symbol] = (filters.get('LOT_SIZE', {}).get('stepSize', '0'),
+                                     filters.get('PRICE_FILTER', {}).get('tickSize', '0'))
+        return self._filters[symbol]
+
+    async def _query(self, client_id, symbol):
+        try:
+            return await self._request('GET', '/api/v3/order',
+                                       {'symbol': symbol, 'origClientOrderId': client_id}, signed=True)
+        except OrderError as e:
+            if e.code == -2013:   # Order does not exist
+                return None
+            raise
+
+    async def _place(self, params, quantity, on_sent, on_ack):
+        client_id, symbol = params['newClientOrderId'], params['symbol']
+        async with self._semaphore:
+            try:
+                step, tick = await self._symbol_filters(symbol)
+                params['quantity'] = round_step(quantity, step)
+                if 'price' in params:
+                    params['price'] = round_step(params['price'], tick)
+            except (OrderError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.events.put(('reject', client_id, str(e)))
+                return None
+
+            for attempt in range(self.max_retries + 1):
+                unknown = False
+                try:
+                    if on_sent is not None:
+                        on_sent()
+                    resp = await self._request('POST', '/api/v3/order', params, signed=True)
+                except OrderError as e:
+                    if e.status in (418, 429):
+                        await asyncio.sleep(e.retry_after or 1.0)
+                        continue
+                    # 5xx 或 2xx 但响应无法解析：执行状态未知；-2010 重复订单：之前某次重试其实已经成功
+                    unknown = e.status >= 500 or e.status < 400 or (e.code == -2010 and 'uplicate' in e.msg)
+                    if not unknown:
+                        self.events.put(('reject', client_id, str(e)))
+                        return None
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    unknown = True
+
+                if unknown:
+                    try:
+                        resp = await self._query(client_id, symbol)
+                    except (OrderError, aiohttp.ClientError, asyncio.TimeoutError):
+                        resp = None
+                    if resp is None:
+                        # full jitter 退避后用同一个 clientOrderId 重发
+                        await asyncio.sleep(random.uniform(0, 0.2 * 2 ** attempt))
+                        continue
+
+                if on_ack is not None:
+                    on_ack()
+                self.events.put(('ack', client_id, resp))
+                return resp
+
+            self.events.put(('reject', client_id, f"重试 {self.max_retries} 次后仍失败"))
+            return None
+
+    async def _cancel(self, client_id, symbol):
+        try:
+            return await self._request('DELETE', '/api/v3/order',
+                                       {'symbol': symbol, 'origClientOrderId': client_id}, signed=True)
+        except (OrderError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # 撤单失败（例如已经成交）不改变订单状态，以用户数据流的推送为准
+            print(f"⚠️ 撤单失败 {client_id}: {e}")
+            return None
+
+    # ---- 用户数据流 ----
+    async def _user_stream(self):
+        first = True
+        while True:
+            try:
+                async with self._session.ws_connect(f"{self.ws_base}/{self._listen_key}", heartbeat=30) as ws:
+                    if first:
+                        self._stream_ready.set()
+                        first = False
+                    else:
+                        # 断线期间的成交可能没有推送，由 broker 查询未完成订单补齐
+                        self.events.put(('reconnected', None, None))
+                    async for msg in ws:
+                        if msg.type != aiohttp.WSMsgType.TEXT:
+                            continue
+                        event = json.loads(msg.data)
+                        if event.get('e') == 'executionReport':
+                            # 撤单回报里 c 是撤单请求的 id，原订单的 id 在 C
+                            client_id = event['C'] if event.get('x') == 'CANCELED' and event.get('C') else event['c']
+                            self.events.put(('report', client_id, event))
+            except asyncio.CancelledError:
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"⚠️ 用户数据流断开，1 秒后重连: {e}")
+            await asyncio.sleep(1.0)
+
+    async def _keepalive(self):
+        while True:
+            await asyncio.sleep(self.keepalive)
+            try:
+                await self._request('PUT', '/api/v3/userDataStream', {'listenKey': self._listen_key})
+            except (OrderError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"⚠️ listenKey 续期失败: {e}")
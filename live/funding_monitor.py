@@ -0,0 +1,336 @@
+"""
+资金费率实时监控：币安与 Bybit 永续合约的资金费率差
+
+FundingRateArbitrage 在两个交易所的资金费率相差超过 funding_rate_threshold（百分比）时开仓，
+原来只能在历史数据上回测。这里订阅两个交易所的标记价格 / 资金费率推送：
+
+    币安   <binance-ws>/!markPrice@arr@1s     一条推送包含全部永续合约
+    Bybit  <bybit-ws> 订阅 tickers.<symbol>   按交易对推送（增量里可能没有 fundingRate）
+
+最新费率存在预先分配的 (2, 交易对数) 数组里，交易对按 --symbols 的顺序编号。每条推送只重新判断
+推送里出现的交易对：费率差超过阈值时发出 open 事件，回到阈值以内时发出 close 事件。
+每条推送的处理耗时（收到消息 -> 判断完，含回调）和每个事件的耗时（收到消息 -> 交给回调）记录在延迟直方图里，
+与 live.run 一样可以从 /metrics 读取。
+
+    python -m live.funding_monitor watch --threshold 0.02 --events output/funding_events.jsonl
+    python -m live.funding_monitor mock --port 8790 --symbols-count 300     # 本地模拟两个交易所的推送
+    python -m live.funding_monitor watch --binance-ws ws://127.0.0.1:8790/binance \
+        --bybit-ws ws://127.0.0.1:8790/bybit --symbols-count 300
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+import aiohttp
+import numpy as np
+
+from live.latency import LatencyTracer, MetricsServer
+from strategies.FundingRateArbitrage import FundingRateArbitrage
+
+BINANCE_FUTURES_WS = os.environ.get('BINANCE_FUTURES_WS', 'wss://fstream.binance.com/ws')
+BINANCE_FUTURES_API = os.environ.get('BINANCE_FUTURES_API', 'https://fapi.binance.com')
+BYBIT_WS = os.environ.get('BYBIT_WS', 'wss://stream.bybit.com/v5/public/linear')
+
+EXCHANGES = ('binance', 'bybit')
+STAGES = ('receive', 'process', 'emit')
+
+
+class FundingMonitor(object):
+    """
+    rates[0] 为币安、rates[1] 为 Bybit 的最新资金费率（百分比），还没有推送过的为 NaN（不会触发）。
+    on_event(event) 在处理推送的线程里同步调用，应尽快返回。
+    """
+
+    def __init__(self, symbols, threshold=FundingRateArbitrage.params.funding_rate_threshold,
+                 on_event=None, tracer=None):
+        self.symbols = list(symbols)
+        self.index = {s: i for i, s in enumerate(self.symbols)}
+        self.threshold = threshold
+        self.on_event = on_event
+        self.tracer = tracer
+        self.rates = np.full((2, len(self.symbols)), np.nan)
+        self.active = np.zeros(len(self.symbols), dtype=bool)
+        self.updates = 0
+        self.events = 0
+
+    def update(self, exchange, rows, rates, received_ns=None, event_ms=None):
+        """
+        写入一条推送（同一交易所的若干交易对）并只重新判断这些交易对。
+        rows 为交易对编号，rates 为对应的资金费率（百分比）。
+        """
+        received_ns = time.perf_counter_ns() if received_ns is None else received_ns
+        rows = np.asarray(rows, dtype=np.int64)
+        self.rates[exchange, rows] = rates
+        spread = self.rates[0, rows] - self.rates[1, rows]
+        hit = np.abs(spread) > self.threshold        # NaN 比较为 False
+        changed = np.flatnonzero(hit != self.active[rows])
+        self.updates += 1
+
+        if len(changed):
+            self.active[rows[changed]] = hit[changed]
+            now_ms = time.time() * 1000
+            for k in changed:
+                row = rows[k]
+                event = {
+                    'type': 'open' if hit[k] else 'close',
+                    'symbol': self.symbols[row],
+                    'binance': round(float(self.rates[0, row]), 8),
+                    'bybit': round(float(self.rates[1, row]), 8),
+                    'spread': round(float(spread[k]), 8),
+                    # 与 FundingRateArbitrage.next 相同：费率高的一边做空，低的一边做多
+                    'short': EXCHANGES[0] if spread[k] > 0 else EXCHANGES[1],
+                    'long': EXCHANGES[1] if spread[k] > 0 else EXCHANGES[0],
+                    'time': int(now_ms),
+                }
+                self.events += 1
+                if self.tracer is not None:
+                    self.tracer.record('emit', (time.perf_counter_ns() - received_ns) / 1e6)
+                if self.on_event is not None:
+                    self.on_event(event)
+
+        if self.tracer is not None:
+            elapsed = (time.perf_counter_ns() - received_ns) / 1e6
+            self.tracer.record('process', elapsed)
+            if event_ms is not None:
+                # 交易所事件时间 -> 本地收到（墙钟差，含两边时钟偏差）
+                self.tracer.record('receive', time.time() * 1000 - elapsed - event_ms)
+        return len(changed)
+
+    def opportunities(self):
+        """当前超过阈值的交易对，按费率差绝对值从大到小"""
+        rows = np.flatnonzero(self.active)
+        spread = self.rates[0, rows] - self.rates[1, rows]
+        order = np.argsort(-np.abs(spread))
+        return [(self.symbols[rows[i]], float(spread[i])) for i in order]
+
+    # ---- 推送解析 ----
+    def on_binance(self, message, received_ns):
+        """!markPrice@arr：[{'s': 'BTCUSDT', 'r': '0.00010000', 'E': ...}, ...]，r 为小数"""
+        items = json.loads(message)
+        rows, rates = [], []
+        for item in items:
+            row = self.index.get(item['s'])
+            if row is not None and item.get('r'):
+                rows.append(row)
+                rates.append(float(item['r']) * 100)
+        if rows:
+            self.update(0, rows, rates, received_ns, items[0].get('E'))
+
+    def on_bybit(self, message, received_ns):
+        """tickers.<symbol>：{'topic': ..., 'ts': ..., 'data': {'symbol': ..., 'fundingRate': '0.0001'}}"""
+        msg = json.loads(message)
+        data = msg.get('data')
+        if not msg.get('topic', '').startswith('tickers.') or not data or not data.get('fundingRate'):
+            return
+        row = self.index.get(data['symbol'])
+        if row is not None:
+            self.update(1, [row], [float(data['fundingRate']) * 100], received_ns, msg.get('ts'))
+
+
+async def _binance_stream(session, monitor, ws_base):
+    url = f"{ws_base.rstrip('/')}/!markPrice@arr@1s"
+    while True:
+        try:
+            async with session.ws_connect(url, heartbeat=30) as ws:
+                async for msg in ws:
+                    if msg.type == aiohttp.WSMsgType.TEXT:
+                        monitor.on_binance(msg.data, time.perf_counter_ns())
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"⚠️ 币安推送断开，1 秒后重连: {e}")
+        await asyncio.sleep(1.0)
+
+
+async def _bybit_stream(session, monitor, url, symbols):
+    while True:
+        try:
+            async with session.ws_connect(url) as ws:
+                # Bybit 每次订阅请求最多 10 个主题
+                for i in range(0, len(symbols), 10):
+                    await ws.send_json({'op': 'subscribe', 'args': [f"tickers.{s}" for s in symbols[i:i + 10]]})
+                ping = asyncio.ensure_future(_bybit_ping(ws))
+                try:
+                    async for msg in ws:
+                        if msg.type == aiohttp.WSMsgType.TEXT:
+                            monitor.on_bybit(msg.data, time.perf_counter_ns())
+                finally:
+                    ping.cancel()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"⚠️ Bybit 推送断开，1 秒后重连: {e}")
+        await asyncio.sleep(1.0)
+
+
+async def _bybit_ping(ws):
+    while not ws.closed:
+        await asyncio.sleep(20)
+        await ws.send_json({'op': 'ping'})
+
+
+def perpetual_symbols(limit=None):
+    """币安 U 本位在交易的永续合约"""
+    from data.rest_client import shared_client
+    info = shared_client(BINANCE_FUTURES_API).get('/fapi/v1/exchangeInfo')
+    symbols = [s['symbol'] for s in info['symbols']
+               if s.get('contractType') == 'PERPETUAL' and s.get('quoteAsset') == 'USDT' and s.get('status') == 'TRADING']
+    return symbols[:limit] if limit else symbols
+
+
+def mock_symbols(n):
+    return ['BTCUSDT', 'ETHUSDT'] + [f"C{i:03d}USDT" for i in range(n - 2)]
+
+
+def watch(args):
+    if args.symbols:
+        symbols = args.symbols.split(',')
+    elif args.symbols_count:
+        symbols = mock_symbols(args.symbols_count)
+    else:
+        symbols = perpetual_symbols()
+
+    tracer = LatencyTracer(window=args.window, stages=STAGES)
+    metrics = None
+    if args.metrics_port is not None:
+        metrics = MetricsServer(tracer, args.metrics_host, args.metrics_port).start()
+    out = open(args.events, 'a') if args.events else None
+
+    def on_event(event):
+        if out is not None:
+            out.write(json.dumps(event) + '\n')
+            out.flush()
+        if not args.quiet:
+            arrow = '🟢' if event['type'] == 'open' else '⚪'
+            print(f"{arrow} {event['type']:<5} {event['symbol']:<12} 币安 {event['binance']:+.4f}%  "
+                  f"Bybit {event['bybit']:+.4f}%  差 {event['spread']:+.4f}%  "
+                  f"(做空 {event['short']} / 做多 {event['long']})")
+
+    monitor = FundingMonitor(symbols, threshold=args.threshold, on_event=on_event, tracer=tracer)
+
+    async def run():
+        async with aiohttp.ClientSession() as session:
+            tasks = [asyncio.ensure_future(_binance_stream(session, monitor, args.binance_ws)),
+                     asyncio.ensure_future(_bybit_stream(session, monitor, args.bybit_ws, symbols))]
+            try:
+                await asyncio.sleep(args.duration if args.duration else float('inf'))
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    print(f"📡 监控 {len(symbols)} 个永续合约的资金费率差，阈值 {args.threshold}%，Ctrl-C 退出")
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if metrics is not None:
+            metrics.stop()
+        if out is not None:
+            out.close()
+        print(f"\n⏱️ {monitor.updates} 条推送，{monitor.events} 个事件，当前机会 {len(monitor.opportunities())} 个")
+        print(tracer.format())
+
+
+def mock(args):
+    """
+    本地模拟两个交易所的推送：/binance/!markPrice@arr@1s 每 interval 秒推送全部交易对，
+    /bybit 按订阅的交易对逐个推送增量。资金费率围绕 0.01% 随机游走，偶尔出现较大的偏离。
+    """
+    from aiohttp import web
+
+    symbols = mock_symbols(args.symbols_count)
+    rng = random.Random(args.seed)
+    rates = {s: [0.0001, 0.0001] for s in symbols}   # 小数，两个交易所各一个
+
+    def step(ex):
+        for pair in rates.values():
+            pair[ex] += rng.gauss(0, 0.00002) + (rng.choice((-1, 1)) * 0.0004 if rng.random() < 0.002 else 0)
+            pair[ex] += (0.0001 - pair[ex]) * 0.1   # 向 0.01% 回归
+
+    async def binance(request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+
+        async def push():
+            while not ws.closed:
+                await asyncio.sleep(args.interval)
+                step(0)
+                now = int(time.time() * 1000)
+                await ws.send_str(json.dumps([{'e': 'markPriceUpdate', 'E': now, 's': s, 'p': '0', 'r': f"{r[0]:.8f}"}
+                                              for s, r in rates.items()]))
+
+        pusher = asyncio.ensure_future(push())
+        try:
+            async for _ in ws:   # 读取才能响应客户端的 close
+                pass
+        finally:
+            pusher.cancel()
+        return ws
+
+    async def bybit(request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        subscribed = []
+
+        async def push():
+            while not ws.closed:
+                await asyncio.sleep(args.interval)
+                step(1)
+                for s in list(subscribed):
+                    await ws.send_str(json.dumps({'topic': f"tickers.{s}", 'type': 'delta', 'ts': int(time.time() * 1000),
+                                                  'data': {'symbol': s, 'fundingRate': f"{rates[s][1]:.8f}"}}))
+
+        pusher = asyncio.ensure_future(push())
+        try:
+            async for msg in ws:
+                req = json.loads(msg.data)
+                if req.get('op') == 'subscribe':
+                    subscribed.extend(t.split('.', 1)[1] for t in req['args'] if t.split('.', 1)[1] in rates)
+                    await ws.send_json({'success': True, 'op': 'subscribe'})
+                elif req.get('op') == 'ping':
+                    await ws.send_json({'success': True, 'op': 'pong'})
+        finally:
+            pusher.cancel()
+        return ws
+
+    app = web.Application()
+    app.add_routes([web.get('/binance/{stream}', binance), web.get('/bybit', bybit)])
+    print(f"🧪 模拟推送: ws://{args.host}:{args.port}/binance  ws://{args.host}:{args.port}/bybit"
+          f"（{len(symbols)} 个交易对）")
+    web.run_app(app, host=args.host, port=args.port, print=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='币安 / Bybit 永续合约资金费率差实时监控')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('watch', help='订阅推送并在费率差超过阈值时发出事件')
+    p.add_argument('--symbols', help='逗号分隔的交易对，默认为币安全部 USDT 永续合约')
+    p.add_argument('--symbols-count', type=int, help='使用模拟服务的前 N 个交易对（配合 mock）')
+    p.add_argument('--threshold', type=float, default=FundingRateArbitrage.params.funding_rate_threshold,
+                   help='资金费率差阈值（百分比），默认与 FundingRateArbitrage 相同')
+    p.add_argument('--binance-ws', default=BINANCE_FUTURES_WS)
+    p.add_argument('--bybit-ws', default=BYBIT_WS)
+    p.add_argument('--events', help='事件追加写入的 JSON Lines 文件')
+    p.add_argument('--quiet', action='store_true', help='不打印事件')
+    p.add_argument('--duration', type=float, help='运行多少秒后退出，默认一直运行')
+    p.add_argument('--window', type=int, default=4096, help='延迟直方图保留的样本数')
+    p.add_argument('--metrics-host', default='127.0.0.1')
+    p.add_argument('--metrics-port', type=int, help='在该端口提供 /metrics（0 为随机端口），默认不开')
+    p.set_defaults(func=watch)
+
+    p = sub.add_parser('mock', help='本地模拟两个交易所的资金费率推送')
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', type=int, default=8790)
+    p.add_argument('--symbols-count', type=int, default=300)
+    p.add_argument('--interval', type=float, default=1.0, help='推送间隔（秒）')
+    p.add_argument('--seed', type=int, default=0)
+    p.set_defaults(func=mock)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
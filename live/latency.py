@@ -0,0 +1,179 @@
+"""
+实盘链路的延迟追踪：从交易所K线收盘到订单发出、被确认，每个环节各自计时
+
+一根K线的追踪以K线开盘时间为 key，各环节依次打点，记录与上一个打点的间隔（毫秒）：
+
+    receive      交易所事件时间 -> 本地收到 websocket 消息（墙钟差，含两边时钟偏差）
+    finalize     收到消息 -> 解析成K线放进队列
+    dispatch     放进队列 -> 回测引擎取出这根K线
+    indicators   取出 -> 指标更新完、进入策略 next()
+    decision     进入 next() -> 决定下单（没有下单时为 next() 执行完）
+    order_build  决定下单 -> 订单对象构建完、交给 broker
+    submit       交给 broker -> 请求发出
+    ack          请求发出 -> 交易所确认
+    total        收到消息 -> 追踪结束（确认下单或 next() 执行完）
+
+每个环节保留最近 window 个样本的环形缓冲区，p50 / p99 / max 在读取时才计算，
+打点本身只是一次 perf_counter_ns 和一次数组写入（约 1µs），可以在实盘中常开。
+
+    tracer = LatencyTracer()
+    MetricsServer(tracer, port=9108).start()   # curl http://127.0.0.1:9108/metrics
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+STAGES = ('receive', 'finalize', 'dispatch', 'indicators', 'decision', 'order_build', 'submit', 'ack', 'total')
+
+
+class RollingHistogram(object):
+    """最近 size 个样本的环形缓冲区"""
+
+    def __init__(self, size=4096):
+        self.values = np.zeros(size)
+        self.count = 0          # 累计样本数（不只是窗口内）
+
+    def add(self, value):
+        self.values[self.count % len(self.values)] = value
+        self.count += 1
+
+    def summary(self):
+        n = min(self.count, len(self.values))
+        if n == 0:
+            return {'count': 0, 'p50': None, 'p99': None, 'max': None}
+        window = self.values[:n]
+        p50, p99 = np.percentile(window, [50, 99])
+        return {'count': self.count, 'p50': float(p50), 'p99': float(p99), 'max': float(window.max())}
+
+
+class LatencyTracer(object):
+    """
+    websocket 线程调用 begin / mark，回测引擎线程用 activate 切换到当前K线后调用 mark / end；
+    两个线程都会读写同一根K线的追踪，begin / mark / close 都在锁里进行。
+    enabled=False 时所有打点直接返回。
+    """
+
+    def __init__(self, window=4096, enabled=True, stages=STAGES):
+        self.enabled = enabled
+        self.histograms = {stage: RollingHistogram(window) for stage in stages}
+        self.current = None
+        self._open = {}     # key -> [开始时间, 上一次打点时间]（perf_counter_ns）
+        self._lock = threading.Lock()
+
+    def begin(self, key, event_ms=None, start_ns=None):
+        """开始一根K线的追踪；start_ns 为收到消息时的 perf_counter_ns（解析前取），默认为现在"""
+        if not self.enabled:
+            return
+        now = time.perf_counter_ns() if start_ns is None else start_ns
+        if event_ms is not None:
+            self.histograms['receive'].add(time.time() * 1000 - event_ms)
+        with self._lock:
+            self._open[key] = [now, now]
+            # 没有走到 end 的旧追踪（例如断线重连）不会一直留着
+            if len(self._open) > 64:
+                for stale in sorted(self._open)[:-64]:
+                    del self._open[stale]
+
+    def activate(self, key):
+        self.current = key
+
+    def mark(self, stage, key=None):
+        """记录 key（默认当前K线）从上一次打点到现在的耗时；追踪已结束或不存在时忽略"""
+        if not self.enabled:
+            return
+        now = time.perf_counter_ns()
+        with self._lock:
+            span = self._open.get(self.current if key is None else key)
+            if span is None:
+                return
+            self.histograms[stage].add((now - span[1]) / 1e6)
+            span[1] = now
+
+    def record(self, stage, ms):
+        """直接记录一个样本，用于不在K线链路上顺序发生的环节（例如并发发出的多笔订单）"""
+        if self.enabled:
+            self.histograms[stage].add(ms)
+
+    def close(self, key=None):
+        """结束追踪，记录从 begin 到现在的总耗时"""
+        if not self.enabled:
+            return
+        now = time.perf_counter_ns()
+        with self._lock:
+            span = self._open.pop(self.current if key is None else key, None)
+        if span is not None:
+            self.histograms['total'].add((now - span[0]) / 1e6)
+
+    def end(self, stage, key=None):
+        """最后一个环节打点，并结束追踪"""
+        key = self.current if key is None else key
+        self.mark(stage, key)
+        self.close(key)
+
+    def summary(self):
+        return {stage: h.summary() for stage, h in self.histograms.items()}
+
+    def prometheus(self):
+        """Prometheus 文本格式，分位数为最近 window 个样本"""
+        lines = ['# HELP live_latency_ms Signal-to-order latency per stage (ms)',
+                 '# TYPE live_latency_ms summary']
+        for stage, s in self.summary().items():
+            if s['count'] == 0:
+                continue
+            lines.append(f'live_latency_ms{{stage="{stage}",quantile="0.5"}} {s["p50"]:.6f}')
+            lines.append(f'live_latency_ms{{stage="{stage}",quantile="0.99"}} {s["p99"]:.6f}')
+            lines.append(f'live_latency_ms_max{{stage="{stage}"}} {s["max"]:.6f}')
+            lines.append(f'live_latency_ms_count{{stage="{stage}"}} {s["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    def format(self):
+        """终端打印用的表格"""
+        rows = [f"{'环节':<12}{'次数':>8}{'p50(ms)':>12}{'p99(ms)':>12}{'max(ms)':>12}"]
+        for stage, s in self.summary().items():
+            if s['count']:
+                rows.append(f"{stage:<12}{s['count']:>8}{s['p50']:>12.3f}{s['p99']:>12.3f}{s['max']:>12.3f}")
+        return '\n'.join(rows)
+
+
+class MetricsServer(object):
+    """本地指标接口：/metrics 为 Prometheus 文本格式，/metrics.json 为 JSON"""
+
+    def __init__(self, tracer, host='127.0.0.1', port=9108):
+        tracer_ = tracer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body, ctype = tracer_.prometheus().encode(), 'text/plain; version=0.0.4'
+                elif self.path == '/metrics.json':
+                    body, ctype = json.dumps(tracer_.summary()).encode(), 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', ctype)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def address(self):
+        return self.server.server_address
+
+    def start(self):
+        self._thread.start()
+        print(f"📈 延迟指标: http://{self.address[0]}:{self.address[1]}/metrics")
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
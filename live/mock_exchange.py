@@ -0,0 +1,276 @@
+"""
+本地模拟交易所：不联网演练实盘链路（K线推送、下单、撤单、用户数据流）
+
+    python -m live.mock_exchange --port 8800 --bar-seconds 1 --fail-rate 0.1
+    BINANCE_API_BASE=http://127.0.0.1:8800 BINANCE_WS_BASE=ws://127.0.0.1:8800/ws \
+        python -m live.run strategies.TurtleStrategy.TurtleATRStrategy --broker binance
+
+实现了与币安现货相同格式的接口子集：
+    GET  /api/v3/klines、/api/v3/exchangeInfo
+    POST / GET / DELETE /api/v3/order（校验签名、clientOrderId 重复时返回 -2010）
+    POST / PUT /api/v3/userDataStream
+    ws   /ws/<symbol>@kline_<interval>、/ws/<listenKey>
+
+价格按随机游走每 bar_seconds 秒收盘一根K线；市价单分两笔立即成交，限价单在价格穿过时成交。
+fail_rate 为下单请求被受理后仍返回 503 的比例，用来演练执行器的对账和幂等重试；
+fail_html=True 时改为返回网关那样的 HTML 502 页面（不是 JSON）。
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import itertools
+import json
+import random
+import threading
+import time
+from urllib.parse import urlencode
+
+from aiohttp import web
+
+from data.kline_store import INTERVAL_MS
+
+
+class MockExchange(object):
+    def __init__(self, api_secret='mock', price=100.0, bar_seconds=1.0, fail_rate=0.0, latency_ms=0.0, seed=0,
+                 fail_html=False):
+        self.api_secret = api_secret.encode()
+        self.bar_seconds = bar_seconds
+        self.fail_rate = fail_rate
+        self.fail_html = fail_html
+        self.latency_ms = latency_ms
+        self.random = random.Random(seed)
+        self.prices = {}
+        self.start_price = price
+        self.orders = {}          # clientOrderId -> 订单
+        self.order_ids = itertools.count(1)
+        self.listen_keys = set()
+        self.user_sockets = set()
+        self.order_requests = 0   # 收到的下单请求数（含重试）
+
+        self.app = web.Application()
+        self.app.add_routes([
+            web.get('/api/v3/klines', self.klines),
+            web.get('/api/v3/exchangeInfo', self.exchange_info),
+            web.post('/api/v3/order', self.new_order),
+            web.get('/api/v3/order', self.get_order),
+            web.delete('/api/v3/order', self.cancel_order),
+            web.post('/api/v3/userDataStream', self.new_listen_key),
+            web.put('/api/v3/userDataStream', self.keepalive),
+            web.get('/ws/{stream}', self.websocket),
+        ])
+
+    # ---- 行情 ----
+    def price(self, symbol):
+        return self.prices.setdefault(symbol, self.start_price)
+
+    def _step(self, symbol):
+        p = self.price(symbol) * (1 + self.random.gauss(0, 0.002))
+        self.prices[symbol] = p
+        return p
+
+    async def klines(self, request):
+        q = request.query
+        symbol, step = q['symbol'], INTERVAL_MS[q['interval']]
+        limit = int(q.get('limit', 500))
+        now = int(time.time() * 1000) // step * step
+        rows, p = [], self.price(symbol)
+        for t in range(now - (limit - 1) * step, now + 1, step):
+            o, p = p, p * (1 + self.random.gauss(0, 0.002))
+            rows.append([t, str(o), str(max(o, p)), str(min(o, p)), str(p), '1', t + step - 1,
+                         '0', 1, '0', '0', '0'])
+        return web.json_response(rows)
+
+    async def exchange_info(self, request):
+        return web.json_response({'symbols': [{'symbol': request.query['symbol'], 'filters': [
+            {'filterType': 'LOT_SIZE', 'stepSize': '0.00001000'},
+            {'filterType': 'PRICE_FILTER', 'tickSize': '0.01000000'},
+        ]}]})
+
+    async def _kline_stream(self, ws, symbol, interval):
+        step = INTERVAL_MS[interval]
+        t = int(time.time() * 1000) // step * step
+        while not ws.closed:
+            await asyncio.sleep(self.bar_seconds)
+            o = self.price(symbol)
+            c = self._step(symbol)
+            await self._match(symbol, c)
+            k = {'t': t, 'T': t + step - 1, 's': symbol, 'i': interval, 'o': str(o), 'h': str(max(o, c)),
+                 'l': str(min(o, c)), 'c': str(c), 'v': '1', 'x': True}
+            await ws.send_str(json.dumps({'e': 'kline', 'E': int(time.time() * 1000), 's': symbol, 'k': k}))
+            t += step
+
+    # ---- 下单 ----
+    def _error(self, status, code, msg):
+        return web.json_response({'code': code, 'msg': msg}, status=status)
+
+    def _verify(self, request):
+        params = [(k, v) for k, v in request.query.items() if k != 'signature']
+        expected = hmac.new(self.api_secret, urlencode(params).encode(), hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, request.query.get('signature', ''))
+
+    async def new_order(self, request):
+        self.order_requests += 1
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        if not self._verify(request):
+            return self._error(400, -1022, 'Signature for this request is not valid.')
+        q = request.query
+        client_id = q['newClientOrderId']
+        if client_id in self.orders:
+            return self._error(400, -2010, 'Duplicate order sent.')
+        order = {'symbol': q['symbol'], 'orderId': next(self.order_ids), 'clientOrderId': client_id,
+                 'side': q['side'], 'type': q['type'], 'origQty': q['quantity'], 'price': q.get('price', '0'),
+                 'executedQty': '0', 'cummulativeQuoteQty': '0', 'status': 'NEW'}
+        self.orders[client_id] = order
+        self._report(order, 'NEW')
+        if order['type'] == 'MARKET':
+            asyncio.ensure_future(self._fill_market(order))
+        if self.random.random() < self.fail_rate:
+            if self.fail_html:
+                return web.Response(status=502, content_type='text/html',
+                                    text='<html><head><title>502 Bad Gateway</title></head></html>')
+            return self._error(503, -1000, 'Unknown error; execution status unknown.')
+        return web.json_response({'symbol': order['symbol'], 'orderId': order['orderId'],
+                                  'clientOrderId': client_id, 'transactTime': int(time.time() * 1000)})
+
+    async def get_order(self, request):
+        if not self._verify(request):
+            return self._error(400, -1022, 'Signature for this request is not valid.')
+        order = self.orders.get(request.query['origClientOrderId'])
+        if order is None:
+            return self._error(400, -2013, 'Order does not exist.')
+        return web.json_response(order)
+
+    async def cancel_order(self, request):
+        if not self._verify(request):
+            return self._error(400, -1022, 'Signature for this request is not valid.')
+        order = self.orders.get(request.query['origClientOrderId'])
+        if order is None or order['status'] not in ('NEW', 'PARTIALLY_FILLED'):
+            return self._error(400, -2011, 'Unknown order sent.')
+        order['status'] = 'CANCELED'
+        self._report(order, 'CANCELED')
+        return web.json_response(order)
+
+    async def _fill_market(self, order):
+        await asyncio.sleep(0.001)
+        qty = float(order['origQty'])
+        price = self.price(order['symbol'])
+        for part in (qty / 2, qty - qty / 2):
+            self._trade(order, part, price)
+
+    async def move_price(self, symbol, price):
+        """把价格直接设为 price 并撮合限价单（演练和测试用）"""
+        self.prices[symbol] = price
+        await self._match(symbol, price)
+
+    async def _match(self, symbol, price):
+        for order in list(self.orders.values()):
+            if order['symbol'] != symbol or order['type'] != 'LIMIT' or order['status'] not in ('NEW', 'PARTIALLY_FILLED'):
+                continue
+            limit = float(order['price'])
+            if (order['side'] == 'BUY' and price <= limit) or (order['side'] == 'SELL' and price >= limit):
+                self._trade(order, float(order['origQty']) - float(order['executedQty']), limit)
+
+    def _trade(self, order, qty, price):
+        executed = float(order['executedQty']) + qty
+        order['executedQty'] = f"{executed:.8f}"
+        order['cummulativeQuoteQty'] = f"{float(order['cummulativeQuoteQty']) + qty * price:.8f}"
+        order['status'] = 'FILLED' if executed >= float(order['origQty']) - 1e-12 else 'PARTIALLY_FILLED'
+        self._report(order, 'TRADE', qty, price, qty * price * 0.001)
+
+    def _report(self, order, exec_type, qty=0.0, price=0.0, comm=0.0):
+        canceled = exec_type == 'CANCELED'
+        event = {'e': 'executionReport', 'E': int(time.time() * 1000), 's': order['symbol'],
+                 'c': f"cancel{order['orderId']}" if canceled else order['clientOrderId'],
+                 'C': order['clientOrderId'] if canceled else '', 'S': order['side'], 'o': order['type'],
+                 'q': order['origQty'], 'p': order['price'], 'x': exec_type, 'X': order['status'],
+                 'i': order['orderId'], 'l': f"{qty:.8f}", 'z': order['executedQty'], 'L': f"{price:.8f}",
+                 'n': f"{comm:.8f}", 'N': 'USDT', 'T': int(time.time() * 1000)}
+        for ws in list(self.user_sockets):
+            asyncio.ensure_future(ws.send_str(json.dumps(event)))
+
+    # ---- 用户数据流 ----
+    async def new_listen_key(self, request):
+        key = f"mock{len(self.listen_keys)}{self.random.getrandbits(32):08x}"
+        self.listen_keys.add(key)
+        return web.json_response({'listenKey': key})
+
+    async def keepalive(self, request):
+        return web.json_response({})
+
+    async def disconnect_users(self):
+        """断开所有用户数据流连接，断线期间的回报不会推送（演练重连对账）"""
+        sockets, self.user_sockets = list(self.user_sockets), set()
+        for ws in sockets:
+            await ws.close()
+
+    async def websocket(self, request):
+        stream = request.match_info['stream']
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        if stream in self.listen_keys:
+            self.user_sockets.add(ws)
+            try:
+                async for _ in ws:
+                    pass
+            finally:
+                self.user_sockets.discard(ws)
+        elif '@kline_' in stream:
+            symbol, interval = stream.split('@kline_')
+            pusher = asyncio.ensure_future(self._kline_stream(ws, symbol.upper(), interval))
+            try:
+                async for _ in ws:   # 读取才能响应客户端的 close
+                    pass
+            finally:
+                pusher.cancel()
+        return ws
+
+    # ---- 运行 ----
+    def start(self, host='127.0.0.1', port=0):
+        """在后台线程里启动，返回实际监听的端口（测试和演练用）"""
+        ready = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+        async def serve():
+            self._runner = web.AppRunner(self.app)
+            await self._runner.setup()
+            site = web.TCPSite(self._runner, host, port)
+            await site.start()
+            self.port = site._server.sockets[0].getsockname()[1]
+            ready.set()
+
+        threading.Thread(target=self._loop.run_forever, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(serve(), self._loop)
+        ready.wait()
+        return self.port
+
+    def call(self, coro):
+        """在模拟交易所的事件循环里执行协程并等待结果（start() 之后使用）"""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def stop(self):
+        self.call(self._runner.cleanup())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地模拟交易所')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--secret', default='mock', help='校验签名用的 API secret')
+    parser.add_argument('--price', type=float, default=100.0, help='初始价格')
+    parser.add_argument('--bar-seconds', type=float, default=1.0, help='每隔多少秒收盘一根K线')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='下单受理后仍返回 503 的比例')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='下单接口的模拟延迟')
+    parser.add_argument('--fail-html', action='store_true', help='失败时返回 HTML 502 而不是 JSON 503')
+    args = parser.parse_args()
+
+    exchange = MockExchange(args.secret, args.price, args.bar_seconds, args.fail_rate, args.latency_ms,
+                            fail_html=args.fail_html)
+    print(f"🧪 模拟交易所: http://{args.host}:{args.port}  ws://{args.host}:{args.port}/ws")
+    web.run_app(exchange.app, host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
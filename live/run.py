@@ -0,0 +1,128 @@
+"""
+实盘（纸面撮合）运行入口，带全链路延迟追踪
+
+    python -m live.run strategies.TurtleStrategy.TurtleATRStrategy --interval 1m \
+        --params '{"entry_period": 20, "exit_period": 10}' --metrics-port 9108
+
+策略类不需要改动：traced_strategy() 生成一个子类，在进入 next()、第一次调用 buy / sell 时打点；
+PaperBroker 在订单交给 broker 和提交完成时打点。Ctrl-C 退出时打印各环节的 p50 / p99 / max。
+
+--broker binance 时订单经 OrderExecutor 异步发到交易所（API key 从 .env 的
+BINANCE_API_KEY / BINANCE_API_SECRET 读取），成交回报来自用户数据流。
+"""
+import argparse
+import json
+import os
+
+import backtrader as bt
+
+from backtest.runner import load_strategy
+from live.binance_feed import BinanceKlineData
+from live.latency import LatencyTracer, MetricsServer
+
+
+def traced_strategy(strategy_cls, tracer):
+    """给策略类加上 indicators / decision 两个打点；没有下单的K线在 next() 结束时结束追踪"""
+
+    class Traced(strategy_cls):
+        def next(self):
+            tracer.mark('indicators')
+            self._trace_ordered = False
+            super(Traced, self).next()
+            if not self._trace_ordered:
+                tracer.end('decision')
+
+        def _trace_decision(self):
+            if not getattr(self, '_trace_ordered', True):
+                tracer.mark('decision')
+                self._trace_ordered = True
+
+        # close / order_target_* 最终都会调用 buy / sell
+        def buy(self, *args, **kwargs):
+            self._trace_decision()
+            return super(Traced, self).buy(*args, **kwargs)
+
+        def sell(self, *args, **kwargs):
+            self._trace_decision()
+            return super(Traced, self).sell(*args, **kwargs)
+
+    Traced.__name__ = strategy_cls.__name__
+    return Traced
+
+
+class PaperBroker(bt.brokers.BackBroker):
+    """
+    纸面撮合：按回测规则成交，订单提交时打 order_build / submit / ack。
+    没有网络往返，submit 与 ack 几乎为 0；接交易所的 broker 在请求发出和收到确认时各打一次。
+    """
+    params = (
+        ('tracer', None),
+    )
+
+    def submit(self, order, check=True):
+        tracer = self.p.tracer
+        if tracer is not None:
+            tracer.mark('order_build')
+        order = super(PaperBroker, self).submit(order, check)
+        if tracer is not None:
+            tracer.mark('submit')
+            tracer.end('ack')
+        return order
+
+
+def main():
+    parser = argparse.ArgumentParser(description='实盘（纸面撮合）运行，带延迟追踪')
+    parser.add_argument('strategy', help='策略类路径，例如 strategies.TurtleStrategy.TurtleATRStrategy')
+    parser.add_argument('--symbol', default='BTCUSDT')
+    parser.add_argument('--interval', default='1m')
+    parser.add_argument('--params', default='{}', help='策略参数（JSON）')
+    parser.add_argument('--cash', type=float, default=10000.0)
+    parser.add_argument('--commission', type=float, default=0.0008)
+    parser.add_argument('--history', type=int, default=500, help='预热用的历史K线根数')
+    parser.add_argument('--broker', choices=['paper', 'binance'], default='paper',
+                        help='paper 为本地纸面撮合，binance 为真实下单（或 BINANCE_API_BASE 指向的模拟交易所）')
+    parser.add_argument('--concurrency', type=int, default=20, help='同时在途的下单请求数')
+    parser.add_argument('--metrics-host', default='127.0.0.1')
+    parser.add_argument('--metrics-port', type=int, default=9108, help='0 为随机端口')
+    parser.add_argument('--no-trace', action='store_true', help='关闭延迟追踪')
+    args = parser.parse_args()
+
+    tracer = LatencyTracer(enabled=not args.no_trace)
+    metrics = MetricsServer(tracer, args.metrics_host, args.metrics_port).start()
+
+    executor = None
+    # quicknotify：成交回报在引擎下一次轮询时就交给策略，不等下一根K线
+    cerebro = bt.Cerebro(stdstats=False, quicknotify=True)
+    if args.broker == 'binance':
+        from dotenv import load_dotenv
+        from live.broker import LiveBroker
+        from live.executor import OrderExecutor
+        load_dotenv()
+        executor = OrderExecutor(os.environ['BINANCE_API_KEY'], os.environ['BINANCE_API_SECRET'],
+                                 concurrency=args.concurrency).start()
+        executor.prepare([args.symbol])
+        cerebro.setbroker(LiveBroker(executor=executor, tracer=tracer))
+    else:
+        cerebro.setbroker(PaperBroker(tracer=tracer))
+    cerebro.broker.setcash(args.cash)
+    cerebro.broker.setcommission(commission=args.commission)
+    cerebro.adddata(BinanceKlineData(symbol=args.symbol, interval=args.interval,
+                                     history=args.history, tracer=tracer))
+    cerebro.addstrategy(traced_strategy(load_strategy(args.strategy), tracer), **json.loads(args.params))
+
+    print(f"🚀 {args.strategy} {args.symbol} {args.interval} 开始运行，Ctrl-C 退出")
+    try:
+        cerebro.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        metrics.stop()
+        if executor is not None:
+            executor.stop()
+        print(f"\n⏱️ 延迟统计（最近 {len(next(iter(tracer.histograms.values())).values)} 根K线）：")
+        print(tracer.format())
+        print(f"💰 账户净值: {cerebro.broker.getvalue():.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,49 @@
 # 获取每日BTC涨幅，市值前20的代币平均涨幅和市值前50代币平均涨幅
+#
+#   python statistics/DailyIncrease.py                      # 今日实时
+#   python statistics/DailyIncrease.py backfill --days 1500 # 用本地K线仓库回填历史每一天
+#   python statistics/DailyIncrease.py stream               # 订阅全市场 !miniTicker@arr，持续更新
+#
+# stream 模式不再逐个请求 /ticker/24hr：币安每秒推送一次所有有变化的交易对的 24h 行情，
+# 写进按列存放的数组表（每个交易对一行），任何时刻计算前 20 / 前 50 平均涨幅只是几十个元素的数组运算。
+# 本地演练：先 replay 起一个回放服务，再用 --ws-base 指向它：
+#   python statistics/DailyIncrease.py record ticker.log --duration 600   # 录制真实推送
+#   python statistics/DailyIncrease.py replay ticker.log --port 8765       # 不带文件时生成随机行情
+#   python statistics/DailyIncrease.py stream --ws-base ws://127.0.0.1:8765/ws --symbols BTCUSDT,ETHUSDT
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
 import requests
 from datetime import datetime
-import time
 
-BINANCE_API_BASE = "https://api.binance.com"
+# 作为脚本运行时把项目根目录加入路径，才能导入 data.kline_store
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from data.kline_store import KlineStore  # noqa: E402
+from data.rest_client import binance_client, shared_client  # noqa: E402
+
 COINGECKO_API_BASE = "https://api.coingecko.com/api/v3"
+BINANCE_WS_BASE = os.environ.get('BINANCE_WS_BASE', 'wss://stream.binance.com:9443/ws')
 
 
 def get_binance_price_change(symbol: str):
-    """获取币安24小时价格变动数据"""
-    url = f"{BINANCE_API_BASE}/api/v3/ticker/24hr?symbol={symbol}"
-    resp = requests.get(url)
-    if resp.status_code == 200:
-        data = resp.json()
-        return float(data["priceChangePercent"])
-    else:
+    """获取币安24小时价格变动数据（限速和重试由共享客户端处理），重试后仍失败返回 None"""
+    try:
+        data = binance_client().get("/api/v3/ticker/24hr", {"symbol": symbol}, weight=2)
+    except requests.RequestException:
         return None
+    return float(data["priceChangePercent"])
 
 
 def get_top_market_cap_symbols(limit=50):
     """获取CoinGecko市值前N的代币symbol（转换为币安交易对格式）"""
-    url = f"{COINGECKO_API_BASE}/coins/markets"
     params = {
         "vs_currency": "usd",
         "order": "market_cap_desc",
@@ -28,14 +51,16 @@ def get_top_market_cap_symbols(limit=50):
         "page": 1,
         "sparkline": False,
     }
-    resp = requests.get(url, params=params)
     result = []
-    if resp.status_code == 200:
-        for coin in resp.json():
-            symbol = coin["symbol"].upper()
-            if symbol == "USDT":
-                continue
-            result.append(symbol + "USDT")
+    try:
+        coins = shared_client(COINGECKO_API_BASE).get("/coins/markets", params)
+    except requests.RequestException:
+        return result
+    for coin in coins:
+        symbol = coin["symbol"].upper()
+        if symbol == "USDT":
+            continue
+        result.append(symbol + "USDT")
     return result
 
 
@@ -45,17 +70,91 @@ def get_average_change(symbols):
     for symbol in symbols:
         try:
             change = get_binance_price_change(symbol)
-            if change is not None:
-                changes.append(change)
-            time.sleep(0.1)  # 避免请求过快被限制
         except Exception as e:
             print(f"跳过 {symbol}，错误: {e}")
+            continue
+        if change is None:
+            print(f"跳过 {symbol}，请求失败")
+            continue
+        changes.append(change)
     if changes:
         return sum(changes) / len(changes)
     return 0
 
 
-def main():
+def load_daily_changes(store, symbols, days, offline=False):
+    """
+    从本地K线仓库读取各币种日K线，返回 (日期数组, 涨幅矩阵)。
+    矩阵形状为 (天数, 币种数)，单位为 %，当天没有K线的币种为 NaN。
+    """
+    if not offline:
+        for symbol in symbols:
+            try:
+                store.download(symbol, '1d', days)
+            except Exception as e:
+                print(f"跳过 {symbol}，错误: {e}")
+
+    day_ms = 86_400_000
+    last = max((store.last_time(s, '1d') or 0) for s in symbols)
+    first = last - (days - 1) * day_ms
+    dates = np.arange(first, last + 1, day_ms, dtype=np.int64)
+    changes = np.full((len(dates), len(symbols)), np.nan)
+    for j, symbol in enumerate(symbols):
+        # 币安没有该交易对时仓库里没有数据，整列保持 NaN
+        if not store.rows(symbol, '1d'):
+            continue
+        k = store.load_frame(symbol, '1d', start=first)
+        rows = (k.index.values.astype('datetime64[ms]').astype(np.int64) - first) // day_ms
+        changes[rows, j] = (k['close'].to_numpy() / k['open'].to_numpy() - 1.0) * 100
+    return dates, changes
+
+
+def nan_average(changes):
+    """逐日对有数据的币种取平均，返回 (平均涨幅, 参与平均的币种数)"""
+    count = np.sum(~np.isnan(changes), axis=1)
+    total = np.nansum(changes, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / count, np.nan), count
+
+
+def load_universe(args):
+    """按市值排序的币种列表：--symbols、缓存文件，或从 CoinGecko 获取后缓存"""
+    universe_file = Path(args.universe)
+    if args.symbols:
+        return args.symbols.split(',')
+    if universe_file.exists():
+        return json.loads(universe_file.read_text())
+    # 用当前市值排名作为历史各日的成分，存下来保证重跑结果一致（注意幸存者偏差）
+    symbols = get_top_market_cap_symbols(limit=50)
+    universe_file.parent.mkdir(parents=True, exist_ok=True)
+    universe_file.write_text(json.dumps(symbols))
+    return symbols
+
+
+def backfill(args):
+    """批量计算历史每一天的 BTC 涨幅和市值前 20 / 前 50 平均涨幅，写入列式 npz 文件"""
+    symbols = load_universe(args)
+    # BTC 不在成分里时单独加在最后一列，不影响前 20 / 前 50 的成分
+    columns = symbols if 'BTCUSDT' in symbols else symbols + ['BTCUSDT']
+
+    store = KlineStore(args.cache_dir)
+    dates, changes = load_daily_changes(store, columns, args.days, offline=args.offline)
+    btc = changes[:, columns.index('BTCUSDT')]
+    top20, n20 = nan_average(changes[:, :20])
+    top50, n50 = nan_average(changes[:, :min(50, len(symbols))])
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(output, date=dates, btc=btc, top20=top20, top50=top50,
+                        n20=n20, n50=n50, symbols=np.array(symbols))
+    print(f"💾 {len(dates)} 天的市场宽度数据已写入 {output}")
+
+    for i in range(max(0, len(dates) - 5), len(dates)):
+        day = datetime.utcfromtimestamp(dates[i] / 1000).strftime('%Y-%m-%d')
+        print(f"{day}  BTC: {btc[i]:6.2f}%  前20: {top20[i]:6.2f}% ({n20[i]})  前50: {top50[i]:6.2f}% ({n50[i]})")
+
+
+def live():
     print(f"\n🕒 当前时间：{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
 
     btc_change = get_binance_price_change("BTCUSDT")
@@ -74,5 +173,240 @@ def main():
     print(f"\n📊 市值前 50 代币今日平均涨幅：{avg_change_50:.2f}%")
 
 
+class TickerTable(object):
+    """
+    全市场 24h 行情的数组表：交易对按第一次出现的顺序编号，open / close / 事件时间各一列，容量不够时翻倍。
+    24h 涨幅 = close / open - 1，与 /ticker/24hr 的 priceChangePercent 相同。
+    写入在 websocket 线程里加锁进行；查询只读取几十个元素，不加锁。
+    """
+
+    def __init__(self, capacity=1024):
+        self.index = {}        # symbol -> 行号
+        self.symbols = []
+        self.open = np.full(capacity, np.nan)
+        self.close = np.full(capacity, np.nan)
+        self.time = np.zeros(capacity, dtype=np.int64)
+        self.updates = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def _row(self, symbol):
+        row = self.index.get(symbol)
+        if row is None:
+            row = self.index[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+            if row == len(self.open):
+                for name in ('open', 'close', 'time'):
+                    old = getattr(self, name)
+                    new = np.full(len(old) * 2, np.nan) if old.dtype.kind == 'f' else np.zeros(len(old) * 2, old.dtype)
+                    new[:len(old)] = old
+                    setattr(self, name, new)
+        return row
+
+    def rows(self, symbols):
+        """币种列表对应的行号数组，还没有推送过的币种先占一行（值为 NaN）"""
+        with self._lock:
+            return np.array([self._row(s) for s in symbols], dtype=np.int64)
+
+    def update(self, tickers):
+        """写入一条 !miniTicker@arr 推送（只包含有变化的交易对）"""
+        with self._lock:
+            rows = [self._row(t['s']) for t in tickers]
+            self.open[rows] = [float(t['o']) for t in tickers]
+            self.close[rows] = [float(t['c']) for t in tickers]
+            self.time[rows] = [t['E'] for t in tickers]
+            self.updates += 1
+
+    def changes(self, rows):
+        return (self.close[rows] / self.open[rows] - 1.0) * 100
+
+    def average(self, rows):
+        """rows 中有数据的币种的平均 24h 涨幅，返回 (平均涨幅, 币种数)"""
+        change = self.changes(rows)
+        valid = change[change == change]
+        return (float(valid.mean()) if len(valid) else float('nan')), len(valid)
+
+    def save(self, path):
+        """写入快照（先写临时文件再改名，读取方不会读到写了一半的文件）"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.stem + '.tmp.npz')
+        with self._lock:
+            n = len(self.symbols)
+            np.savez(tmp, symbols=np.array(self.symbols), open=self.open[:n], close=self.close[:n], time=self.time[:n])
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        saved = np.load(path)
+        table = cls(capacity=max(1024, len(saved['symbols'])))
+        for symbol in saved['symbols']:
+            table._row(str(symbol))
+        n = len(table)
+        table.open[:n], table.close[:n], table.time[:n] = saved['open'], saved['close'], saved['time']
+        return table
+
+
+def stream(args):
+    """订阅全市场 miniTicker，持续维护数组表，定时打印前 20 / 前 50 平均涨幅并保存快照"""
+    import websocket
+
+    symbols = load_universe(args)
+    snapshot = Path(args.snapshot) if args.snapshot else None
+    table = TickerTable.load(snapshot) if snapshot is not None and snapshot.exists() else TickerTable()
+    btc = table.rows(['BTCUSDT'])
+    top50 = table.rows(symbols[:50])
+    top20 = top50[:20]
+
+    url = f"{args.ws_base or BINANCE_WS_BASE}/!miniTicker@arr"
+    ws = websocket.WebSocketApp(url, on_message=lambda ws, message: table.update(json.loads(message)))
+    threading.Thread(target=ws.run_forever, kwargs={'reconnect': 5}, daemon=True).start()
+    print(f"📡 订阅 {url}，每 {args.print_every:g}s 打印一次，Ctrl-C 退出")
+
+    started = last_save = time.time()
+    try:
+        while args.duration is None or time.time() - started < args.duration:
+            time.sleep(args.print_every)
+            t0 = time.perf_counter()
+            avg20, n20 = table.average(top20)
+            avg50, n50 = table.average(top50)
+            query_us = (time.perf_counter() - t0) * 1e6
+            print(f"🕒 {datetime.utcnow().strftime('%H:%M:%S')} UTC  BTC: {table.changes(btc)[0]:6.2f}%  "
+                  f"前20: {avg20:6.2f}% ({n20})  前50: {avg50:6.2f}% ({n50})  "
+                  f"| {len(table)} 个交易对, {table.updates} 次推送, 查询 {query_us:.0f}µs")
+            if snapshot is not None and time.time() - last_save >= args.snapshot_every:
+                table.save(snapshot)
+                last_save = time.time()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ws.close()
+        if snapshot is not None:
+            table.save(snapshot)
+            print(f"💾 快照已保存到 {snapshot}")
+
+
+def record(args):
+    """把 !miniTicker@arr 的原始推送连同接收时间（毫秒）逐行写入文件，供 replay 回放"""
+    import websocket
+
+    url = f"{args.ws_base or BINANCE_WS_BASE}/!miniTicker@arr"
+    conn = websocket.create_connection(url)
+    started, n = time.time(), 0
+    print(f"🎙️ 录制 {url} -> {args.file}")
+    try:
+        with open(args.file, 'w') as out:
+            while time.time() - started < args.duration:
+                out.write(f"{int(time.time() * 1000)}\t{conn.recv()}\n")
+                n += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        conn.close()
+    print(f"💾 录制了 {n} 条推送")
+
+
+def synthetic_tickers(n_symbols=300, seed=0):
+    """随机游走生成的 !miniTicker@arr 推送，每次只包含一部分交易对（与真实推送一样）"""
+    rng = random.Random(seed)
+    names = ['BTC', 'ETH', 'BNB', 'SOL', 'XRP'] + [f"C{i:03d}" for i in range(n_symbols - 5)]
+    state = {f"{name}USDT": [rng.uniform(1, 100)] * 2 for name in names}
+    while True:
+        now = int(time.time() * 1000)
+        batch = []
+        for symbol, prices in state.items():
+            if rng.random() < 0.6:
+                prices[1] *= 1 + rng.gauss(0, 0.002)
+                batch.append({'e': '24hrMiniTicker', 'E': now, 's': symbol, 'c': f"{prices[1]:.8f}",
+                              'o': f"{prices[0]:.8f}", 'h': '0', 'l': '0', 'v': '0', 'q': '0'})
+        yield 1000, json.dumps(batch)
+
+
+def recorded_tickers(path, speed=1.0):
+    """按录制时的间隔回放，speed 为倍速"""
+    last = None
+    with open(path) as f:
+        for line in f:
+            t, _, message = line.rstrip('\n').partition('\t')
+            t = int(t)
+            yield (0 if last is None else (t - last) / speed), message
+            last = t
+
+
+def replay(args):
+    """本地 websocket 回放服务：/ws/<任意 stream 名> 推送录制文件或随机行情，供 stream 模式测试"""
+    from aiohttp import web
+
+    async def handler(request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        messages = recorded_tickers(args.file, args.speed) if args.file else synthetic_tickers(args.symbols_count)
+
+        async def push():
+            for delay_ms, message in messages:
+                await asyncio.sleep(delay_ms / 1000)
+                await ws.send_str(message)
+            await ws.close()
+
+        pusher = asyncio.ensure_future(push())
+        try:
+            async for _ in ws:   # 读取才能响应客户端的 close
+                pass
+        finally:
+            pusher.cancel()
+        return ws
+
+    app = web.Application()
+    app.add_routes([web.get('/ws/{stream}', handler)])
+    source = args.file or f"随机行情（{args.symbols_count} 个交易对）"
+    print(f"🔁 回放服务: ws://{args.host}:{args.port}/ws/!miniTicker@arr  数据: {source}")
+    web.run_app(app, host=args.host, port=args.port, print=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='BTC 与市值前 20 / 前 50 代币涨幅')
+    sub = parser.add_subparsers(dest='command')
+    p = sub.add_parser('backfill', help='用本地K线仓库批量计算历史每日数据')
+    p.add_argument('--days', type=int, default=1500, help='回填天数')
+    p.add_argument('--cache-dir', default='data/store', help='本地K线仓库目录')
+    p.add_argument('--output', default='output/breadth.npz', help='输出的列式文件')
+    p.add_argument('--universe', default='output/breadth_universe.json', help='币种列表缓存（按市值排序）')
+    p.add_argument('--symbols', help='逗号分隔的币种列表（按市值排序），不从 CoinGecko 获取')
+    p.add_argument('--offline', action='store_true', help='不联网更新K线，只用本地仓库')
+    p.set_defaults(func=backfill)
+
+    p = sub.add_parser('stream', help='订阅全市场 miniTicker websocket，持续更新')
+    p.add_argument('--ws-base', help='websocket 地址，默认币安（或环境变量 BINANCE_WS_BASE）')
+    p.add_argument('--universe', default='output/breadth_universe.json', help='币种列表缓存（按市值排序）')
+    p.add_argument('--symbols', help='逗号分隔的币种列表（按市值排序），不从 CoinGecko 获取')
+    p.add_argument('--print-every', type=float, default=5.0, help='打印间隔（秒）')
+    p.add_argument('--snapshot', help='定时把数组表保存到这个 npz 文件，启动时从它恢复')
+    p.add_argument('--snapshot-every', type=float, default=60.0, help='快照间隔（秒）')
+    p.add_argument('--duration', type=float, help='运行多少秒后退出，默认一直运行')
+    p.set_defaults(func=stream)
+
+    p = sub.add_parser('record', help='录制 miniTicker 推送，供 replay 回放')
+    p.add_argument('file')
+    p.add_argument('--ws-base', help='websocket 地址，默认币安（或环境变量 BINANCE_WS_BASE）')
+    p.add_argument('--duration', type=float, default=600.0, help='录制秒数')
+    p.set_defaults(func=record)
+
+    p = sub.add_parser('replay', help='本地 websocket 回放服务')
+    p.add_argument('file', nargs='?', help='record 录制的文件，不给时生成随机行情')
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', type=int, default=8765)
+    p.add_argument('--speed', type=float, default=1.0, help='回放倍速')
+    p.add_argument('--symbols-count', type=int, default=300, help='随机行情的交易对数')
+    p.set_defaults(func=replay)
+
+    args = parser.parse_args()
+    if args.command is None:
+        live()
+    else:
+        args.func(args)
+
+
 if __name__ == "__main__":
     main()
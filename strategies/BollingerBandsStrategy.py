@@ -4,30 +4,35 @@ from __future__ import (absolute_import, division, print_function,
 
 import backtrader as bt
 import pandas as pd
-from binance.client import Client
 import datetime
 import seaborn as sns
 
 import matplotlib
-matplotlib.use('TkAgg')
+matplotlib.use('TkAgg', force=False)  # 无图形界面的服务器/子进程里退回默认后端
 import matplotlib.pyplot as plt
 
 import warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
+from backtest.report import Progress, RecordWriter, ranking_table
+from backtest.run_store import RunRecorder, TopKRunStore, plot_heatmap, plot_stored
+from data.prefetch import prefetch
+from data.rest_client import binance_client
+
 # 处理变量为none
 def format_float(value, digits=2):
     return f"{value:.{digits}f}" if value is not None else "N/A"
 
-# 初始化币安客户端
-client = Client()
+# 进程内共享的币安 REST 客户端（连接池、权重限速、失败重试），第一次下载数据时才建立连接
+def get_client():
+    return binance_client()
 
 # 获取历史k线数据
 def get_binance_btc_data(symbol='BTCUSDT', interval='1d', lookback_days=600):
     end_time = datetime.datetime.now()
     start_time = end_time - datetime.timedelta(days=lookback_days)
 
-    klines = client.get_historical_klines(
+    klines = get_client().get_historical_klines(
         symbol,
         interval,
         start_str=start_time.strftime("%d %b %Y %H:%M:%S"),
@@ -46,8 +51,6 @@ def get_binance_btc_data(symbol='BTCUSDT', interval='1d', lookback_days=600):
 
     return df
 
-df = get_binance_btc_data()
-
 # backtrader 数据接口
 class PandasData(bt.feeds.PandasData):
     params = (
@@ -96,8 +99,12 @@ class BBStrategy(bt.Strategy):
                     self.close()  # 平空单
 
 # 设置Backtrader
-def run_backtest_and_plot(interval, bb_period, bb_dev, rsi_period, plot=False):
-    df = get_binance_btc_data(interval=interval)
+# runs 不为 None 时记录净值曲线和成交，交给 TopKRunStore 决定是否保留
+# df 为 None 时自己下载数据；参数优化时由 main() 预取后传入，同一周期的组合共用一份
+# verbose 为 False 时不逐组打印（参数优化时结果写入 JSON Lines，控制台只显示进度）
+def run_backtest_and_plot(interval, bb_period, bb_dev, rsi_period, plot=False, runs=None, df=None, verbose=True):
+    if df is None:
+        df = get_binance_btc_data(interval=interval)
     data = PandasData(dataname=df)
 
     cerebro = bt.Cerebro()
@@ -116,6 +123,8 @@ def run_backtest_and_plot(interval, bb_period, bb_dev, rsi_period, plot=False):
     cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name='sharpe')
     cerebro.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
     cerebro.addanalyzer(bt.analyzers.Returns, _name='returns')
+    if runs is not None:
+        cerebro.addanalyzer(RunRecorder, _name='recorder')
 
     results = cerebro.run()
     strat = results[0]
@@ -131,12 +140,13 @@ def run_backtest_and_plot(interval, bb_period, bb_dev, rsi_period, plot=False):
     maxdd = drawdown.get('max', {}).get('drawdown', None)
 
     # 输出分析结果
-    print(f"[{interval}] bb_period={bb_period}, bb_dev={bb_dev}, rsi={rsi_period} | "
-          f"Sharpe: {format_float(sharpe)}, "
-          f"Return: {format_float(rtot * 100 if rtot is not None else None)}%, "
-          f"MaxDD: {format_float(maxdd)}%, "
-          f"Annual: {format_float(annual * 100 if annual is not None else None)}%, "
-          f"Avg: {format_float(average * 100 if average is not None else None)}%")
+    if verbose:
+        print(f"[{interval}] bb_period={bb_period}, bb_dev={bb_dev}, rsi={rsi_period} | "
+              f"Sharpe: {format_float(sharpe)}, "
+              f"Return: {format_float(rtot * 100 if rtot is not None else None)}%, "
+              f"MaxDD: {format_float(maxdd)}%, "
+              f"Annual: {format_float(annual * 100 if annual is not None else None)}%, "
+              f"Avg: {format_float(average * 100 if average is not None else None)}%")
 
     # 绘图
     if plot:
@@ -150,7 +160,7 @@ def run_backtest_and_plot(interval, bb_period, bb_dev, rsi_period, plot=False):
             dpi=120
         )
 
-    return {
+    result = {
         'interval': interval,
         'bb_period': bb_period,
         'bb_dev': bb_dev,
@@ -161,6 +171,9 @@ def run_backtest_and_plot(interval, bb_period, bb_dev, rsi_period, plot=False):
         'annual': annual,
         'average': average,
     }
+    if runs is not None:
+        runs.offer(result, strat.analyzers.recorder.get_analysis())
+    return result
 
 def main():
     best_result = None
@@ -168,6 +181,8 @@ def main():
     best_sharpe_result = None
     best_sharpe = -float('inf')
     all_results = []
+    # 年化 / 夏普前 5 名的净值曲线和成交记录，画图不再重跑回测
+    runs = TopKRunStore('output/bollinger_runs.npz', k=5)
 
     intervals = ['12h','1d']
     bb_period_range = range(15, 30, 5)
@@ -176,13 +191,20 @@ def main():
 
     print("🔍 正在进行参数优化...\n")
 
-    for interval in intervals:
+    # 每组结果写入 JSON Lines，控制台只刷新一行进度
+    writer = RecordWriter('output/bollinger_results.jsonl')
+    progress = Progress(len(intervals) * len(bb_period_range) * len(bb_dev_range) * len(rsi_period_range))
+    # 当前周期回测时，下一个周期的数据在后台下载
+    for interval, df in prefetch(intervals, lambda i: get_binance_btc_data(interval=i)):
         for bb_period in bb_period_range:
             for bb_dev in bb_dev_range:
                 for rsi_period in rsi_period_range:
-                    result = run_backtest_and_plot(interval, bb_period, bb_dev, rsi_period, plot=False)
+                    result = run_backtest_and_plot(interval, bb_period, bb_dev, rsi_period, plot=False, runs=runs, df=df,
+                                                   verbose=False)
                     if result:
                         all_results.append(result)
+                        writer.write(result)
+                        progress.update(result)
 
                         if result['annual'] is not None and result['annual'] > best_annual:
                             best_annual = result['annual']
@@ -190,6 +212,10 @@ def main():
                         if result['sharpe'] is not None and result['sharpe'] > best_sharpe:
                             best_sharpe = result['sharpe']
                             best_sharpe_result = result
+    writer.close()
+    progress.close()
+
+    print('\n' + ranking_table(all_results, 'sharpe', top=10))
 
     # 最佳年化
     print("\n🏆 最佳年化参数组合:")
@@ -207,15 +233,17 @@ def main():
     print(f"🔹 Annual Return: {format_float(best_sharpe_result['annual'] * 100 if best_sharpe_result['annual'] else None, 4)}%")
     print(f"🔹 Average Return:{format_float(best_sharpe_result['average'] * 100 if best_sharpe_result['average'] else None, 4)}%")
 
-    # 使用最佳夏普参数组合绘图
-    print("\n📈 使用最佳夏普参数重新回测并绘图...")
-    run_backtest_and_plot(
-        interval=best_sharpe_result['interval'],
-        bb_period=best_sharpe_result['bb_period'],
-        bb_dev=best_sharpe_result['bb_dev'],
-        rsi_period=best_sharpe_result['rsi_period'],
-        plot=True
-    )
+    runs.save()
+
+    # 用保存的净值曲线和成交记录绘图，不再重新回测
+    print("\n📈 绘制最佳夏普参数的净值曲线...")
+    plot_stored(runs, best_sharpe_result, ('interval', 'bb_period', 'bb_dev', 'rsi_period'),
+                'output/bollinger_best_sharpe.png')
+
+    # 各周期 bb_period x bb_dev 的夏普热力图（同一格取不同 rsi_period 中的最大值）
+    for interval in intervals:
+        plot_heatmap([r for r in all_results if r['interval'] == interval], 'bb_period', 'bb_dev', 'sharpe',
+                     f'output/bollinger_heatmap_{interval}.png', title=f'Bollinger {interval} sharpe')
 
 if __name__ == '__main__':
     main()
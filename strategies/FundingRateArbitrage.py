@@ -1,5 +1,4 @@
 import backtrader as bt
-import ccxt
 import pandas as pd
 from datetime import datetime
 import logging
@@ -47,8 +46,11 @@ def fetch_funding_rate_data(exchange_name, symbol, start_date, end_date):
     Fetch funding rate history from a specific exchange and symbol.
     This is a simplified version, you'd likely need to get real data from your API.
     """
+    import ccxt   # 只有回测拉历史数据时需要；live/funding_monitor.py 导入本模块时不依赖 ccxt
     exchange = getattr(ccxt, exchange_name)()
-    funding_history = exchange.fetch_funding_rate_history(symbol)
+    # 只拉取 start_date 之后的记录，不再取回全部历史后再切片
+    since = int(pd.Timestamp(start_date).timestamp() * 1000)
+    funding_history = exchange.fetch_funding_rate_history(symbol, since=since)
     timestamps = [datetime.utcfromtimestamp(f['timestamp'] / 1000) for f in funding_history]
     rates = [f['fundingRate'] * 100 for f in funding_history]  # 百分比形式
 
@@ -61,10 +63,6 @@ def fetch_funding_rate_data(exchange_name, symbol, start_date, end_date):
 
     return df
 
-# 读取资金费率数据（从真实交易所拉取或是本地数据）
-df1 = fetch_funding_rate_data('binance', 'BTC/USDT', '2023-01-01', '2023-01-30')
-df2 = fetch_funding_rate_data('bybit', 'BTC/USDT', '2023-01-01', '2023-01-30')
-
 # 将数据转换为Backtrader数据格式
 class PandasData1(bt.feeds.PandasData):
     lines = ('funding_rate',)
@@ -80,26 +78,37 @@ class PandasData2(bt.feeds.PandasData):
         ('funding_rate', 'funding_rate'),
     )
 
-# 将数据加载到Backtrader中
-data1 = PandasData1(dataname=df1)
-data2 = PandasData2(dataname=df2)
 
-# 设置回测引擎
-cerebro = bt.Cerebro()
-cerebro.adddata(data1)
-cerebro.adddata(data2)
-cerebro.addstrategy(FundingRateArbitrage)
+# 导入时不再拉取数据和回测，作为脚本运行时才执行
+def main():
+    # 读取资金费率数据（从真实交易所拉取或是本地数据）
+    df1 = fetch_funding_rate_data('binance', 'BTC/USDT', '2023-01-01', '2023-01-30')
+    df2 = fetch_funding_rate_data('bybit', 'BTC/USDT', '2023-01-01', '2023-01-30')
+
+    # 将数据加载到Backtrader中
+    data1 = PandasData1(dataname=df1)
+    data2 = PandasData2(dataname=df2)
+
+    # 设置回测引擎
+    cerebro = bt.Cerebro()
+    cerebro.adddata(data1)
+    cerebro.adddata(data2)
+    cerebro.addstrategy(FundingRateArbitrage)
+
+    # 设置初始资金和佣金
+    cerebro.broker.set_cash(100000)
+    cerebro.broker.set_commission(commission=0.001)
+
+    # 设置回测时间范围
+    cerebro.addobserver(bt.observers.Value)
+    cerebro.addobserver(bt.observers.DrawDown)
 
-# 设置初始资金和佣金
-cerebro.broker.set_cash(100000)
-cerebro.broker.set_commission(commission=0.001)
+    # 运行回测
+    cerebro.run()
 
-# 设置回测时间范围
-cerebro.addobserver(bt.observers.Value)
-cerebro.addobserver(bt.observers.DrawDown)
+    # 输出最终结果
+    print(f"Final Portfolio Value: {cerebro.broker.getvalue()}")
 
-# 运行回测
-cerebro.run()
 
-# 输出最终结果
-print(f"Final Portfolio Value: {cerebro.broker.getvalue()}")
+if __name__ == '__main__':
+    main()
@@ -2,30 +2,36 @@ from __future__ import (absolute_import, division, print_function, unicode_liter
 
 import backtrader as bt
 import pandas as pd
-from binance.client import Client
 import datetime
 import seaborn as sns
 
 import matplotlib
-matplotlib.use('TkAgg')
+matplotlib.use('TkAgg', force=False)  # 无图形界面的服务器/子进程里退回默认后端
 import matplotlib.pyplot as plt
 
+import itertools
 import warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
+from backtest.checkpoint import SweepCheckpoint, sweep_dataset
+from backtest.report import Progress, RecordWriter, ranking_table
+from data.prefetch import prefetch
+from data.rest_client import binance_client
+
 # 处理变量为none
 def format_float(value, digits=2):
     return f"{value:.{digits}f}" if value is not None else "N/A"
 
-# 初始化币安客户端
-client = Client()
+# 进程内共享的币安 REST 客户端（连接池、权重限速、失败重试），第一次下载数据时才建立连接
+def get_client():
+    return binance_client()
 
 # 获取历史k线数据
-def get_binance_btc_data(symbol='BTCUSDT', interval='1h', lookback_days=300):
-    end_time = datetime.datetime.now()
+def get_binance_btc_data(symbol='BTCUSDT', interval='1h', lookback_days=300, end_time=None):
+    end_time = end_time or datetime.datetime.now()
     start_time = end_time - datetime.timedelta(days=lookback_days)
 
-    klines = client.get_historical_klines(
+    klines = get_client().get_historical_klines(
         symbol,
         interval,
         start_str=start_time.strftime("%d %b %Y %H:%M:%S"),
@@ -170,8 +176,11 @@ class MartingaleStrategy(bt.Strategy):
                 self.order = self.sell(size=self.position.size)
 
 # 运行回测并优化参数
-def run_backtest_and_plot(interval, initial_stake, multiplier, take_profit_pct, max_levels, risk_pct, ma_period, plot=False):
-    df = get_binance_btc_data(interval=interval)
+# df 为 None 时自己下载数据；参数优化时由 main() 预取后传入，同一周期的组合共用一份
+# verbose 为 False 时不逐组打印（参数优化时结果写入 JSON Lines，控制台只显示进度）
+def run_backtest_and_plot(interval, initial_stake, multiplier, take_profit_pct, max_levels, risk_pct, ma_period, plot=False, df=None, verbose=True):
+    if df is None:
+        df = get_binance_btc_data(interval=interval)
     data = PandasData(dataname=df)
 
     cerebro = bt.Cerebro()
@@ -217,14 +226,15 @@ def run_backtest_and_plot(interval, initial_stake, multiplier, take_profit_pct,
     win_rate = win_trades / total_trades if total_trades > 0 else 0
 
     # 输出分析结果
-    print(f"[{interval}] stake={initial_stake}, mult={multiplier}, tp={take_profit_pct}, max_lvl={max_levels}, risk={risk_pct}, ma={ma_period} | "
-          f"Sharpe: {format_float(sharpe)}, "
-          f"Return: {format_float(rtot * 100 if rtot is not None else None)}%, "
-          f"MaxDD: {format_float(maxdd)}%, "
-          f"Annual: {format_float(annual * 100 if annual is not None else None)}%, "
-          f"Avg: {format_float(average * 100 if average is not None else None)}%, "
-          f"Trades: {total_trades}, "
-          f"Win Rate: {format_float(win_rate * 100)}%")
+    if verbose:
+        print(f"[{interval}] stake={initial_stake}, mult={multiplier}, tp={take_profit_pct}, max_lvl={max_levels}, risk={risk_pct}, ma={ma_period} | "
+              f"Sharpe: {format_float(sharpe)}, "
+              f"Return: {format_float(rtot * 100 if rtot is not None else None)}%, "
+              f"MaxDD: {format_float(maxdd)}%, "
+              f"Annual: {format_float(annual * 100 if annual is not None else None)}%, "
+              f"Avg: {format_float(average * 100 if average is not None else None)}%, "
+              f"Trades: {total_trades}, "
+              f"Win Rate: {format_float(win_rate * 100)}%")
 
     # 绘图
     if plot:
@@ -255,14 +265,14 @@ def run_backtest_and_plot(interval, initial_stake, multiplier, take_profit_pct,
         'win_rate': win_rate,
     }
 
-def main():
-    best_result = None
-    best_annual = -float('inf')
-    best_sharpe_result = None
-    best_sharpe = -float('inf')
-    all_results = []
-
+def main(checkpoint='output/martingale_checkpoint.json', checkpoint_every=10, end=None):
     intervals = ['4h', '1d']
+    # 已完成的组合和当前最佳结果定期写入 checkpoint，中断后重跑会跳过已完成的组合；
+    # checkpoint 与数据集（交易对、周期、回看天数、截止时间 end）绑定，数据集不同时从头开始
+    dataset = sweep_dataset(checkpoint, end, symbol='BTCUSDT', intervals=intervals, lookback_days=300)
+    end_time = datetime.datetime.strptime(dataset['end'], '%Y-%m-%d %H:%M')
+    ckpt = SweepCheckpoint(checkpoint, every=checkpoint_every, dataset=dataset)
+
     initial_stakes = [100, 200, 300]
     multipliers = [1.5, 2, 2.5]
     take_profit_pcts = [0.03, 0.05, 0.07]
@@ -272,33 +282,45 @@ def main():
 
     print("🔍 正在进行马丁格尔策略参数优化...\n")
 
-    for interval in intervals:
-        for initial_stake in initial_stakes:
-            for multiplier in multipliers:
-                for take_profit_pct in take_profit_pcts:
-                    for max_levels in max_levels_range:
-                        for risk_pct in risk_pcts:
-                            for ma_period in ma_periods:
-                                result = run_backtest_and_plot(
-                                    interval, 
-                                    initial_stake, 
-                                    multiplier, 
-                                    take_profit_pct, 
-                                    max_levels, 
-                                    risk_pct, 
-                                    ma_period, 
-                                    plot=False
-                                )
-                                
-                                if result:
-                                    all_results.append(result)
-
-                                    if result['annual'] is not None and result['annual'] > best_annual:
-                                        best_annual = result['annual']
-                                        best_result = result
-                                    if result['sharpe'] is not None and result['sharpe'] > best_sharpe:
-                                        best_sharpe = result['sharpe']
-                                        best_sharpe_result = result
+    # 当前周期回测时，下一个周期的数据在后台下载；checkpoint 里已全部完成的周期不再加载
+    grid = list(itertools.product(initial_stakes, multipliers, take_profit_pcts,
+                                  max_levels_range, risk_pcts, ma_periods))
+    pending = [i for i in intervals if not all(ckpt.done((i,) + p) for p in grid)]
+    # 每组结果写入 JSON Lines，控制台只刷新一行进度；断点续跑时先重写 checkpoint 里的结果，
+    # 上次最后一次保存之后写入的记录会重新回测，不会重复
+    writer = RecordWriter('output/martingale_results.jsonl')
+    for result in ckpt.completed.values():
+        writer.write(result)
+    progress = Progress(sum(not ckpt.done((i,) + p) for i in pending for p in grid))
+    for interval, df in prefetch(pending, lambda i: get_binance_btc_data(interval=i, end_time=end_time)):
+        for initial_stake, multiplier, take_profit_pct, max_levels, risk_pct, ma_period in grid:
+            params = (interval, initial_stake, multiplier, take_profit_pct,
+                      max_levels, risk_pct, ma_period)
+            if ckpt.done(params):
+                continue
+            result = run_backtest_and_plot(
+                interval,
+                initial_stake,
+                multiplier,
+                take_profit_pct,
+                max_levels,
+                risk_pct,
+                ma_period,
+                plot=False,
+                df=df,
+                verbose=False
+            )
+            ckpt.add(params, result)
+            writer.write(result)
+            progress.update(result)
+    ckpt.finish()
+    writer.close()
+    progress.close()
+
+    print('\n' + ranking_table(ckpt.all_results, 'sharpe', top=10))
+
+    best_result = ckpt.best_result
+    best_sharpe_result = ckpt.best_sharpe_result
 
     # 最佳年化
     print("\n🏆 最佳年化参数组合:")
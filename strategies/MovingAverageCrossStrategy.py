@@ -3,7 +3,6 @@ from __future__ import (absolute_import, division, print_function,
 
 import backtrader as bt
 import pandas as pd
-from binance.client import Client
 import datetime
 
 import matplotlib
@@ -12,15 +11,21 @@ import matplotlib.pyplot as plt
 import warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
-# 初始化币安客户端
-client = Client()
+from backtest.report import Progress, RecordWriter, ranking_table
+from backtest.run_store import RunRecorder, TopKRunStore, plot_heatmap, plot_stored
+from data.prefetch import prefetch
+from data.rest_client import binance_client
+
+# 进程内共享的币安 REST 客户端（连接池、权重限速、失败重试），第一次下载数据时才建立连接
+def get_client():
+    return binance_client()
 
 # 获取历史k线数据
 def get_binance_btc_data(symbol='BTCUSDT', interval='1d', lookback_days=600):
     end_time = datetime.datetime.now()
     start_time = end_time - datetime.timedelta(days=lookback_days)
 
-    klines = client.get_historical_klines(
+    klines = get_client().get_historical_klines(
         symbol,
         interval,
         start_str=start_time.strftime("%d %b %Y %H:%M:%S"),
@@ -39,8 +44,6 @@ def get_binance_btc_data(symbol='BTCUSDT', interval='1d', lookback_days=600):
 
     return df
 
-df = get_binance_btc_data()
-
 # backtrader 数据接口
 class PandasData(bt.feeds.PandasData):
     params = (
@@ -99,11 +102,15 @@ class MovingAverageCrossStrategy(bt.Strategy):
             # print(f'✅ 交易完成: 毛利: {trade.pnl:.2f} USDT, 净利: {trade.pnlcomm:.2f} USDT')
 
 # 设置Backtrader
-def run_backtest_and_plot(interval, short_period, long_period, plot=False):
+# runs 不为 None 时记录净值曲线和成交，交给 TopKRunStore 决定是否保留
+# df 为 None 时自己下载数据；参数优化时由 main() 预取后传入，同一周期的组合共用一份
+# verbose 为 False 时不逐组打印（参数优化时结果写入 JSON Lines，控制台只显示进度）
+def run_backtest_and_plot(interval, short_period, long_period, plot=False, runs=None, df=None, verbose=True):
     if short_period >= long_period:
         return None  # 这句很重要，避免无效数据加入结果
 
-    df = get_binance_btc_data(interval=interval)
+    if df is None:
+        df = get_binance_btc_data(interval=interval)
     data = PandasData(dataname=df)
 
     cerebro = bt.Cerebro()
@@ -120,6 +127,8 @@ def run_backtest_and_plot(interval, short_period, long_period, plot=False):
     cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name='sharpe')
     cerebro.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
     cerebro.addanalyzer(bt.analyzers.Returns, _name='returns')
+    if runs is not None:
+        cerebro.addanalyzer(RunRecorder, _name='recorder')
 
     results = cerebro.run()
     strat = results[0]
@@ -134,7 +143,8 @@ def run_backtest_and_plot(interval, short_period, long_period, plot=False):
     maxdd = drawdown['max']['drawdown'] if 'max' in drawdown else 0
 
     # 输出结果
-    print(f"[{interval}] short={short_period}, long={long_period} | Sharpe: {sharpe:.2f}, Return: {rtot*100:.2f}%, MaxDD: {maxdd:.2f}%,anunual return:{annual*100:.2f}%,average return:{average*100:.2f}%")
+    if verbose:
+        print(f"[{interval}] short={short_period}, long={long_period} | Sharpe: {sharpe:.2f}, Return: {rtot*100:.2f}%, MaxDD: {maxdd:.2f}%,anunual return:{annual*100:.2f}%,average return:{average*100:.2f}%")
 
     # 绘制图表
     if plot:
@@ -148,7 +158,7 @@ def run_backtest_and_plot(interval, short_period, long_period, plot=False):
             dpi=120
         )
 
-    return {
+    result = {
         'interval': interval,
         'short': short_period,
         'long': long_period,
@@ -158,11 +168,16 @@ def run_backtest_and_plot(interval, short_period, long_period, plot=False):
         'annual':annual,
         'average':average,
     }
+    if runs is not None:
+        runs.offer(result, strat.analyzers.recorder.get_analysis())
+    return result
 
 def main():
     best_result = None
     best_return = -float('inf')  # 初始为负无穷
     all_results = []
+    # 总收益前 5 名的净值曲线和成交记录，画图不再重跑回测
+    runs = TopKRunStore('output/ma_cross_runs.npz', k=5, metrics=('return',))
 
     intervals = ['1d', '12h']
     short_range = range(5, 21, 3)
@@ -170,15 +185,26 @@ def main():
 
     print("🔍 正在进行参数优化...\n")
 
-    for interval in intervals:
+    # 每组结果写入 JSON Lines，控制台只刷新一行进度
+    writer = RecordWriter('output/ma_cross_results.jsonl')
+    progress = Progress(len(intervals) * sum(s < l for s in short_range for l in long_range), metric='return')
+    # 当前周期回测时，下一个周期的数据在后台下载
+    for interval, df in prefetch(intervals, lambda i: get_binance_btc_data(interval=i)):
         for short_p in short_range:
             for long_p in long_range:
-                result = run_backtest_and_plot(interval, short_p, long_p, plot=False)
+                result = run_backtest_and_plot(interval, short_p, long_p, plot=False, runs=runs, df=df,
+                                               verbose=False)
                 if result:
                     all_results.append(result)
+                    writer.write(result)
+                    progress.update(result)
                     if result['return'] > best_return:
                         best_return = result['return']
                         best_result = result
+    writer.close()
+    progress.close()
+
+    print('\n' + ranking_table(all_results, 'return', top=10))
 
     print("\n🏆 最佳参数组合:")
     print(f"周期: {best_result['interval']}, short={best_result['short']}, long={best_result['long']}")
@@ -188,13 +214,16 @@ def main():
     print(f"🔹 Annual Return: {best_result['annual']*100:.2f}%")
     print(f"🔹 Average Return: {best_result['average']*100:.2f}%")
 
-    print("\n📈 使用最佳参数重新运行并绘图...")
-    run_backtest_and_plot(
-        interval=best_result['interval'],
-        short_period=best_result['short'],
-        long_period=best_result['long'],
-        plot=True
-    )
+    runs.save()
+
+    # 用保存的净值曲线和成交记录绘图，不再重新回测
+    print("\n📈 绘制最佳参数的净值曲线...")
+    plot_stored(runs, best_result, ('interval', 'short', 'long'), 'output/ma_cross_best.png')
+
+    # 各周期 short x long 的总收益热力图
+    for interval in intervals:
+        plot_heatmap([r for r in all_results if r['interval'] == interval], 'short', 'long', 'return',
+                     f'output/ma_cross_heatmap_{interval}.png', title=f'MA cross {interval} total return')
 
 
 if __name__ == '__main__':
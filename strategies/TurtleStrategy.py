@@ -3,12 +3,11 @@ from __future__ import (absolute_import, division, print_function,
 
 import backtrader as bt
 import pandas as pd
-from binance.client import Client
 import datetime
 import seaborn as sns
 
 import matplotlib
-matplotlib.use('TkAgg')
+matplotlib.use('TkAgg', force=False)  # 无图形界面的服务器/子进程里退回默认后端
 import matplotlib.pyplot as plt
 
 import warnings
@@ -16,21 +15,29 @@ warnings.filterwarnings("ignore", category=DeprecationWarning)
 
 import os
 import json
+import itertools
 from pathlib import Path
 
+from backtest.checkpoint import SweepCheckpoint, sweep_dataset
+from backtest.report import Progress, RecordWriter, ranking_table
+from backtest.run_store import RunRecorder, TopKRunStore, plot_heatmap, plot_stored
+from data.prefetch import prefetch
+from data.rest_client import binance_client
+
 # 处理变量为none
 def format_float(value, digits=2):
     return f"{value:.{digits}f}" if value is not None else "N/A"
 
-# 初始化币安客户端
-client = Client()
+# 进程内共享的币安 REST 客户端（连接池、权重限速、失败重试），第一次下载数据时才建立连接
+def get_client():
+    return binance_client()
 
 # 加载获取历史k线数据
-def get_data(symbol='BTCUSDT', interval='1h', lookback_days=300):
+def get_data(symbol='BTCUSDT', interval='1h', lookback_days=300, end_time=None):
     # 创建data目录（如果不存在）
     data_dir = Path('data')
     data_dir.mkdir(exist_ok=True)
-    end_time = datetime.datetime.now()
+    end_time = end_time or datetime.datetime.now()
     start_time = end_time - datetime.timedelta(days=lookback_days)
     end_str = end_time.strftime("%Y-%m-%d-%H:%M")
     
@@ -45,7 +52,7 @@ def get_data(symbol='BTCUSDT', interval='1h', lookback_days=300):
         return df
     
     print(f"🌐 从币安获取数据: {symbol} {interval}")
-    klines = client.get_historical_klines(
+    klines = get_client().get_historical_klines(
         symbol,
         interval,
         start_str=start_time.strftime("%d %b %Y %H:%M:%S"),
@@ -68,8 +75,6 @@ def get_data(symbol='BTCUSDT', interval='1h', lookback_days=300):
     
     return df
 
-df = get_data()
-
 # backtrader 数据接口
 class PandasData(bt.feeds.PandasData):
     params = (
@@ -104,7 +109,8 @@ class TurtleATRStrategy(bt.Strategy):
         self.trade_count = 0
 
     def notify_order(self, order):
-        if order.status in [order.Completed, order.Canceled, order.Margin]:
+        # 实盘 broker 还会给出 Rejected / Expired（交易所拒单、数量取整为 0 等），同样结束这笔订单
+        if order.status in [order.Completed, order.Canceled, order.Margin, order.Rejected, order.Expired]:
             self.order = None
     
     def notify_trade(self, trade):
@@ -139,10 +145,32 @@ class TurtleATRStrategy(bt.Strategy):
                 self.order = self.sell(size=self.position.size)
                 self.units = 0
 
+# 多周期海龟：入场信号用基础周期（如 15m），只在大周期（如 4h，由 resampledata 合成的 self.datas[1]）
+# 收盘价高于其均线时才入场；加仓和出场规则不变
+class TurtleTrendFilterStrategy(TurtleATRStrategy):
+    params = (
+        ('trend_period', 20),   # 大周期趋势均线周期
+    )
+
+    def __init__(self):
+        super(TurtleTrendFilterStrategy, self).__init__()
+        self.trend = self.datas[1]
+        self.trend_ma = bt.ind.SMA(self.trend.close, period=self.p.trend_period)
+
+    def next(self):
+        # 大周期的最新一根是已经收盘的K线，均线还没算出来时不入场
+        if not self.position and not (len(self.trend_ma) and self.trend.close[0] > self.trend_ma[0]):
+            return
+        super(TurtleTrendFilterStrategy, self).next()
+
 # 设置Backtrader
-def run_backtest_and_plot(interval, entry_period, exit_period, atr_period, plot=False):
+# runs 不为 None 时记录净值曲线和成交，交给 TopKRunStore 决定是否保留
+# df 为 None 时自己加载数据；参数优化时由 main() 预取后传入，同一周期的组合共用一份
+# verbose 为 False 时不逐组打印（参数优化时结果写入 JSON Lines，控制台只显示进度）
+def run_backtest_and_plot(interval, entry_period, exit_period, atr_period, plot=False, runs=None, df=None, verbose=True):
 
-    df = get_data(symbol='BTCUSDT', interval=interval, lookback_days=300) 
+    if df is None:
+        df = get_data(symbol='BTCUSDT', interval=interval, lookback_days=300)
     data = PandasData(dataname=df)
 
     cerebro = bt.Cerebro()
@@ -162,6 +190,8 @@ def run_backtest_and_plot(interval, entry_period, exit_period, atr_period, plot=
     cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name='sharpe')
     cerebro.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
     cerebro.addanalyzer(bt.analyzers.Returns, _name='returns')
+    if runs is not None:
+        cerebro.addanalyzer(RunRecorder, _name='recorder')
 
     results = cerebro.run()
     strat = results[0]
@@ -178,13 +208,14 @@ def run_backtest_and_plot(interval, entry_period, exit_period, atr_period, plot=
     total_trades = strat.trade_count
 
     # 输出分析结果
-    print(f"[{interval}] entry={entry_period}, exit={exit_period}, atr={atr_period} | "
-          f"夏普比率: {format_float(sharpe)}, "
-          f"复合回报率: {format_float(rtot * 100 if rtot is not None else None)}%, "
-          f"最大回撤: {format_float(maxdd)}%, "
-          f"年化收益率: {format_float(annual * 100 if annual is not None else None)}%, "
-          f"平均收益率: {format_float(average * 100 if average is not None else None)}%"
-          f"交易次数 :{total_trades}")
+    if verbose:
+        print(f"[{interval}] entry={entry_period}, exit={exit_period}, atr={atr_period} | "
+              f"夏普比率: {format_float(sharpe)}, "
+              f"复合回报率: {format_float(rtot * 100 if rtot is not None else None)}%, "
+              f"最大回撤: {format_float(maxdd)}%, "
+              f"年化收益率: {format_float(annual * 100 if annual is not None else None)}%, "
+              f"平均收益率: {format_float(average * 100 if average is not None else None)}%"
+              f"交易次数 :{total_trades}")
 
     # 绘图
     if plot:
@@ -198,7 +229,7 @@ def run_backtest_and_plot(interval, entry_period, exit_period, atr_period, plot=
             dpi=120
         )
 
-    return {
+    result = {
         'interval': interval,
         'entry': entry_period,
         'exit': exit_period,
@@ -210,39 +241,61 @@ def run_backtest_and_plot(interval, entry_period, exit_period, atr_period, plot=
         'average': average,
         'trades':total_trades,
     }
+    if runs is not None:
+        runs.offer(result, strat.analyzers.recorder.get_analysis())
+    return result
 
 
 def format_float(value, digits=2):
     return f"{value:.{digits}f}" if value is not None else "N/A"
 
-def main():
-    best_result = None
-    best_annual = -float('inf')
-    best_sharpe_result = None
-    best_sharpe = -float('inf')
-    all_results = []
-
+def main(checkpoint='output/turtle_checkpoint.json', checkpoint_every=10, end=None):
     intervals = ['1h','15m', '30m']
+    # 已完成的组合和当前最佳结果定期写入 checkpoint，中断后重跑会跳过已完成的组合；
+    # checkpoint 与数据集（交易对、周期、回看天数、截止时间 end）绑定，数据集不同时从头开始
+    dataset = sweep_dataset(checkpoint, end, symbol='BTCUSDT', intervals=intervals, lookback_days=300)
+    end_time = datetime.datetime.strptime(dataset['end'], '%Y-%m-%d %H:%M')
+    ckpt = SweepCheckpoint(checkpoint, every=checkpoint_every, dataset=dataset)
+    # 年化 / 夏普前 5 名的净值曲线和成交记录随 checkpoint 一起保存，画图不再重跑回测
+    runs_path = Path('output/turtle_runs.npz')
+    resuming = bool(ckpt.completed) and runs_path.exists()
+    runs = TopKRunStore.load(runs_path, k=5) if resuming else TopKRunStore(runs_path, k=5)
+    ckpt.on_save = runs.save
+
     entry_range = range(5, 11, 5)
     exit_range = range(20, 41, 5)
     atr_range = range(10, 20, 5)
 
     print("🔍 正在进行参数优化...\n")
 
-    for interval in intervals:
-        for entry_p in entry_range:
-            for exit_p in exit_range:
-                for atr_p in atr_range:
-                    result = run_backtest_and_plot(interval, entry_p, exit_p, atr_p, plot=False)
-                    if result:
-                        all_results.append(result)
-
-                        if result['annual'] is not None and result['annual'] > best_annual:
-                            best_annual = result['annual']
-                            best_result = result
-                        if result['sharpe'] is not None and result['sharpe'] > best_sharpe:
-                            best_sharpe = result['sharpe']
-                            best_sharpe_result = result
+    # 当前周期回测时，下一个周期的数据在后台下载；checkpoint 里已全部完成的周期不再加载
+    grid = list(itertools.product(entry_range, exit_range, atr_range))
+    pending = [i for i in intervals if not all(ckpt.done((i,) + p) for p in grid)]
+    # 每组结果写入 JSON Lines，控制台只刷新一行进度；断点续跑时先重写 checkpoint 里的结果，
+    # 上次最后一次保存之后写入的记录会重新回测，不会重复
+    writer = RecordWriter('output/turtle_results.jsonl')
+    for result in ckpt.completed.values():
+        writer.write(result)
+    progress = Progress(sum(not ckpt.done((i,) + p) for i in pending for p in grid))
+    for interval, df in prefetch(pending, lambda i: get_data(symbol='BTCUSDT', interval=i, lookback_days=300,
+                                                                     end_time=end_time)):
+        for entry_p, exit_p, atr_p in grid:
+            params = (interval, entry_p, exit_p, atr_p)
+            if ckpt.done(params):
+                continue
+            result = run_backtest_and_plot(interval, entry_p, exit_p, atr_p, plot=False, runs=runs, df=df,
+                                           verbose=False)
+            ckpt.add(params, result)
+            writer.write(result)
+            progress.update(result)
+    ckpt.finish()
+    writer.close()
+    progress.close()
+
+    print('\n' + ranking_table(ckpt.all_results, 'sharpe', top=10))
+
+    best_result = ckpt.best_result
+    best_sharpe_result = ckpt.best_sharpe_result
 
     # 最佳年化
     print("\n🏆 最佳年化参数组合:")
@@ -262,25 +315,18 @@ def main():
     print(f"🔹 平均收益率: {format_float(best_sharpe_result['average'] * 100 if best_sharpe_result['average'] else None, 4)}%") # 平均收益率
     print(f"🔹 交易次数: {best_sharpe_result['trades']}")
     
-    # 使用最佳年化参数组合绘图
-    print("\n📈 使用最佳年化参数重新回测并绘图...")
-    run_backtest_and_plot(
-        interval=best_result['interval'],
-        entry_period=best_result['entry'],
-        exit_period=best_result['exit'],
-        atr_period=best_result['atr'],
-        plot=True
-    )
-
-    # 使用最佳夏普参数组合绘图
-    print("\n📈 使用最佳夏普参数重新回测并绘图...")
-    run_backtest_and_plot(
-        interval=best_sharpe_result['interval'],
-        entry_period=best_sharpe_result['entry'],
-        exit_period=best_sharpe_result['exit'],
-        atr_period=best_sharpe_result['atr'],
-        plot=True
-    )
+    # 用保存的净值曲线和成交记录绘图，不再重新回测
+    keys = ('interval', 'entry', 'exit', 'atr')
+    for title, result, path in (('最佳年化', best_result, 'output/turtle_best_annual.png'),
+                                ('最佳夏普', best_sharpe_result, 'output/turtle_best_sharpe.png')):
+        print(f"\n📈 绘制{title}参数的净值曲线...")
+        plot_stored(runs, result, keys, path, rerun=lambda r=result: run_backtest_and_plot(
+            r['interval'], r['entry'], r['exit'], r['atr'], runs=runs))
+
+    # 各周期 entry x exit 的年化收益热力图（同一格取不同 atr 中的最大值）
+    for interval in intervals:
+        plot_heatmap([r for r in ckpt.all_results if r['interval'] == interval], 'entry', 'exit', 'annual',
+                     f'output/turtle_heatmap_{interval}.png', title=f'Turtle {interval} annual return')
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,916 @@
+"""
+统一的参数优化入口
+
+从配置文件（默认 sweeps.json）读取每个策略的类路径、周期和参数范围，展开成回测任务。
+每个任务按K线根数估算耗时，耗时最长的先跑，在多进程池里并行执行，
+避免最后只剩几个 15m 任务在跑、其余核心空闲。
+
+用法（在项目根目录）：
+    python strategy.py                                  # 使用 sweeps.json
+    python strategy.py sweep sweeps.json --jobs 8 --resume
+    python strategy.py import-csv data/BTCUSDT_1h_300d_2025-06-14-19:33.csv --interval 1h
+    python strategy.py ingest-trades BTCUSDT-aggTrades-2024-01.zip --bars time:1s
+    python strategy.py ingest-klines mirror/data/spot/monthly/klines/BTCUSDT/1m --jobs 8
+
+多台机器一起跑时，把任务发布到共享存储上的队列，每台机器各启动一个 worker：
+    python strategy.py publish sweeps.json --queue /mnt/shared/sweeps.db
+    python strategy.py worker --queue /mnt/shared/sweeps.db --jobs 8
+    python strategy.py collect --queue /mnt/shared/sweeps.db
+
+检查最优参数附近是否同样稳健（只补跑邻域里缺的组合）：
+    python strategy.py sensitivity sweeps.json --name turtle --metric sharpe --top 5
+
+均线、布林带、海龟、马丁格尔在同一份数据上比较（数据读一次、K线循环跑一次，每个策略独立记账）：
+    python strategy.py compare --names ma_cross bollinger turtle martingale --interval 1h
+
+多年 1m 数据用向量化模拟器分块回测（内存与历史长度无关）：
+    python strategy.py vector turtle --interval 1m --days 1825 --chunksize 200000
+
+每天只推进新K线的增量回测（第一次运行完整回测并保存快照）：
+    python strategy.py update turtle --interval 1h --params '{"entry_period": 20, "exit_period": 10}'
+"""
+import argparse
+import itertools
+import json
+import math
+import multiprocessing
+import operator
+import os
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from backtest.job_queue import JobQueue, LeaseKeeper, worker_name
+from backtest.report import Progress, RecordWriter, ranking_table
+from backtest.runner import load_strategy, peak_rss_mb, run_backtest, run_many
+from backtest.vector_sim import SIMULATORS, GridSimulator, param_grid
+from data.feeds import KlineStoreData, resample_timeframe
+from data.kline_archive import find_archives, ingest
+from data.kline_store import INTERVAL_MS, KlineStore
+from data.prefetch import prefetch
+from data.trade_bars import aggregate_bars, fetch_agg_trades, parse_interval, read_agg_trades
+
+
+# 处理变量为none
+def format_float(value, digits=2):
+    return f"{value:.{digits}f}" if value is not None else "N/A"
+
+
+OPERATORS = {
+    '<': operator.lt, '<=': operator.le, '>': operator.gt,
+    '>=': operator.ge, '==': operator.eq, '!=': operator.ne,
+}
+
+
+# 参数取值：列表原样使用，{"range": [start, stop, step]} 等价于 range()
+def expand_values(spec):
+    if isinstance(spec, dict):
+        return list(range(*spec['range']))
+    return list(spec)
+
+
+# 约束形如 "short_period < long_period"，右侧可以是参数名或数字
+def satisfies(params, constraints):
+    for constraint in constraints:
+        left, op, right = constraint.split()
+        right = params[right] if right in params else float(right)
+        if not OPERATORS[op](params[left], right):
+            return False
+    return True
+
+
+def job_key(job):
+    fields = [job['strategy'], job['symbol'], job['interval'], job['params']]
+    if job.get('resample'):
+        fields.append(job['resample'])
+    return json.dumps(fields, sort_keys=True)
+
+
+def data_window(store, symbol, interval, lookback_days):
+    """
+    以仓库中最后一根K线为终点，返回 [start, end) 毫秒区间。
+    仓库里的数据不够 lookback_days 天时（离线、回填失败或交易对上线较晚）打印一次警告。
+    """
+    last = store.last_time(symbol, interval)
+    if last is None:
+        return None
+    end = last + INTERVAL_MS[interval]
+    start = end - lookback_days * 86_400_000
+    first = store.first_time(symbol, interval)
+    # 终点是最后一根已收盘的K线，起点附近差一两根属于正常
+    if first - start > 2 * INTERVAL_MS[interval] and (symbol, interval, lookback_days) not in _short_windows:
+        _short_windows.add((symbol, interval, lookback_days))
+        days = (end - first) / 86_400_000
+        print(f"⚠️ 仓库中 {symbol} {interval} 只有 {days:.1f} 天数据（从 {pd.Timestamp(first, unit='ms')} 开始），"
+              f"少于要求的 {lookback_days} 天")
+    return start, end
+
+
+_short_windows = set()   # 已经警告过的数据集
+
+
+def sweep_grids(config):
+    """展开配置：逐个返回 (sweep, symbol, interval, 满足约束的参数网格)"""
+    for sweep in config['sweeps']:
+        symbol = sweep.get('symbol', config.get('symbol', 'BTCUSDT'))
+        grid = param_grid(**{name: expand_values(spec) for name, spec in sweep['params'].items()})
+        grid = [p for p in grid if satisfies(p, sweep.get('constraints', []))]
+        for interval in sweep['intervals']:
+            for target in sweep.get('resample', []):
+                resample_timeframe(target, interval)   # 周期不能合成时在分发任务前就报错
+            yield sweep, symbol, interval, grid
+
+
+def datasets(config):
+    """需要的 (symbol, interval, lookback_days)，同一数据集取最长回看；按预计K线根数从多到少排列"""
+    needed = {}
+    for sweep, symbol, interval, _ in sweep_grids(config):
+        key = (symbol, interval)
+        needed[key] = max(needed.get(key, 0), sweep.get('lookback_days', 300))
+    return sorted(((s, i, days) for (s, i), days in needed.items()),
+                  key=lambda d: d[2] * 86_400_000 / INTERVAL_MS[d[1]], reverse=True)
+
+
+def fetch_dataset(store, dataset, offline=False):
+    symbol, interval, lookback_days = dataset
+    if offline:
+        return
+    try:
+        store.download(symbol, interval, lookback_days)
+    except Exception as e:
+        print(f"⚠️ 无法更新 {symbol} {interval}，使用本地缓存: {e}")
+
+
+def prepare_data(config, store, offline=False):
+    """在分发任务前把每个 (symbol, interval) 的数据补齐到仓库"""
+    for dataset in datasets(config):
+        fetch_dataset(store, dataset, offline)
+
+
+def build_jobs(config, store, on_gap='ignore', only=None):
+    """only 为 (symbol, interval) 时只展开这一个数据集的任务"""
+    jobs = []
+    for sweep, symbol, interval, grid in sweep_grids(config):
+        if only is not None and (symbol, interval) != only:
+            continue
+        window = data_window(store, symbol, interval, sweep.get('lookback_days', 300))
+        if window is None:
+            print(f"⚠️ 仓库中没有 {symbol} {interval} 的数据，跳过")
+            continue
+        # 回测耗时与K线根数近似成正比
+        lo, hi = store.locate(symbol, interval, *window)
+        bars = hi - lo
+        gaps = store.gaps(symbol, interval, *window)
+        if len(gaps):
+            print(f"⚠️ {symbol} {interval} 区间内有 {len(gaps)} 处缺失K线（--gaps 可选择报错或补齐）")
+        for params in grid:
+            jobs.append({
+                'name': sweep.get('name', sweep['strategy']),
+                'strategy': sweep['strategy'],
+                'symbol': symbol,
+                'interval': interval,
+                'start': window[0],
+                'end': window[1],
+                'params': params,
+                'cash': sweep.get('cash', 10000.0),
+                'commission': sweep.get('commission', 0.0008),
+                'cost': bars,
+                'on_gap': on_gap,
+                'resample': sweep.get('resample', []),
+            })
+    return jobs
+
+
+def stream_jobs(args, config, store, done):
+    """
+    边下载边回测：数据集按预计K线根数从多到少依次下载，一个下载完就把它的任务交给进程池，
+    下一个数据集在后台线程里继续下载，下载不再挡在所有计算之前。
+    """
+    for (symbol, interval, _), _ in prefetch(datasets(config), lambda d: fetch_dataset(store, d, args.offline),
+                                             depth=args.prefetch):
+        jobs = build_jobs(config, store, on_gap=args.gaps, only=(symbol, interval))
+        for job in sorted(jobs, key=lambda job: job['cost'], reverse=True):
+            job['exactbars'] = args.exactbars
+            if job_key(job) not in done:
+                yield job
+
+
+# 每个工作进程各自缓存读过的数据
+_store = None
+_frames = {}
+
+
+def _init_worker(cache_dir):
+    global _store
+    _store = KlineStore(cache_dir)
+    _frames.clear()
+
+
+def run_job(job):
+    key = (job['symbol'], job['interval'], job['start'], job['end'])
+    if job.get('exactbars'):
+        # 流式读取仓库，不在进程里缓存整段数据
+        data = KlineStoreData(store=_store, symbol=key[0], interval=key[1], start=key[2], end=key[3],
+                              on_gap=job['on_gap'], stamp='close' if job.get('resample') else 'open')
+    else:
+        if key not in _frames:
+            _frames[key] = _store.load_frame(*key, on_gap=job['on_gap'])
+        data = _frames[key]
+    record = run_backtest(load_strategy(job['strategy']), data, job['params'],
+                          cash=job['cash'], commission=job['commission'],
+                          exactbars=job.get('exactbars', False),
+                          interval=job['interval'], resample=job.get('resample', []))
+    record.update({'name': job['name'], 'interval': job['interval'], 'params': job['params'], 'key': job_key(job)})
+    if job.get('resample'):
+        record['resample'] = job['resample']
+    return record
+
+
+def load_done(output):
+    done = {}
+    if output.exists():
+        with open(output) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    done[record['key']] = record
+    return done
+
+
+def print_cost_summary(records, elapsed=None):
+    """按策略和周期汇总回测开销，用于估算更大网格需要的机器和时间"""
+    records = [r for r in records if r.get('wall_time') is not None]
+    if not records:
+        return
+    groups = {}
+    for record in records:
+        groups.setdefault((record['name'], record['interval']), []).append(record)
+
+    print("\n🧮 资源开销汇总:")
+    print(f"{'策略':<12}{'周期':<6}{'任务':>6}{'总耗时s':>10}{'平均s':>8}{'CPU s':>10}"
+          f"{'K线/任务':>10}{'K线/s':>10}{'峰值内存增量MB':>16}")
+    for (name, interval), group in sorted(groups.items()):
+        wall = sum(r['wall_time'] for r in group)
+        cpu = sum(r['cpu_time'] for r in group)
+        bars = sum(r['bars'] for r in group)
+        print(f"{name:<12}{interval:<6}{len(group):>6}{wall:>10.1f}{wall / len(group):>8.2f}{cpu:>10.1f}"
+              f"{bars / len(group):>10.0f}{bars / wall if wall else 0:>10.0f}"
+              f"{max(r['peak_rss_delta_mb'] for r in group):>16.1f}")
+
+    wall = sum(r['wall_time'] for r in records)
+    cpu = sum(r['cpu_time'] for r in records)
+    print(f"合计 {len(records)} 个任务: 回测耗时 {wall:.1f}s, CPU {cpu:.1f}s")
+    if elapsed:
+        print(f"实际用时 {elapsed:.1f}s, 并行加速 {wall / elapsed:.1f}x")
+
+
+def print_best(records):
+    by_name = {}
+    for record in records:
+        by_name.setdefault(record['name'], []).append(record)
+
+    for name, results in by_name.items():
+        with_annual = [r for r in results if r['annual'] is not None]
+        with_sharpe = [r for r in results if r['sharpe'] is not None]
+        for title, pool, metric in (('🏆 最佳年化参数组合', with_annual, 'annual'),
+                                    ('📊 最佳夏普参数组合', with_sharpe, 'sharpe')):
+            if not pool:
+                continue
+            best = max(pool, key=lambda r: r[metric])
+            print(f"\n{title} [{name}]:")
+            print(f"周期: {'+'.join([best['interval']] + best.get('resample', []))}, " + ", ".join(f"{k}={v}" for k, v in best['params'].items()))
+            print(f"🔹 夏普比率:  {format_float(best['sharpe'])}")
+            print(f"🔹 最大回撤:  {format_float(best['maxdd'])}%")
+            print(f"🔹 年化收益率: {format_float(best['annual'] * 100 if best['annual'] is not None else None, 4)}%")
+            print(f"🔹 交易次数: {best['trades']}")
+
+
+def load_jobs(args):
+    with open(args.config) as f:
+        config = json.load(f)
+    store = KlineStore(args.cache_dir)
+    prepare_data(config, store, offline=args.offline)
+    jobs = build_jobs(config, store, on_gap=args.gaps)
+    for job in jobs:
+        job['exactbars'] = args.exactbars
+    return jobs
+
+
+def format_record(record):
+    interval = '+'.join([record['interval']] + record.get('resample', []))
+    return (f"{record['name']} [{interval}] "
+            f"{', '.join(f'{k}={v}' for k, v in record['params'].items())} | "
+            f"Sharpe: {format_float(record['sharpe'])}, "
+            f"Annual: {format_float(record['annual'] * 100 if record['annual'] is not None else None)}%, "
+            f"MaxDD: {format_float(record['maxdd'])}%, "
+            f"Trades: {record['trades']}"
+            + (f" | {record['wall_time']:.1f}s, {record['bars_per_sec']:.0f} bars/s"
+               if record.get('bars_per_sec') else ""))
+
+
+def execute(todo, n_jobs, cache_dir, writer, total=None, metric='sharpe'):
+    """
+    在进程池里运行任务，逐个返回结果。结果都回到主进程，由 writer（RecordWriter）一个写入者缓冲写入结果文件，
+    工作进程不输出，控制台只刷新一行进度和预计剩余时间。
+    todo 为列表时按最长处理时间优先（LPT）排序：大任务先占满核心，小任务最后填空；
+    为生成器时按生成顺序边生成边分发（stream_jobs 已按数据集从大到小排好）。
+    """
+    if isinstance(todo, list):
+        todo = sorted(todo, key=lambda job: job['cost'], reverse=True)
+        total = len(todo)
+    if n_jobs > 1:
+        pool = multiprocessing.Pool(n_jobs, initializer=_init_worker, initargs=(cache_dir,))
+        results = pool.imap_unordered(run_job, todo, chunksize=1)
+    else:
+        pool = None
+        _init_worker(cache_dir)
+        results = map(run_job, todo)
+
+    progress = Progress(total, metric=metric)
+    try:
+        for record in results:
+            writer.write(record)
+            progress.update(record)
+            yield record
+    finally:
+        # 中断时已返回的结果也落盘，--resume 不会重跑
+        writer.flush()
+        progress.close()
+        if pool is not None:
+            pool.terminate()
+
+
+def sweep(args):
+    with open(args.config) as f:
+        config = json.load(f)
+    store = KlineStore(args.cache_dir)
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    done = load_done(output) if args.resume else {}
+    if not args.resume and output.exists():
+        output.unlink()
+    # 任务 key 只由配置决定，不用等数据下载就能算出总数
+    keys = [job_key({'strategy': sweep_conf['strategy'], 'symbol': symbol, 'interval': interval, 'params': params,
+                     'resample': sweep_conf.get('resample', [])})
+            for sweep_conf, symbol, interval, grid in sweep_grids(config) for params in grid]
+    pending = sum(key not in done for key in keys)
+
+    print(f"🔍 正在进行参数优化: 共 {len(keys)} 个任务，已完成 {len(keys) - pending}，"
+          f"待运行 {pending}，进程数 {args.jobs}\n")
+
+    records = [done[key] for key in keys if key in done]
+    resumed = len(records)
+    started = time.time()
+    with RecordWriter(output, mode='a') as writer:
+        records.extend(execute(stream_jobs(args, config, store, done), args.jobs, args.cache_dir, writer,
+                               total=pending, metric=args.metric))
+
+    elapsed = time.time() - started
+    print(f"\n⏱️ 用时 {elapsed:.1f}s，结果已写入 {output}")
+    # 只汇总本次运行的任务，--resume 跳过的旧结果不计入实际用时
+    print_cost_summary(records[resumed:], elapsed)
+    print('\n' + ranking_table(records, args.metric, args.top))
+    print_best(records)
+
+
+def axis_neighbors(values, value, radius):
+    """
+    参数轴上 value 前后各 radius 步的取值。
+    最优点常落在配置范围的边上，超出范围的一侧按边上的步长外推（只外推数值参数，且保持为正）。
+    """
+    values = sorted(set(values) | {value})
+    i = values.index(value)
+    numeric = isinstance(value, (int, float)) and not isinstance(value, bool) and len(values) > 1
+    out = []
+    for j in range(i - radius, i + radius + 1):
+        if 0 <= j < len(values):
+            out.append(values[j])
+        elif numeric:
+            if j < 0:
+                v = values[0] + (values[1] - values[0]) * j
+            else:
+                v = values[-1] + (values[-1] - values[-2]) * (j - len(values) + 1)
+            v = round(v, 10) if isinstance(v, float) else v
+            if v > 0:
+                out.append(v)
+    return out
+
+
+def neighborhood(sweep_conf, params, radius):
+    """params 在参数网格上的邻域（含自身），不满足约束的组合去掉"""
+    names = list(params)
+    axes = [axis_neighbors(expand_values(sweep_conf['params'][name]), params[name], radius) for name in names]
+    grid = [dict(zip(names, values)) for values in itertools.product(*axes)]
+    return [p for p in grid if satisfies(p, sweep_conf.get('constraints', []))]
+
+
+def sensitivity(args):
+    """
+    参数邻域敏感度：对结果文件里每个策略排名前 top 的参数组合，计算它在参数网格上相邻组合的平均得分。
+    邻域里已有结果的直接读取，缺的才交给进程池回测（结果追加到同一个文件，下次不用再跑），
+    所以代价只是少量新回测。邻域均值接近本点说明附近都不错；本点远高于邻居则可能是过拟合的尖峰。
+    """
+    with open(args.config) as f:
+        config = json.load(f)
+    sweeps = {s.get('name', s['strategy']): s for s in config['sweeps']}
+    output = Path(args.results)
+    done = load_done(output)
+    if not done:
+        sys.exit(f"❌ {output} 中没有结果，先运行 sweep")
+
+    jobs = load_jobs(args)
+    # 同一个策略、周期下的任务只有参数不同，邻居任务从模板复制
+    templates = {(job['name'], job['interval'], tuple(job['resample'])): job for job in jobs}
+    grid_keys = {job_key(job) for job in jobs}
+    grid_sizes = {}
+    for job in jobs:
+        grid_sizes[job['name']] = grid_sizes.get(job['name'], 0) + 1
+
+    names = [args.name] if args.name else sorted({r['name'] for r in done.values()} & set(sweeps))
+    centers = []      # [(record, [邻居 key])]
+    todo = {}
+    for name in names:
+        # 只从配置网格上的组合里挑中心点；外推出来的邻居只参与打分，避免每次运行邻域都向外扩
+        pool = [r for r in done.values() if r['name'] == name and r.get(args.metric) is not None
+                and r['key'] in grid_keys]
+        pool.sort(key=lambda r: r[args.metric], reverse=True)
+        for record in pool[:args.top]:
+            template = templates.get((name, record['interval'], tuple(record.get('resample', []))))
+            if template is None:
+                print(f"⚠️ {name} {record['interval']} 不在当前配置中，跳过")
+                continue
+            keys = []
+            for params in neighborhood(sweeps[name], record['params'], args.radius):
+                job = dict(template, params=params)
+                key = job_key(job)
+                keys.append(key)
+                if key not in done:
+                    todo[key] = job
+            centers.append((record, keys))
+
+    total = sum(grid_sizes.get(name, 0) for name in names)
+    print(f"🧭 邻域共 {len({k for _, keys in centers for k in keys})} 个参数组合，"
+          f"需要新回测 {len(todo)} 个（完整网格 {total} 个），进程数 {args.jobs}\n")
+    if todo:
+        with RecordWriter(output, mode='a') as writer:
+            for record in execute(list(todo.values()), args.jobs, args.cache_dir, writer, metric=args.metric):
+                done[record['key']] = record
+
+    for name in names:
+        rows = []
+        for center, keys in centers:
+            if center['name'] != name:
+                continue
+            scores = [done[k][args.metric] for k in keys if k in done and done[k].get(args.metric) is not None]
+            if not scores:
+                continue
+            mean = sum(scores) / len(scores)
+            std = math.sqrt(sum((x - mean) ** 2 for x in scores) / len(scores))
+            rows.append((center, mean, min(scores), std, len(scores), len(keys)))
+        if not rows:
+            continue
+
+        print(f"\n🧭 参数邻域敏感度 [{name}]（{args.metric}，半径 {args.radius}）:")
+        print(f"{'周期':<10}{'参数':<48}{'本点':>9}{'邻域均值':>10}{'邻域最低':>10}{'标准差':>9}{'邻居数':>8}")
+        for center, mean, low, std, n, size in rows:
+            interval = '+'.join([center['interval']] + center.get('resample', []))
+            params = ', '.join(f'{k}={v}' for k, v in center['params'].items())
+            print(f"{interval:<10}{params:<48}{center[args.metric]:>9.3f}{mean:>10.3f}{low:>10.3f}"
+                  f"{std:>9.3f}{f'{n}/{size}':>8}")
+        # 按邻域均值（平滑后的得分）重新排序，推荐附近整体都好的参数
+        best = max(rows, key=lambda row: row[1])
+        print(f"✅ 邻域均值最高: [{'+'.join([best[0]['interval']] + best[0].get('resample', []))}] "
+              + ", ".join(f"{k}={v}" for k, v in best[0]['params'].items()))
+
+
+def publish(args):
+    jobs = load_jobs(args)
+    queue = JobQueue(args.queue)
+    n = queue.publish(jobs, job_key)
+    print(f"📤 发布 {n} 个新任务到 {args.queue}（共 {len(jobs)} 个，其余已在队列中）")
+    print(f"📋 队列状态: {queue.counts()}")
+
+
+def _worker_loop(queue_path, cache_dir, lease, offline, wait):
+    _init_worker(cache_dir)
+    queue = JobQueue(queue_path)
+    name = worker_name()
+    prepared = set()
+    while True:
+        claimed = queue.claim(name, lease)
+        if claimed is None:
+            # 还有别人租着的任务时继续等，对方崩溃后租约过期可以接手
+            if wait and queue.counts()['leased']:
+                time.sleep(min(lease / 3, 30))
+                continue
+            break
+
+        key, job = claimed
+        if not offline and (job['symbol'], job['interval']) not in prepared:
+            lookback_days = math.ceil((time.time() * 1000 - job['start']) / 86_400_000)
+            try:
+                _store.download(job['symbol'], job['interval'], lookback_days)
+            except Exception as e:
+                print(f"⚠️ 无法更新 {job['symbol']} {job['interval']}，使用本地缓存: {e}")
+            prepared.add((job['symbol'], job['interval']))
+
+        try:
+            with LeaseKeeper(queue_path, key, name, lease):
+                record = run_job(job)
+        except Exception as e:
+            print(f"❌ [{name}] {job['name']} {job['params']} 失败: {e}")
+            queue.release(key, name)
+            continue
+        queue.complete(key, record)
+    queue.close()
+
+
+def worker(args):
+    """
+    工作进程只从队列领任务、把结果写回队列，不逐个打印；
+    主进程定期读队列状态刷新一行进度（完成数包括其他机器上的 worker）。
+    """
+    loop_args = (args.queue, args.cache_dir, args.lease, args.offline, not args.no_wait)
+    started = time.time()
+    queue = JobQueue(args.queue)
+    counts = queue.counts()
+    progress = Progress(counts['pending'] + counts['leased'])
+    done = counts['done']
+    procs = [multiprocessing.Process(target=_worker_loop, args=loop_args) for _ in range(max(args.jobs, 1))]
+    for proc in procs:
+        proc.start()
+    while any(proc.is_alive() for proc in procs):
+        time.sleep(1.0)
+        counts = queue.counts()
+        if counts['done'] > done:
+            progress.update(n=counts['done'] - done)
+            done = counts['done']
+    for proc in procs:
+        proc.join()
+    progress.close()
+    print(f"\n⏱️ 用时 {time.time() - started:.1f}s，队列状态: {queue.counts()}")
+    queue.close()
+
+
+def collect(args):
+    queue = JobQueue(args.queue)
+    records = queue.results()
+    print(f"📋 队列状态: {queue.counts()}")
+    if args.output:
+        with RecordWriter(args.output) as writer:
+            for record in records:
+                writer.write(record)
+        print(f"💾 结果已写入 {args.output}")
+    print_cost_summary(records)
+    print('\n' + ranking_table(records, args.metric, args.top))
+    print_best(records)
+
+
+def update(args):
+    """
+    从快照恢复模拟器状态，只推进仓库里新追加的K线，结果与从同一起点完整重跑一致。
+    没有快照时按 lookback_days 完整回测一次并保存快照。
+    """
+    with open(args.config) as f:
+        config = json.load(f)
+    sweep_conf = next(s for s in config['sweeps'] if s.get('name', s['strategy']) == args.name)
+    if sweep_conf['strategy'] not in SIMULATORS:
+        sys.exit(f"❌ {sweep_conf['strategy']} 没有对应的向量化模拟器，不支持增量回测")
+    symbol = sweep_conf.get('symbol', config.get('symbol', 'BTCUSDT'))
+    params = json.loads(args.params)
+
+    store = KlineStore(args.cache_dir)
+    if not args.offline:
+        try:
+            store.download(symbol, args.interval, sweep_conf.get('lookback_days', 300))
+        except Exception as e:
+            print(f"⚠️ 无法更新 {symbol} {args.interval}，使用本地缓存: {e}")
+
+    snapshot = Path(args.snapshot or f"output/{args.name}_{args.interval}.snap")
+    if snapshot.exists():
+        sim = GridSimulator.load(snapshot)
+        if sim.params_list != [params]:
+            sys.exit(f"❌ 快照 {snapshot} 的参数是 {sim.params_list[0]}，与 --params 不一致")
+        start = int(sim.last_time.value // 1_000_000) + 1
+        print(f"📂 从快照继续: 已处理 {sim.nbars} 根K线，最后一根 {sim.last_time}")
+    else:
+        window = data_window(store, symbol, args.interval, sweep_conf.get('lookback_days', 300))
+        if window is None:
+            sys.exit(f"❌ 仓库中没有 {symbol} {args.interval} 的数据")
+        sim = SIMULATORS[sweep_conf['strategy']]([params], cash=sweep_conf.get('cash', 10000.0),
+                                                 commission=sweep_conf.get('commission', 0.0008))
+        start = window[0]
+
+    # 第一次完整回测也分块推进，长历史不必整段读进内存
+    n = sim.feed_chunks(store.iter_chunks(symbol, args.interval, start=start, on_gap=args.gaps))
+    sim.save(snapshot)
+    print(f"💾 新处理 {n} 根K线，快照已保存到 {snapshot}")
+
+    record = sim.results()[0]
+    record.update({'name': args.name, 'interval': args.interval, 'params': params})
+    print(format_record(record))
+
+
+def vector(args):
+    """
+    用向量化模拟器在仓库的长历史（例如多年的 1m）上回测一个策略的整个参数网格。
+    K线按块从仓库读出逐块推进，指标和持仓状态跨块延续，结果与整段一次推进一致，峰值内存只取决于 --chunksize。
+    """
+    with open(args.config) as f:
+        config = json.load(f)
+    sweep_conf = next(s for s in config['sweeps'] if s.get('name', s['strategy']) == args.name)
+    if sweep_conf['strategy'] not in SIMULATORS:
+        sys.exit(f"❌ {sweep_conf['strategy']} 没有对应的向量化模拟器")
+    symbol = sweep_conf.get('symbol', config.get('symbol', 'BTCUSDT'))
+    grid = param_grid(**{name: expand_values(spec) for name, spec in sweep_conf['params'].items()})
+    grid = [p for p in grid if satisfies(p, sweep_conf.get('constraints', []))]
+
+    store = KlineStore(args.cache_dir)
+    if not args.offline:
+        try:
+            store.download(symbol, args.interval, args.days)
+        except Exception as e:
+            print(f"⚠️ 无法更新 {symbol} {args.interval}，使用本地缓存: {e}")
+    window = data_window(store, symbol, args.interval, args.days)
+    if window is None:
+        sys.exit(f"❌ 仓库中没有 {symbol} {args.interval} 的数据")
+
+    sim = SIMULATORS[sweep_conf['strategy']](grid, cash=sweep_conf.get('cash', 10000.0),
+                                             commission=sweep_conf.get('commission', 0.0008))
+    print(f"🔍 {args.name} {symbol} {args.interval}: {len(grid)} 组参数，每块 {args.chunksize} 根K线")
+    wall, rss = time.perf_counter(), peak_rss_mb()
+    n = sim.feed_chunks(store.iter_chunks(symbol, args.interval, *window, chunksize=args.chunksize, on_gap=args.gaps))
+    wall = time.perf_counter() - wall
+    print(f"⏱️ {n} 根K线，用时 {wall:.1f}s（{n / wall if wall else 0:.0f} 根/s，{n * len(grid) / wall if wall else 0:.0f} 组·根/s），"
+          f"峰值内存增量 {peak_rss_mb() - rss:.1f}MB")
+
+    records = []
+    for result in sim.results():
+        params = {k: result.pop(k) for k in grid[0]}
+        result.update({'name': args.name, 'interval': args.interval, 'params': params})
+        records.append(result)
+    if args.output:
+        with RecordWriter(args.output) as writer:
+            for record in records:
+                writer.write(record)
+        print(f"💾 结果已写入 {args.output}")
+    print('\n' + ranking_table(records, 'sharpe', args.top))
+    print_best(records)
+
+
+def compare(args):
+    """
+    多个策略（sweeps.json 里的多个策略名，各自的整个参数网格）在同一份数据上比较：
+    数据只读一次，同一趟K线循环里每个策略实例有独立的 broker 和分析器。
+    合成周期（resample）不同的策略看到的 datas 不同，分成不同的趟；--batch 限制每趟的策略数。
+    """
+    with open(args.config) as f:
+        config = json.load(f)
+    sweeps = [s for s in config['sweeps'] if not args.names or s.get('name', s['strategy']) in args.names]
+    if not sweeps:
+        sys.exit(f"❌ 配置里没有 {args.names}")
+    days = args.days or max(s.get('lookback_days', 300) for s in sweeps)
+
+    passes = {}
+    for sweep_conf in sweeps:
+        symbol = sweep_conf.get('symbol', config.get('symbol', 'BTCUSDT'))
+        resample = sweep_conf.get('resample', [])
+        for target in resample:
+            resample_timeframe(target, args.interval)
+        grid = param_grid(**{name: expand_values(spec) for name, spec in sweep_conf['params'].items()})
+        for params in grid:
+            if satisfies(params, sweep_conf.get('constraints', [])):
+                passes.setdefault((symbol, tuple(resample)), []).append((sweep_conf, params))
+
+    store = KlineStore(args.cache_dir)
+    output = Path(args.output)
+    records = []
+    started = time.perf_counter()
+    with RecordWriter(output) as writer:
+        for (symbol, resample), members in passes.items():
+            fetch_dataset(store, (symbol, args.interval, days), args.offline)
+            window = data_window(store, symbol, args.interval, days)
+            if window is None:
+                print(f"⚠️ 仓库中没有 {symbol} {args.interval} 的数据，跳过")
+                continue
+            df = store.load_frame(symbol, args.interval, *window, on_gap=args.gaps)
+            batch = args.batch or len(members)
+            for i in range(0, len(members), batch):
+                chunk = members[i:i + batch]
+                print(f"🔍 {symbol} {'+'.join((args.interval,) + resample)}: {len(df)} 根K线，"
+                      f"一趟挂 {len(chunk)} 个策略实例")
+                # 资金和手续费按各自策略的配置设置在各自的 broker 上
+                entries = [(load_strategy(s['strategy']), params, s.get('cash', 10000.0), s.get('commission', 0.0008))
+                           for s, params in chunk]
+                results = run_many(entries, df, interval=args.interval, resample=list(resample))
+                cost = results[0] if results else {}
+                if cost.get('pass_wall_time'):
+                    print(f"   这一趟用时 {cost['pass_wall_time']:.1f}s，CPU {cost['pass_cpu_time']:.1f}s，"
+                          f"{len(df) / cost['pass_wall_time']:.0f} K线/s，峰值内存增量 {cost['pass_peak_rss_delta_mb']:.1f}MB")
+                for (sweep_conf, params), record in zip(chunk, results):
+                    job = {'strategy': sweep_conf['strategy'], 'symbol': symbol, 'interval': args.interval,
+                           'params': params, 'resample': list(resample)}
+                    record.update({'name': sweep_conf.get('name', sweep_conf['strategy']),
+                                   'interval': args.interval, 'params': params, 'key': job_key(job)})
+                    if resample:
+                        record['resample'] = list(resample)
+                    writer.write(record)
+                    records.append(record)
+
+    print(f"⏱️ {len(records)} 个策略实例，用时 {time.perf_counter() - started:.1f}s，结果已写入 {output}")
+    print('\n' + ranking_table(records, 'sharpe', args.top))
+    print_best(records)
+
+
+def import_csv(args):
+    store = KlineStore(args.cache_dir)
+    for path in args.files:
+        n = store.import_csv(path, args.symbol, args.interval)
+        print(f"💾 {path}: 写入 {n} 根K线")
+
+
+def ingest_trades(args):
+    # --bars time:1s / volume:100 / dollar:5000000
+    kind, _, size = args.bars.partition(':')
+    if kind == 'time':
+        size_value, interval = parse_interval(size), size
+    else:
+        size_value, interval = float(size), f"{kind}{size}"
+
+    if args.endpoint:
+        start = int(pd.Timestamp(args.start).timestamp() * 1000)
+        end = int(pd.Timestamp(args.end).timestamp() * 1000)
+        chunks = fetch_agg_trades(args.symbol, start, end, base_url=args.endpoint)
+    else:
+        # 币安公开数据文件名按日期排序即为时间顺序
+        chunks = itertools.chain.from_iterable(
+            read_agg_trades(path, chunksize=args.chunksize) for path in sorted(args.files))
+
+    store = KlineStore(args.cache_dir)
+    started = time.time()
+    n = store.append_chunks(args.symbol, args.interval or interval, aggregate_bars(chunks, kind, size_value))
+    print(f"💾 {args.symbol} {args.interval or interval}: 写入 {n} 根K线，用时 {time.time() - started:.1f}s")
+
+
+def ingest_klines(args):
+    """币安公开数据的K线 zip 归档（或本地镜像目录）并行校验、解析后批量写入仓库，不走 REST 接口"""
+    archives = find_archives(args.paths, symbols=args.symbols, intervals=args.intervals)
+    if not archives:
+        sys.exit(f"❌ {args.paths} 中没有 <交易对>-<周期>-<日期>.zip 格式的K线归档")
+    print(f"📦 {len(archives)} 个归档，{len({(a.symbol, a.interval) for a in archives})} 个序列，进程数 {args.jobs}")
+
+    store = KlineStore(args.cache_dir)
+    progress = Progress(len(archives))
+    written, parsed, errors = {}, 0, []
+    started = time.perf_counter()
+    for archive, n, rows, error in ingest(store, archives, jobs=args.jobs, strict=args.strict):
+        series = (archive.symbol, archive.interval)
+        written[series] = written.get(series, 0) + n
+        parsed += rows
+        if error is not None:
+            errors.append((archive, error))
+        progress.update()
+    progress.close()
+    elapsed = time.perf_counter() - started
+
+    for (symbol, interval), n in sorted(written.items()):
+        gaps = len(store.gaps(symbol, interval))
+        print(f"💾 {symbol} {interval}: 写入 {n} 根K线，仓库共 {store.rows(symbol, interval)} 根"
+              + (f"，{gaps} 处缺口" if gaps else ""))
+    # 用时包含校验、解析、追加和回填合并，是端到端的速度
+    print(f"⏱️ 解析 {parsed} 根K线，用时 {elapsed:.1f}s（{parsed / elapsed if elapsed else 0:,.0f} 根/s）")
+    if parsed > sum(written.values()):
+        print(f"ℹ️ {parsed - sum(written.values())} 根K线仓库里已经有了（或月度、日度归档重叠），已跳过")
+    for archive, error in errors:
+        print(f"❌ {archive.path}: {error}")
+    if errors:
+        sys.exit(1)
+
+
+def main():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--cache-dir', default='data/store', help='本地K线仓库目录')
+    parser = argparse.ArgumentParser(description='加密货币策略参数优化')
+    sub = parser.add_subparsers(dest='command')
+
+    # sweep 和 publish 共用的任务展开参数
+    jobs_opts = argparse.ArgumentParser(add_help=False)
+    jobs_opts.add_argument('config', nargs='?', default='sweeps.json')
+    jobs_opts.add_argument('--offline', action='store_true', help='不联网更新数据，只用本地仓库')
+    jobs_opts.add_argument('--exactbars', type=int, default=0,
+                           help='非 0 时从仓库分块流式读取，并按 backtrader exactbars 限制回看缓存（长历史用）')
+    jobs_opts.add_argument('--gaps', choices=('ignore', 'raise', 'fill'), default='ignore',
+                           help='K线缺失时的处理：忽略、报错，或补成平盘K线')
+
+    p = sub.add_parser('sweep', parents=[common, jobs_opts], help='按配置文件运行参数优化')
+    p.add_argument('--jobs', type=int, default=os.cpu_count(), help='并行进程数')
+    p.add_argument('--output', default='output/sweep_results.jsonl', help='结果文件（JSON Lines）')
+    p.add_argument('--resume', action='store_true', help='跳过结果文件中已完成的任务')
+    p.add_argument('--prefetch', type=int, default=1, help='回测当前数据集时，后台提前下载几个数据集')
+    p.add_argument('--metric', choices=('sharpe', 'annual', 'return'), default='sharpe', help='进度和排名表按哪个指标')
+    p.add_argument('--top', type=int, default=20, help='结束时排名表的行数')
+    p.set_defaults(func=sweep)
+
+    p = sub.add_parser('sensitivity', parents=[common, jobs_opts], help='从已有结果计算最优参数的邻域敏感度')
+    p.add_argument('--results', default='output/sweep_results.jsonl', help='sweep 的结果文件，新回测的邻居也追加到这里')
+    p.add_argument('--name', help='只分析 sweeps.json 中的这个策略')
+    p.add_argument('--metric', choices=('sharpe', 'annual', 'return'), default='sharpe')
+    p.add_argument('--top', type=int, default=5, help='每个策略分析排名前几的参数组合')
+    p.add_argument('--radius', type=int, default=1, help='每个参数向两侧各取几步')
+    p.add_argument('--jobs', type=int, default=os.cpu_count(), help='并行进程数')
+    p.set_defaults(func=sensitivity)
+
+    p = sub.add_parser('publish', parents=[common, jobs_opts], help='把参数组合发布到共享任务队列')
+    p.add_argument('--queue', required=True, help='共享存储上的队列文件（SQLite）')
+    p.set_defaults(func=publish)
+
+    p = sub.add_parser('worker', parents=[common], help='从共享任务队列领取任务并回测')
+    p.add_argument('--queue', required=True, help='共享存储上的队列文件（SQLite）')
+    p.add_argument('--jobs', type=int, default=os.cpu_count(), help='本机并行进程数')
+    p.add_argument('--lease', type=float, default=600.0, help='租约秒数，worker 失联超过该时间任务会被重新分配')
+    p.add_argument('--offline', action='store_true', help='不联网更新数据，只用本地仓库')
+    p.add_argument('--no-wait', action='store_true', help='没有待运行任务时立即退出，不等待别人租着的任务')
+    p.set_defaults(func=worker)
+
+    p = sub.add_parser('collect', help='汇总共享任务队列里的结果')
+    p.add_argument('--queue', required=True, help='共享存储上的队列文件（SQLite）')
+    p.add_argument('--output', help='同时导出为 JSON Lines 文件')
+    p.add_argument('--metric', choices=('sharpe', 'annual', 'return'), default='sharpe', help='排名表按哪个指标')
+    p.add_argument('--top', type=int, default=20, help='排名表的行数')
+    p.set_defaults(func=collect)
+
+    p = sub.add_parser('update', parents=[common], help='从快照继续，只回测新追加的K线')
+    p.add_argument('name', help='sweeps.json 中的策略名，例如 turtle')
+    p.add_argument('--config', default='sweeps.json')
+    p.add_argument('--interval', required=True)
+    p.add_argument('--params', required=True, help='参数组合（JSON），例如 \'{"entry_period": 20}\'')
+    p.add_argument('--snapshot', help='快照文件，默认 output/<name>_<interval>.snap')
+    p.add_argument('--offline', action='store_true', help='不联网更新数据，只用本地仓库')
+    p.add_argument('--gaps', choices=('ignore', 'raise', 'fill'), default='ignore',
+                   help='K线缺失时的处理：忽略、报错，或补成平盘K线')
+    p.set_defaults(func=update)
+
+    p = sub.add_parser('vector', parents=[common], help='向量化模拟器分块回测长历史（例如多年 1m）')
+    p.add_argument('name', help='sweeps.json 中的策略名，例如 turtle')
+    p.add_argument('--config', default='sweeps.json')
+    p.add_argument('--interval', default='1m')
+    p.add_argument('--days', type=int, default=1825, help='回测最近多少天')
+    p.add_argument('--chunksize', type=int, default=200_000, help='每块K线根数，决定峰值内存')
+    p.add_argument('--output', help='结果写入的 JSON Lines 文件')
+    p.add_argument('--top', type=int, default=10, help='打印夏普最高的前几组')
+    p.add_argument('--offline', action='store_true', help='不联网更新数据，只用本地仓库')
+    p.add_argument('--gaps', choices=('ignore', 'raise', 'fill'), default='ignore',
+                   help='K线缺失时的处理：忽略、报错，或补成平盘K线')
+    p.set_defaults(func=vector)
+
+    p = sub.add_parser('compare', parents=[common], help='多个策略共用一份数据、一次K线循环比较')
+    p.add_argument('config', nargs='?', default='sweeps.json')
+    p.add_argument('--names', nargs='*', help='sweeps.json 中的策略名，默认全部')
+    p.add_argument('--interval', default='1h')
+    p.add_argument('--days', type=int, help='回测最近多少天，默认取这些策略 lookback_days 的最大值')
+    p.add_argument('--batch', type=int, default=100, help='每趟最多挂几个策略实例（内存随之增长），0 为不限')
+    p.add_argument('--output', default='output/compare_results.jsonl', help='结果文件（JSON Lines）')
+    p.add_argument('--top', type=int, default=10, help='打印夏普最高的前几组')
+    p.add_argument('--offline', action='store_true', help='不联网更新数据，只用本地仓库')
+    p.add_argument('--gaps', choices=('ignore', 'raise', 'fill'), default='ignore',
+                   help='K线缺失时的处理：忽略、报错，或补成平盘K线')
+    p.set_defaults(func=compare)
+
+    p = sub.add_parser('import-csv', parents=[common], help='把 data/*.csv 缓存导入K线仓库')
+    p.add_argument('files', nargs='+')
+    p.add_argument('--symbol', default='BTCUSDT')
+    p.add_argument('--interval', required=True)
+    p.set_defaults(func=import_csv)
+
+    p = sub.add_parser('ingest-trades', parents=[common], help='逐笔成交聚合成K线写入仓库')
+    p.add_argument('files', nargs='*', help='aggTrades 的 CSV 或 zip 文件')
+    p.add_argument('--symbol', default='BTCUSDT')
+    p.add_argument('--bars', default='time:1s', help='time:<周期> / volume:<数量> / dollar:<成交额>')
+    p.add_argument('--interval', help='写入仓库时使用的周期名，默认由 --bars 生成')
+    p.add_argument('--chunksize', type=int, default=1_000_000, help='每块读取的成交笔数')
+    p.add_argument('--endpoint', help='从 REST 接口（或本地模拟服务）拉取，例如 https://api.binance.com')
+    p.add_argument('--start', help='配合 --endpoint 使用的开始时间（UTC）')
+    p.add_argument('--end', help='配合 --endpoint 使用的结束时间（UTC）')
+    p.set_defaults(func=ingest_trades)
+
+    p = sub.add_parser('ingest-klines', parents=[common], help='导入币安公开数据的K线 zip 归档（不走 REST）')
+    p.add_argument('paths', nargs='+', help='归档文件或本地镜像目录（递归查找 <交易对>-<周期>-<日期>.zip）')
+    p.add_argument('--symbols', nargs='*', help='只导入这些交易对')
+    p.add_argument('--intervals', nargs='*', help='只导入这些周期')
+    p.add_argument('--jobs', type=int, default=os.cpu_count(), help='并行解析的进程数')
+    p.add_argument('--strict', action='store_true', help='没有 .CHECKSUM 校验文件的归档也当作错误')
+    p.set_defaults(func=ingest_klines)
+
+    # 不带子命令时默认运行 sweep（README 中的 python strategy.py）
+    argv = sys.argv[1:]
+    if not argv or argv[0] not in sub.choices and argv[0] not in ('-h', '--help'):
+        argv = ['sweep'] + argv
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
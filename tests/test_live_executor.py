@@ -0,0 +1,179 @@
+"""
+OrderExecutor / LiveBroker 对着本地模拟交易所（live/mock_exchange.py）的测试
+
+覆盖：5xx 后按 clientOrderId 查询不重复下单、HTML 502 等非 JSON 响应、拒单、
+下单协程意外抛出异常、用户数据流断线重连后的对账。
+"""
+import queue
+import sys
+import time
+import types
+from pathlib import Path
+
+import backtrader as bt
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from live.broker import LiveBroker  # noqa: E402
+from live.executor import OrderExecutor  # noqa: E402
+from live.latency import LatencyTracer  # noqa: E402
+from live.mock_exchange import MockExchange  # noqa: E402
+from strategies.TurtleStrategy import TurtleATRStrategy  # noqa: E402
+
+SYMBOL = 'BTCUSDT'
+
+
+@pytest.fixture
+def exchange(request):
+    exchange = MockExchange(**getattr(request, 'param', {}))
+    exchange.start()
+    yield exchange
+    exchange.stop()
+
+
+def make_executor(exchange, secret='mock'):
+    return OrderExecutor('key', secret, base_url=f'http://127.0.0.1:{exchange.port}',
+                         ws_base=f'ws://127.0.0.1:{exchange.port}/ws').start()
+
+
+@pytest.fixture
+def executor(exchange):
+    executor = make_executor(exchange)
+    yield executor
+    executor.stop()
+
+
+def make_data():
+    """只推进了一根K线的数据源，LiveBroker 成交时要读当前K线的时间"""
+    df = pd.DataFrame({c: [100.0, 100.0] for c in ('open', 'high', 'low', 'close', 'volume')},
+                      index=pd.date_range('2024-01-01', periods=2, freq='h'))
+    data = bt.feeds.PandasData(dataname=df, name=SYMBOL)
+    bt.Cerebro().adddata(data)
+    data._start()
+    data.next()
+    return data
+
+
+def collect(executor, count, timeout=10.0):
+    """从执行器的事件队列里取出 count 个 ack / reject 事件"""
+    events, deadline = [], time.monotonic() + timeout
+    while sum(kind in ('ack', 'reject') for kind, _, _ in events) < count:
+        events.append(executor.events.get(timeout=max(deadline - time.monotonic(), 0.01)))
+    return events
+
+
+def wait_for(broker, predicate, timeout=10.0):
+    """反复调用 broker.next() 处理事件，直到 predicate() 成立"""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, '等待超时'
+        broker.next()
+        time.sleep(0.01)
+
+
+def statuses(broker):
+    notifs = []
+    while (order := broker.get_notification()) is not None:
+        notifs.append(order.getstatusname())
+    return notifs
+
+
+@pytest.mark.parametrize('exchange', [{'fail_rate': 0.5}], indirect=True)
+def test_unknown_status_is_resolved_without_duplicates(exchange, executor):
+    # 一半的下单请求在受理后返回 503：查询到订单就当作已受理，不会重发
+    ids = [executor.client_order_id(i) for i in range(30)]
+    for client_id in ids:
+        executor.place(client_id, SYMBOL, 'BUY', 0.01)
+    events = collect(executor, len(ids))
+    acks = [client_id for kind, client_id, _ in events if kind == 'ack']
+    assert sorted(acks) == sorted(ids)
+    assert sorted(exchange.orders) == sorted(ids)
+
+
+@pytest.mark.parametrize('exchange', [{'fail_rate': 1.0, 'fail_html': True}], indirect=True)
+def test_html_502_goes_through_query(exchange, executor):
+    ids = [executor.client_order_id(i) for i in range(5)]
+    for client_id in ids:
+        executor.place(client_id, SYMBOL, 'BUY', 0.01).result(timeout=10)
+    events = collect(executor, len(ids))
+    assert sorted(client_id for kind, client_id, _ in events if kind == 'ack') == sorted(ids)
+    assert len(exchange.orders) == len(ids)
+
+
+def test_rejected_order(exchange):
+    # 签名错误：交易所返回 400 -1022，订单被拒绝，追踪随之结束
+    executor = make_executor(exchange, secret='wrong')
+    try:
+        tracer = LatencyTracer()
+        tracer.begin(1)
+        tracer.activate(1)
+        broker = LiveBroker(executor=executor, tracer=tracer)
+        order = broker.buy(None, make_data(), 0.01)
+        wait_for(broker, lambda: not order.alive())
+        assert order.status == order.Rejected
+        assert statuses(broker) == ['Submitted', 'Rejected']
+        assert not broker._inflight and 1 not in tracer._open
+    finally:
+        executor.stop()
+
+
+def test_zero_size_rejected(exchange, executor):
+    broker = LiveBroker(executor=executor)
+    order = broker.buy(None, make_data(), 0.000001)   # 按 stepSize 0.00001 取整为 0
+    assert order.status == order.Rejected
+
+
+def test_turtle_releases_rejected_order():
+    # 海龟策略在拒单 / 过期后要清掉挂单引用，否则之后的 next() 都不会再下单
+    for status in (bt.Order.Rejected, bt.Order.Expired, bt.Order.Completed):
+        strategy = types.SimpleNamespace(order=object())
+        order = bt.Order.__new__(bt.BuyOrder)
+        order.status = status
+        TurtleATRStrategy.notify_order(strategy, order)
+        assert strategy.order is None
+
+
+@pytest.mark.parametrize('sent', [True, False])
+def test_unexpected_exception_is_resolved(exchange, executor, sent):
+    # 下单协程抛出意料之外的异常：请求已经到达交易所时按查询结果成交，没有到达时拒绝
+    request = executor._request
+
+    async def broken(method, path, params=None, signed=False):
+        if method == 'POST' and path == '/api/v3/order':
+            if sent:
+                await request(method, path, params, signed)
+            raise RuntimeError('boom')
+        return await request(method, path, params, signed)
+
+    executor._request = broken
+    tracer = LatencyTracer()
+    tracer.begin(1)
+    tracer.activate(1)
+    broker = LiveBroker(executor=executor, tracer=tracer)
+    data = make_data()
+    order = broker.buy(None, data, 0.01)
+    wait_for(broker, lambda: not order.alive())
+    if sent:
+        assert order.status == order.Completed
+        assert broker.getposition(data).size == pytest.approx(0.01)
+    else:
+        assert order.status == order.Rejected
+        assert exchange.orders == {}
+    assert not broker._inflight and 1 not in tracer._open
+
+
+def test_reconnect_reconciles_missed_fills(exchange, executor):
+    broker = LiveBroker(executor=executor)
+    data = make_data()
+    order = broker.buy(None, data, 0.01, price=90.0, exectype=bt.Order.Limit)
+    wait_for(broker, lambda: order.status == order.Accepted)
+
+    # 断线期间限价单成交，成交回报没有推送；重连后查询补上
+    exchange.call(exchange.disconnect_users())
+    exchange.call(exchange.move_price(SYMBOL, 80.0))
+    wait_for(broker, lambda: order.status == order.Completed)
+    assert broker.getposition(data).size == pytest.approx(0.01)
+    assert broker.getcash() == pytest.approx(10000.0 - 0.01 * 90.0)
+    with pytest.raises(queue.Empty):
+        executor.events.get(timeout=0.2)
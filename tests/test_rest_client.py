@@ -0,0 +1,151 @@
+"""
+RestClient 对着本地模拟服务的测试
+
+覆盖：429 按 Retry-After 等待后重试、5xx 退避重试、X-MBX-USED-WEIGHT-1M 响应头同步权重、
+权重接近上限时 _acquire 等到下一分钟。
+"""
+import json
+import sys
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import data.rest_client as rest_client  # noqa: E402
+from data.rest_client import RestClient  # noqa: E402
+
+
+class MockServer(object):
+    """按顺序返回预设响应 (status, headers, body) 的 HTTP 服务，响应用完后返回 200 []"""
+
+    def __init__(self):
+        self.responses = []
+        self.requests = []      # (path, 收到请求的时间)
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append((self.path, time.time()))
+                status, headers, body = server.responses.pop(0) if server.responses else (200, {}, [])
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.httpd.server_address[1]}'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    server = MockServer()
+    yield server
+    server.stop()
+
+
+def make_client(server, **kwargs):
+    return RestClient(server.url, backoff=0.01, max_backoff=0.05, timeout=5, **kwargs)
+
+
+def test_429_waits_for_retry_after(server):
+    server.responses = [(429, {'Retry-After': '1'}, {'code': -1003, 'msg': 'Too many requests'}),
+                        (200, {}, {'ok': True})]
+    client = make_client(server)
+    assert client.get('/api/v3/ping') == {'ok': True}
+    assert client.retries == 1 and client.requests == 2
+    (_, first), (_, second) = server.requests
+    assert second - first >= 0.95
+    assert client.throttled > 0
+
+
+def test_429_raises_after_max_retries(server):
+    server.responses = [(429, {'Retry-After': '0'}, {})] * 3
+    client = make_client(server, max_retries=2)
+    with pytest.raises(requests.HTTPError):
+        client.get('/api/v3/ping')
+    assert len(server.requests) == 3
+
+
+def test_5xx_is_retried(server):
+    server.responses = [(503, {}, {}), (502, {}, {}), (200, {}, [1, 2, 3])]
+    client = make_client(server)
+    assert client.get('/api/v3/klines', {'symbol': 'BTCUSDT'}) == [1, 2, 3]
+    assert client.retries == 2
+    assert all(path.startswith('/api/v3/klines?symbol=BTCUSDT') for path, _ in server.requests)
+
+
+def test_5xx_raises_after_max_retries(server):
+    server.responses = [(503, {}, {})] * 3
+    client = make_client(server, max_retries=2)
+    with pytest.raises(requests.HTTPError):
+        client.get('/api/v3/ping')
+    assert len(server.requests) == 3
+
+
+def test_4xx_is_not_retried(server):
+    server.responses = [(400, {}, {'code': -1121, 'msg': 'Invalid symbol.'})]
+    client = make_client(server)
+    with pytest.raises(requests.HTTPError):
+        client.get('/api/v3/klines', {'symbol': 'NOPE'})
+    assert client.retries == 0 and len(server.requests) == 1
+
+
+def test_weight_header_sync(server):
+    # 同一 IP 上的其他进程已经用掉 4000：以响应头为准，而不是本地累计的 2
+    server.responses = [(200, {'X-MBX-USED-WEIGHT-1M': '4000'}, [])]
+    client = make_client(server)
+    client.get('/api/v3/klines', weight=2)
+    assert client.used_weight == 4000
+
+    # 响应头比本地估算小时不回退（请求在途时本地已预占）
+    server.responses = [(200, {'X-MBX-USED-WEIGHT-1M': '10'}, [])]
+    client.get('/api/v3/klines', weight=2)
+    assert client.used_weight == 4002
+
+
+def test_acquire_throttles_near_limit(monkeypatch):
+    # 假时钟：sleep 只推进时间，不真正等待
+    clock = types.SimpleNamespace(now=60 * 1000 + 50.0, sleeps=[])
+    clock.time = lambda: clock.now
+
+    def sleep(seconds):
+        clock.sleeps.append(seconds)
+        clock.now += seconds
+
+    clock.sleep = sleep
+    monkeypatch.setattr(rest_client, 'time', clock)
+
+    client = RestClient('http://127.0.0.1:1', weight_limit=100, safety=0.8)
+    for _ in range(8):
+        client._acquire(10)
+    assert client.used_weight == 80 and clock.sleeps == []
+
+    # 第 9 次会超过 100 * 0.8：等到下一分钟（再加不超过 0.5s 的抖动），新的一分钟从 0 开始计数
+    client._acquire(10)
+    assert len(clock.sleeps) == 1
+    assert 10.0 <= clock.sleeps[0] <= 10.5
+    assert client.used_weight == 10
+    assert client.throttled == pytest.approx(clock.sleeps[0])
+
+    # 429 之后的封禁期内即使有额度也要等
+    client.banned_until = clock.now + 3.0
+    client._acquire(1)
+    assert clock.sleeps[-1] == pytest.approx(3.0)
+    assert client.used_weight == 11